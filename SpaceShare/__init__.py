@@ -1,3 +1,16 @@
 __version__ = "0.1.1"
 
-from SpaceShare.run import run_spaceshare
\ No newline at end of file
+# the pipeline functions are imported on first use, so that `import SpaceShare` and the command-line
+# interface start without loading pandas and scipy
+_LAZY_ATTRIBUTES = {"run_spaceshare": "SpaceShare.run", "run_batch": "SpaceShare.run"}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        import importlib
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
@@ -0,0 +1,322 @@
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+Response = namedtuple("Response", ["status", "body", "headers"])
+
+
+def urllib_downloader(url, headers):
+    """
+    Downloads a URL with urllib.
+
+    Args:
+        url (str): The URL to download.
+        headers (dict): Extra request headers, e.g. for conditional requests.
+
+    Returns:
+        Response: The status code, body and response headers. A 304 (not modified) reply is returned, not raised.
+
+    Raises:
+        urllib.error.URLError: If the download fails.
+    """
+    # imported here, they load the http and email modules which the command-line interface rarely needs
+    import urllib.error
+    import urllib.request
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request) as response:
+            return Response(response.status, response.read(), dict(response.headers))
+    except urllib.error.HTTPError as err:
+        if err.code == 304:
+            return Response(304, b"", dict(err.headers))
+        raise
+
+
+def _listdir(directory):
+    """
+    Lists a cache directory, which does not exist before the first entry is written.
+    """
+    return os.listdir(directory) if os.path.isdir(directory) else []
+
+
+class SheetCache():
+    """An on-disk cache of downloaded sheets, revalidated with ETag and Last-Modified conditional requests."""
+    def __init__(self, directory=".spaceshare_cache", ttl=3600, max_bytes=500*1024**2, offline=False,
+                 downloader=urllib_downloader):
+        """
+        Initializes the SheetCache class.
+
+        Args:
+            directory (str, optional): The directory holding the cached files. Defaults to '.spaceshare_cache'.
+            ttl (float, optional): The number of seconds for which a cached sheet is used without asking
+                the server whether it has changed. Defaults to 3600.
+            max_bytes (int, optional): The maximum total size of the cached frames. The least recently used
+                entries are removed when it is exceeded. Defaults to 500 MB.
+            offline (bool, optional): If True, cached sheets are always used and nothing is downloaded. Defaults to False.
+            downloader (callable, optional): Called as downloader(url, headers) and returns a `Response`.
+                Defaults to `urllib_downloader`.
+        """
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.downloader = downloader
+
+    def _paths(self, key):
+        name = hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, name + ".pkl"), os.path.join(self.directory, name + ".json")
+
+    def _read_meta(self, key):
+        data_path, meta_path = self._paths(key)
+        if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+            return None
+        with open(meta_path) as fp:
+            return json.load(fp)
+
+    def _write_meta(self, key, meta):
+        meta["last_used"] = time.time()
+        _, meta_path = self._paths(key)
+        with open(meta_path, "w") as fp:
+            json.dump(meta, fp)
+
+    def _load(self, key, meta):
+        # imported here, so that reading the config does not load pandas
+        import pandas as pd
+        data_path, _ = self._paths(key)
+        self._write_meta(key, meta)
+        return pd.read_pickle(data_path)
+
+    def get(self, key, url, parse):
+        """
+        Returns the frame for `key`, downloading `url` only if the cached copy is missing or out of date.
+
+        Args:
+            key (str): The cache key, e.g. the sheet ID.
+            url (str): The URL to download the sheet from.
+            parse (callable): Turns the downloaded bytes into a pandas.DataFrame.
+
+        Returns:
+            pandas.DataFrame: The parsed sheet.
+
+        Raises:
+            FileNotFoundError: If the cache is offline and has no entry for `key`.
+            urllib.error.URLError: If the download fails and there is no cached copy to fall back to.
+        """
+        meta = self._read_meta(key)
+        if meta is not None and (self.offline or time.time() - meta["fetched_at"] < self.ttl):
+            return self._load(key, meta)
+        if self.offline:
+            raise FileNotFoundError(f"No cached copy of '{key}' in {self.directory} and the cache is offline")
+
+        headers = {}
+        if meta is not None:
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+        try:
+            response = self.downloader(url, headers)
+        except OSError:  # including urllib.error.URLError
+            if meta is None:
+                raise
+            print(f"Warning: could not revalidate '{key}', using the cached copy from {time.ctime(meta['fetched_at'])}")
+            return self._load(key, meta)
+
+        if response.status == 304 and meta is not None:
+            meta["fetched_at"] = time.time()
+            return self._load(key, meta)
+
+        df = parse(response.body)
+        data_path, _ = self._paths(key)
+        # created on the first write, so that reading a config file does not touch the disk
+        os.makedirs(self.directory, exist_ok=True)
+        df.to_pickle(data_path)
+        response_headers = {name.lower(): value for name, value in response.headers.items()}
+        self._write_meta(key, {"key": key, "fetched_at": time.time(),
+                               "etag": response_headers.get("etag"),
+                               "last_modified": response_headers.get("last-modified")})
+        self.evict()
+        return df
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cached frames fit into `max_bytes`.
+        """
+        entries = []
+        for filename in _listdir(self.directory):
+            if not filename.endswith(".pkl"):
+                continue
+            data_path = os.path.join(self.directory, filename)
+            meta_path = data_path[:-len(".pkl")] + ".json"
+            try:
+                with open(meta_path) as fp:
+                    last_used = json.load(fp)["last_used"]
+            except (OSError, ValueError, KeyError):
+                last_used = 0
+            entries.append((last_used, os.path.getsize(data_path), data_path, meta_path))
+        total = sum(entry[1] for entry in entries)
+        for last_used, size, data_path, meta_path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            for path in (data_path, meta_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            total -= size
+
+    def clear(self):
+        """
+        Removes all cached entries.
+        """
+        for filename in _listdir(self.directory):
+            if filename.endswith(".pkl") or filename.endswith(".json"):
+                os.remove(os.path.join(self.directory, filename))
+
+
+def content_hash(*parts):
+    """
+    Hashes the content of DataFrames, Series, arrays and JSON-serializable parameters.
+
+    Frames are hashed by the pickled bytes of their columns, which is several times faster than
+    pandas.util.hash_pandas_object for string columns. Equal bytes imply equal content, so two equal
+    columns that are stored differently can only lead to a cache miss, never to a wrong result.
+
+    Args:
+        *parts: The objects to hash, in order.
+
+    Returns:
+        str: The hexadecimal SHA-256 digest.
+    """
+    # imported here, so that reading the config does not load pandas
+    import pickle
+    import numpy as np
+    import pandas as pd
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, pd.DataFrame):
+            # column by column, since the pickled frame depends on how its columns are laid out in memory
+            for column in part.columns:
+                digest.update(pickle.dumps(part[column], protocol=5))
+        elif isinstance(part, pd.Series):
+            digest.update(pickle.dumps(part, protocol=5))
+        elif isinstance(part, np.ndarray):
+            digest.update(f"{part.dtype}{part.shape}".encode("utf-8"))
+            digest.update(np.ascontiguousarray(part).tobytes())
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        # separates the parts, so that ("ab", "c") and ("a", "bc") differ
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class StageCache():
+    """An on-disk cache of the results of pipeline stages, keyed by a hash of their inputs and parameters."""
+    def __init__(self, directory=".spaceshare_cache/stages", max_bytes=500*1024**2):
+        """
+        Initializes the StageCache class.
+
+        Every result is stored as '{directory}/{stage}-{key}.pkl'. Since the keys are content hashes, changed
+        inputs or parameters simply lead to new entries, and the old ones are evicted when they are no longer used.
+
+        Args:
+            directory (str, optional): The directory holding the cached results. Defaults to '.spaceshare_cache/stages'.
+            max_bytes (int, optional): The maximum total size of the cached results. The least recently used
+                entries are removed when it is exceeded. Defaults to 500 MB.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def _path(self, stage, key):
+        return os.path.join(self.directory, f"{stage}-{key[:32]}.pkl")
+
+    def _touch(self, path):
+        # the modification time orders the entries for eviction, set explicitly since the file system clock is coarse
+        now = time.time_ns()
+        os.utime(path, ns=(now, now))
+
+    def get(self, stage, key, compute):
+        """
+        Returns the cached result of a stage, or computes and stores it. An entry that cannot be loaded
+        is removed and counts as a miss.
+
+        Args:
+            stage (str): The name of the stage, e.g. 'cluster'.
+            key (str): The hash of the inputs and parameters of the stage, see `content_hash`.
+            compute (callable): Called without arguments to compute the result if it is not cached.
+
+        Returns:
+            The result of the stage.
+        """
+        # imported here, they are only needed when a stage runs
+        import pickle
+        from . import metrics
+        path = self._path(stage, key)
+        try:
+            with open(path, "rb") as fp:
+                result = pickle.load(fp)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # a truncated entry, or one of a class that has changed since, can raise anything while unpickling
+            if os.path.exists(path):
+                os.remove(path)
+        else:
+            self._touch(path)
+            metrics.count(f"cache.{stage}.hits")
+            return result
+        metrics.count(f"cache.{stage}.misses")
+        result = compute()
+        # the workers of `run.run_batch` may write the same entry at the same time
+        temporary_path = f"{path}.{os.getpid()}.tmp"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(temporary_path, "wb") as fp:
+            pickle.dump(result, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temporary_path, path)
+        self._touch(path)
+        self.evict()
+        return result
+
+    def entries(self):
+        """
+        Lists the cached results.
+
+        Returns:
+            list of tuple: The stage, the size in bytes, the time of the last use and the path of every entry,
+                least recently used first.
+        """
+        entries = []
+        for filename in _listdir(self.directory):
+            if not filename.endswith(".pkl"):
+                continue
+            path = os.path.join(self.directory, filename)
+            try:
+                status = os.stat(path)
+            except OSError:  # removed by a concurrent run
+                continue
+            entries.append((filename.rsplit("-", 1)[0], status.st_size, status.st_mtime, path))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cached results fit into `max_bytes`.
+        """
+        entries = self.entries()
+        total = sum(entry[1] for entry in entries)
+        for stage, size, last_used, path in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.exists(path):
+                os.remove(path)
+            total -= size
+
+    def invalidate(self, stage=None):
+        """
+        Removes the cached results of one stage, or of all stages.
+
+        Args:
+            stage (str, optional): The name of the stage. If None, all entries are removed. Defaults to None.
+        """
+        for entry_stage, size, last_used, path in self.entries():
+            if stage is None or entry_stage == stage:
+                os.remove(path)
@@ -0,0 +1,253 @@
+"""
+Command-line interface of SpaceShare.
+
+Every subcommand imports the modules it needs when it runs, so that `spaceshare --help` and
+`spaceshare validate` start without loading pandas, scipy or the email modules.
+"""
+import argparse
+import os
+import sys
+
+from . import __version__
+
+DEFAULT_CONFIG = "default.cfg"
+DEFAULT_OUTPUT = "optimized_clustering.csv"
+
+
+def fetch(args):
+    """
+    Downloads and cleans the google sheet, and writes it to a CSV file.
+    """
+    from .config import read_config
+    from .reader import read_google_sheet
+    df = read_google_sheet(**read_config(args.config)["sheet"])
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df)} participants to {args.output}")
+    return 0
+
+
+def optimize(args):
+    """
+    Assigns the ride share groups and writes the CSV file for review and the hand-off file.
+    """
+    from .config import read_config
+    from .run import optimize_event, write_for_review
+    df, _ = optimize_event(read_config(args.config), args.previous)
+    handoff_file = write_for_review(df, args.output)
+    print(f"Wrote the groups to {args.output} for review and to {handoff_file}")
+    return 0
+
+
+def tune(args):
+    """
+    Compares the groups for a grid of maximum wait times and car sizes, see `optimize_rideshares.sweep_parameters`.
+    """
+    import pandas as pd
+    from .config import read_config
+    from .optimize_rideshares import sweep_parameters
+    from .pipeline import Pipeline
+    settings = read_config(args.config)
+    optimization = settings["optimization"]
+    pipeline = Pipeline(settings)
+    df, _ = pipeline.clean(*pipeline.fetch())
+    tables = []
+    for kind in ["arrival", "departure"]:
+        table = sweep_parameters(df, kind, args.max_wait_times, args.max_people_per_car, method=optimization["method"],
+                                 location_columns=optimization["location_columns"])
+        table.insert(0, "kind", kind)
+        tables.append(table)
+    table = pd.concat(tables, ignore_index=True)
+    print(table.to_string(index=False, float_format="%.2f"))
+    if args.output is not None:
+        table.to_csv(args.output, index=False)
+    return 0
+
+
+def review(args):
+    """
+    Applies the edited CSV file to the hand-off file and checks the result.
+    """
+    from .run import handoff_path, read_reviewed
+    handoff_file = handoff_path(args.output)
+    try:
+        df = read_reviewed(handoff_file, args.output)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        return 1
+    print(f"{len(df)} participants in {df['arrival_group'].nunique()} arrival and "
+          +f"{df['departure_group'].nunique()} departure groups, saved to {handoff_file}")
+    return 0
+
+
+def send(args):
+    """
+    Sends the emails for the reviewed groups.
+    """
+    from .config import read_config
+    from .pipeline import Pipeline
+    from .run import check_groups, handoff_path, read_reviewed
+    settings = read_config(args.config)
+    if args.from_outbox:
+        from .write_email import drain_outbox
+        email = dict(settings["email"])
+        outbox = email.pop("outbox")
+        if outbox is None:
+            print(f"{args.config} has no outbox in the [EMAIL] section", file=sys.stderr)
+            return 1
+        report = drain_outbox(outbox, dry_run=args.dry_run, **email)
+        print(f"{len(report)} emails were not delivered yet")
+        print(report["status"].value_counts().to_string())
+        return int((report["status"] == "failed").any())
+    df = read_reviewed(handoff_path(args.output), args.output)
+    check_groups(df, settings["optimization"])
+    pipeline = Pipeline(settings)
+    report = pipeline.send(pipeline.render(df), dry_run=args.dry_run)
+    print(report["status"].value_counts().to_string())
+    return int((report["status"] == "failed").any())
+
+
+def serve(args):
+    """
+    Runs the matching service, see `service.handle_request` for the endpoints.
+    """
+    from .config import read_config
+    from .service import MatchingService, is_loopback, serve as serve_forever
+    token = os.environ.get("SPACESHARE_TOKEN") or None
+    if token is None and not is_loopback(args.host):
+        print(f"Listening on {args.host} makes the participants reachable from other machines, "
+              +"set SPACESHARE_TOKEN to a shared token that requests have to send")
+        return 1
+    settings = read_config(args.config)
+    optimization, sheet = settings["optimization"], settings["sheet"]
+    service = MatchingService(max_time_difference=optimization["max_time_difference"],
+                              max_people_per_car=optimization["max_people_per_car"],
+                              location_columns=optimization["location_columns"],
+                              time_format=sheet["time_format"], tz=sheet["tz"])
+    if args.previous is not None:
+        from .handoff import read_handoff
+        service.add_dataframe(read_handoff(args.previous, memory_map=False))
+    elif not args.empty:
+        from .reader import read_google_sheet
+        service.add_dataframe(read_google_sheet(**sheet))
+    serve_forever(service, args.host, args.port, output_file=args.output, token=token)
+    return 0
+
+
+def cache(args):
+    """
+    Lists or removes the cached results of the pipeline stages, see `pipeline.Pipeline`.
+    """
+    from .config import read_config
+    stages = read_config(args.config)["stages"]
+    if stages is None:
+        print(f"{args.config} does not cache the pipeline stages")
+        return 1
+    if args.clear is not None:
+        for stage in args.clear or [None]:
+            stages.invalidate(stage)
+    sizes = {}
+    for stage, size, last_used, path in stages.entries():
+        count, total = sizes.get(stage, (0, 0))
+        sizes[stage] = (count + 1, total + size)
+    for stage, (count, total) in sorted(sizes.items()):
+        print(f"{stage}: {count} entries, {total / 1024**2:.1f} MB")
+    print(f"{sum(total for count, total in sizes.values()) / 1024**2:.1f} of {stages.max_bytes / 1024**2:.0f} MB "
+          +f"used in {stages.directory}")
+    return 0
+
+
+def validate(args):
+    """
+    Checks the configuration files without reading the google sheets or connecting to the email server.
+    """
+    from .config import validate_config
+    invalid = 0
+    for config_file in args.config:
+        problems = validate_config(config_file)
+        if problems:
+            invalid += 1
+            print(f"{config_file}:\n\t" + "\n\t".join(problems))
+        else:
+            print(f"{config_file}: OK")
+    return int(invalid > 0)
+
+
+def run(args):
+    """
+    Runs the whole pipeline, see `run.run_spaceshare`.
+    """
+    from .run import run_spaceshare
+    report = run_spaceshare(args.config, dry_run=args.dry_run, previous_file=args.previous,
+                            output_file=args.output, confirm=not args.yes)
+    return int((report["status"] == "failed").any())
+
+
+def build_parser():
+    """
+    Builds the argument parser of the `spaceshare` command.
+
+    Returns:
+        argparse.ArgumentParser: The parser, every subcommand sets its function as `func`.
+    """
+    parser = argparse.ArgumentParser(prog="spaceshare", description="Schedule ride shares for the participants of an event.")
+    parser.add_argument("--version", action="version", version=f"%(prog)s {__version__}")
+    subparsers = parser.add_subparsers(title="commands", dest="command", required=True)
+
+    def add_command(name, func, help, config=True, output=True):
+        command = subparsers.add_parser(name, help=help, description=help)
+        if config:
+            command.add_argument("-c", "--config", default=DEFAULT_CONFIG,
+                                 help=f"the configuration file (default: {DEFAULT_CONFIG})")
+        if output:
+            command.add_argument("-o", "--output", default=DEFAULT_OUTPUT,
+                                 help=f"the CSV file with the groups for review, the hand-off file is stored next to it "
+                                      +f"with the extension .feather (default: {DEFAULT_OUTPUT})")
+        command.set_defaults(func=func)
+        return command
+
+    command = add_command("fetch", fetch, "download and clean the google sheet", output=False)
+    command.add_argument("-o", "--output", default="participants.csv", help="the CSV file (default: participants.csv)")
+    command = add_command("optimize", optimize, "assign the ride share groups and write them for review")
+    command.add_argument("--previous", help="the hand-off file of an earlier run, only new participants are added")
+    command = add_command("tune", tune, "compare the groups for several maximum wait times and car sizes", output=False)
+    command.add_argument("--max-wait-times", nargs="+", type=float, default=[0.25, 0.5, 0.75, 1.0, 1.5, 2.0],
+                         help="in hours (default: 0.25 0.5 0.75 1 1.5 2)")
+    command.add_argument("--max-people-per-car", nargs="+", type=int, default=[2, 3, 4, 5, 6],
+                         help="(default: 2 3 4 5 6)")
+    command.add_argument("-o", "--output", help="a CSV file for the table")
+    add_command("review", review, "apply the edited CSV file to the hand-off file and check it", config=False)
+    command = add_command("send", send, "send the emails for the reviewed groups")
+    command.add_argument("--dry-run", action="store_true", help="print the emails instead of sending them")
+    command.add_argument("--from-outbox", action="store_true",
+                         help="send the emails of the outbox that were not delivered yet, without rendering them again")
+    command = add_command("serve", serve, "answer who can share a ride with whom over HTTP while people register")
+    command.add_argument("--host", default="127.0.0.1",
+                         help="the address to listen on, other than the loopback address needs SPACESHARE_TOKEN "
+                              +"(default: 127.0.0.1)")
+    command.add_argument("--port", type=int, default=8080, help="the port to listen on (default: 8080)")
+    command.add_argument("--previous", help="start from the participants in this hand-off file instead of the google sheet")
+    command.add_argument("--empty", action="store_true", help="start without any participants")
+    command = add_command("cache", cache, "list or remove the cached results of the pipeline stages", output=False)
+    command.add_argument("--clear", nargs="*", choices=["clean", "times", "cluster", "render"], metavar="STAGE",
+                         help="remove the results of the given stages, or of all stages if none are given")
+    command = add_command("validate", validate, "check configuration files", config=False, output=False)
+    command.add_argument("config", nargs="*", default=[DEFAULT_CONFIG], help=f"(default: {DEFAULT_CONFIG})")
+    command = add_command("run", run, "fetch, optimize, review and send in one go")
+    command.add_argument("--previous", help="the hand-off file of an earlier run, only new participants are added")
+    command.add_argument("--dry-run", action="store_true", help="print the emails instead of sending them")
+    command.add_argument("-y", "--yes", action="store_true", help="send without waiting for approval")
+    return parser
+
+
+def main(argv=None):
+    """
+    Entry point of the `spaceshare` command.
+
+    Args:
+        argv (list of str, optional): The arguments, sys.argv[1:] if None. Defaults to None.
+
+    Returns:
+        int: The exit status.
+    """
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -0,0 +1,155 @@
+import configparser
+import os
+from .cache import SheetCache, StageCache
+
+METHODS = ["ward", "sweep"]
+OBJECTIVES = ["min_cars", "min_wait"]
+
+
+def read_config(config_file):
+    """
+    Reads a configuration file into the keyword arguments of the pipeline functions.
+
+    Parameters
+    ----------
+    config_file : str
+        The path to the configuration file.
+
+    Returns
+    -------
+    dict
+        With the keys "email" (keyword arguments of `write_email.send_messages`), "template_dir", "consolidate"
+        (whether `render.render_messages` renders one email per participant about both rides),
+        "sheet" (keyword arguments of `reader.read_google_sheet`) and "optimization" (keyword
+        arguments of `optimize_rideshares.optimize`) and "metrics" (keyword arguments of `metrics.Metrics`
+        and the "report" path if the [METRICS] section is present and enabled, otherwise None), "rooms" (keyword
+        arguments of `optimize_rooms.optimize_rooms` if the [ROOMS] section is present and enabled, otherwise None)
+        and "stages"
+        (the `cache.StageCache` of `pipeline.Pipeline` if the [CACHE] section is present and stages are
+        cached, otherwise None).
+
+    Raises
+    ------
+    FileNotFoundError
+        If the configuration file does not exist.
+    KeyError
+        If a required section or option is missing.
+    """
+    config = configparser.ConfigParser()
+    if not config.read(config_file):
+        raise FileNotFoundError(f"Config file {config_file} not found")
+
+    email_password = config.get("EMAIL","password",fallback=None)
+    if email_password is not None:
+        email_password = email_password.replace(" ","")
+    email = {"email_username": config["EMAIL"]["username"].replace(" ",""),
+             "email_smtp_domain": config["EMAIL"]["smtp_domain"].replace(" ",""),
+             "email_password": email_password,
+             "email_smtp_port": int(config["EMAIL"]["smtp_port"]),
+             "max_messages_per_session": config.getint("EMAIL","max_messages_per_session",fallback=100),
+             "workers": config.getint("EMAIL","workers",fallback=1),
+             "max_per_second": config.getfloat("EMAIL","max_per_second",fallback=None),
+             "max_per_minute": config.getfloat("EMAIL","max_per_minute",fallback=None),
+             "max_retries": config.getint("EMAIL","max_retries",fallback=3),
+             "outbox": config.get("EMAIL","outbox",fallback="").strip() or None}
+
+    cache = None
+    stages = None
+    if config.has_section("CACHE"):
+        cache_dir = config.get("CACHE","directory",fallback=".spaceshare_cache")
+        max_bytes = int(config.getfloat("CACHE","max_size_mb",fallback=500)*1024**2)
+        cache = SheetCache(directory=cache_dir,
+                           ttl=config.getfloat("CACHE","ttl",fallback=0),
+                           max_bytes=max_bytes,
+                           offline=config.getboolean("CACHE","offline",fallback=False))
+        if config.getboolean("CACHE","stages",fallback=True):
+            stages = StageCache(directory=os.path.join(cache_dir, "stages"), max_bytes=max_bytes)
+    sheet = {"sheet_id": config["GOOGLE.SHEET"]["sheet_id"].replace(" ",""),
+             "time_format": config.get("GOOGLE.SHEET","time_format",raw=True,fallback=None),
+             "tz": config.get("GOOGLE.SHEET","timezone",fallback=None),
+             "cache": cache}
+
+    vehicle_capacities = config.get("OPTIMIZATION","vehicle_capacities",fallback=None)
+    if vehicle_capacities is not None:
+        vehicle_capacities = [int(capacity) for capacity in vehicle_capacities.split(",")]
+    location_columns = config.get("OPTIMIZATION","location_columns",fallback=None)
+    if location_columns is not None:
+        location_columns = [column.strip() for column in location_columns.split(",") if column.strip()]
+    optimization = {"max_time_difference": float(config["OPTIMIZATION"]["max_wait_time"]),
+                    "max_people_per_car": int(config["OPTIMIZATION"]["max_people_per_car"]),
+                    "method": config.get("OPTIMIZATION","method",fallback="ward").replace(" ",""),
+                    "objective": config.get("OPTIMIZATION","objective",fallback=None),
+                    "vehicle_capacities": vehicle_capacities,
+                    "location_columns": location_columns}
+
+    metrics_settings = None
+    if config.has_section("METRICS") and config.getboolean("METRICS","enabled",fallback=True):
+        metrics_settings = {"report": config.get("METRICS","report",fallback="spaceshare_metrics.json"),
+                             "profile_dir": config.get("METRICS","profile_dir",fallback=None),
+                             "trace_memory": config.getboolean("METRICS","trace_memory",fallback=False),
+                             "verbose": config.getboolean("METRICS","verbose",fallback=False)}
+
+    rooms = None
+    if config.has_section("ROOMS") and config.getboolean("ROOMS","enabled",fallback=True):
+        room_locations = config.get("ROOMS","location_columns",fallback=None)
+        if room_locations is not None:
+            room_locations = [column.strip() for column in room_locations.split(",") if column.strip()]
+        rooms = {"max_time_difference": config.getfloat("ROOMS","max_wait_time",fallback=24),
+                 "max_people_per_room": config.getint("ROOMS","max_people_per_room",fallback=2),
+                 "location_columns": room_locations}
+
+    return {"email": email, "template_dir": config.get("EMAIL","template_dir",fallback=None),
+            "consolidate": config.getboolean("EMAIL","consolidate",fallback=False),
+            "sheet": sheet, "optimization": optimization, "metrics": metrics_settings, "rooms": rooms,
+            "stages": stages}
+
+
+def validate_config(config_file):
+    """
+    Checks a configuration file without reading the google sheet or connecting to the email server.
+
+    Parameters
+    ----------
+    config_file : str
+        The path to the configuration file.
+
+    Returns
+    -------
+    list of str
+        The problems found, empty if the configuration file is valid.
+    """
+    try:
+        settings = read_config(config_file)
+    except FileNotFoundError as err:
+        return [str(err)]
+    except KeyError as err:
+        return [f"missing section or option {err}"]
+    except ValueError as err:
+        return [f"invalid value: {err}"]
+
+    problems = []
+    optimization = settings["optimization"]
+    if optimization["max_time_difference"] <= 0:
+        problems.append("[OPTIMIZATION] max_wait_time must be positive")
+    if optimization["max_people_per_car"] < 1:
+        problems.append("[OPTIMIZATION] max_people_per_car must be at least 1")
+    if optimization["method"] not in METHODS:
+        problems.append(f"[OPTIMIZATION] method must be one of {METHODS}, not '{optimization['method']}'")
+    if optimization["objective"] is not None and optimization["objective"] not in OBJECTIVES:
+        problems.append(f"[OPTIMIZATION] objective must be one of {OBJECTIVES}, not '{optimization['objective']}'")
+    if optimization["vehicle_capacities"] is not None and min(optimization["vehicle_capacities"]) < 1:
+        problems.append("[OPTIMIZATION] vehicle_capacities must be positive")
+    rooms = settings["rooms"]
+    if rooms is not None and rooms["max_time_difference"] < 0:
+        problems.append("[ROOMS] max_wait_time must not be negative")
+    if rooms is not None and rooms["max_people_per_room"] < 1:
+        problems.append("[ROOMS] max_people_per_room must be at least 1")
+    email = settings["email"]
+    if email["workers"] < 1:
+        problems.append("[EMAIL] workers must be at least 1")
+    for option in ["max_per_second", "max_per_minute"]:
+        if email[option] is not None and email[option] <= 0:
+            problems.append(f"[EMAIL] {option} must be positive")
+    if settings["template_dir"] is not None and not os.path.isdir(settings["template_dir"]):
+        problems.append(f"[EMAIL] template_dir {settings['template_dir']} is not a directory")
+    return problems
@@ -0,0 +1,151 @@
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict
+
+
+class TokenBucket():
+    """A thread-safe token bucket that allows `rate` acquisitions per `period` seconds on average."""
+    def __init__(self, rate, period=1.0, clock=time.monotonic, sleep=time.sleep):
+        """
+        Initializes the TokenBucket class with a full bucket.
+
+        Args:
+            rate (float): The number of tokens added per period, which is also the bucket capacity.
+            period (float, optional): The length of the period in seconds. Defaults to 1.
+            clock (callable, optional): Returns the current time in seconds. Defaults to time.monotonic.
+            sleep (callable, optional): Sleeps for the given number of seconds. Defaults to time.sleep.
+
+        Raises:
+            AssertionError: If rate or period are not positive.
+        """
+        assert rate > 0 and period > 0, "rate and period must be positive"
+        self.capacity = float(rate)
+        self.fill_rate = rate / period
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.fill_rate)
+        self._last = now
+
+    def acquire(self):
+        """
+        Takes one token from the bucket, blocking until it is available.
+
+        The token is reserved immediately, so concurrent callers queue up in order instead of
+        competing for the next refill.
+        """
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+            wait = -self._tokens / self.fill_rate
+        if wait > 0:
+            self.sleep(wait)
+
+
+class RateLimiter():
+    """Combines a messages/second and a messages/minute token bucket."""
+    def __init__(self, per_second=None, per_minute=None):
+        """
+        Initializes the RateLimiter class.
+
+        Args:
+            per_second (float, optional): The maximum number of messages per second. None means no limit. Defaults to None.
+            per_minute (float, optional): The maximum number of messages per minute. None means no limit. Defaults to None.
+        """
+        self.buckets = []
+        if per_second:
+            self.buckets.append(TokenBucket(per_second, 1.0))
+        if per_minute:
+            self.buckets.append(TokenBucket(per_minute, 60.0))
+
+    def acquire(self):
+        """
+        Blocks until a message may be sent under all configured limits.
+        """
+        for bucket in self.buckets:
+            bucket.acquire()
+
+
+def is_transient(error):
+    """
+    Decides whether an SMTP error is worth retrying.
+
+    Args:
+        error (Exception): The exception raised while sending.
+
+    Returns:
+        bool: True for dropped connections and 4xx (temporary failure) replies.
+    """
+    if isinstance(error, (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return False
+
+
+def dispatch_emails(messages, handler_factory, workers=1, rate_limiter=None, max_retries=3,
+                    backoff=1.0, max_backoff=60.0, on_sent=None):
+    """
+    Sends messages concurrently through a pool of worker threads, each of which holds its own
+    EmailHandler session.
+
+    Args:
+        messages (list of render.Message): The messages to send.
+        handler_factory (callable): Creates a new connected EmailHandler, called once per worker thread.
+        workers (int, optional): The number of worker threads. Defaults to 1.
+        rate_limiter (RateLimiter, optional): Shared limiter that every send attempt has to pass.
+            Defaults to None, meaning no limit.
+        max_retries (int, optional): The number of retries after a transient SMTP error. Defaults to 3.
+        backoff (float, optional): The delay before the first retry in seconds, doubled on every
+            further retry. Defaults to 1.
+        max_backoff (float, optional): The maximum delay between retries in seconds. Defaults to 60.
+        on_sent (callable, optional): Called with every message right after the server accepted it,
+            from the worker thread that sent it. Defaults to None.
+
+    Returns:
+        list of dict: One entry per message, in input order, with the message fields except the
+            content and the keys "status" ("sent" or "failed"), "attempts" and "error".
+    """
+    local = threading.local()
+    handlers = []
+    handlers_lock = threading.Lock()
+
+    def get_handler():
+        if not hasattr(local, "handler"):
+            local.handler = handler_factory()
+            with handlers_lock:
+                handlers.append(local.handler)
+        return local.handler
+
+    def send(message):
+        result = {key: value for key, value in asdict(message).items() if key != "content"}
+        for attempt in range(max_retries + 1):
+            if rate_limiter is not None:
+                rate_limiter.acquire()
+            try:
+                get_handler().write_email(message.recipients, subject=message.subject,
+                                          content=message.content)
+            except Exception as err:
+                if attempt < max_retries and is_transient(err):
+                    time.sleep(min(max_backoff, backoff * 2**attempt))
+                    continue
+                result.update(status="failed", attempts=attempt + 1, error=repr(err))
+                return result
+            if on_sent is not None:
+                on_sent(message)
+            result.update(status="sent", attempts=attempt + 1, error=None)
+            return result
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            return list(pool.map(send, messages))
+    finally:
+        for handler in handlers:
+            handler.close()
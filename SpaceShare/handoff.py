@@ -0,0 +1,164 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow.feather as feather
+from .reader import TIME_COLUMNS, LOCATION_COLUMNS, parse_times
+
+# dtypes of the optimized DataFrame that is handed from the optimization to the email step
+SCHEMA = {
+    "Name": "category",
+    "Email": "category",
+    "Gender": "category",
+    "Gender_to_share_room_with": "category",
+    "Phone_number": "string",
+    "Airport": "category",
+    "Hotel": "category",
+    "date_time_of_airport_arrival": "datetime64[ns]",
+    "date_time_of_hotel_departure": "datetime64[ns]",
+    "arrival_group": "int64",
+    "departure_group": "int64",
+    "room_group": "int64",
+}
+REQUIRED_COLUMNS = ["Name", "Email", "arrival_group", "departure_group"] + list(TIME_COLUMNS.values())
+# columns of the review CSV that are copied back into the hand-off file
+EDITABLE_COLUMNS = (["Name", "Email", "arrival_group", "departure_group", "room_group"] + list(TIME_COLUMNS.values())
+                    + LOCATION_COLUMNS)
+ROW_COLUMN = "row"
+
+
+def local_times(df):
+    """
+    Drops the timezone of timezone-aware time columns, keeping the local wall time like the hand-off file.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame, e.g. from `reader.clean_dataframe`.
+
+    Returns:
+        pandas.DataFrame: A copy of df with timezone-naive time columns.
+    """
+    df = df.copy()
+    for column in TIME_COLUMNS.values():
+        if column in df.columns and isinstance(df[column].dtype, pd.DatetimeTZDtype):
+            df[column] = df[column].dt.tz_localize(None)
+    return df
+
+
+def validate_schema(df):
+    """
+    Checks that a DataFrame has the required columns and that they can be converted to the types in SCHEMA.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame to check.
+
+    Returns:
+        pandas.DataFrame: A copy of df with the columns in SCHEMA converted to their types.
+
+    Raises:
+        ValueError: Listing every missing column and every column that cannot be converted.
+    """
+    problems = [f"missing column '{column}'" for column in REQUIRED_COLUMNS if column not in df.columns]
+    df = df.copy()
+    for column, dtype in SCHEMA.items():
+        if column not in df.columns:
+            continue
+        try:
+            if column in TIME_COLUMNS.values():
+                times = df[column] if pd.api.types.is_datetime64_any_dtype(df[column]) else parse_times(df[column])
+                if times.dt.tz is not None:
+                    # keep the local wall time, which the review file and the emails show
+                    times = times.dt.tz_localize(None)
+                df[column] = times.astype(dtype)
+            elif dtype == "int64":
+                values = pd.to_numeric(df[column])
+                if values.isna().any() or (values % 1 != 0).any():
+                    raise ValueError("empty or non-integer entries")
+                df[column] = values.astype(dtype)
+            else:
+                df[column] = df[column].astype(dtype)
+        except (ValueError, TypeError) as err:
+            problems.append(f"column '{column}' is not of type {dtype}: {err}")
+    if problems:
+        raise ValueError("The optimized groups do not match the expected schema:\n\t" + "\n\t".join(problems))
+    return df
+
+
+def write_handoff(df, path):
+    """
+    Writes the optimized DataFrame to an uncompressed Feather file with categorical name, email and gender columns.
+
+    Args:
+        df (pandas.DataFrame): The optimized DataFrame.
+        path (str): The path of the Feather file, replaced atomically if it exists.
+
+    Raises:
+        ValueError: If df does not match the schema, see `validate_schema`.
+    """
+    df = validate_schema(df).reset_index(drop=True)
+    path = os.fspath(path)
+    # uncompressed, so that the file can be memory-mapped without copying
+    feather.write_feather(df, path + ".tmp", compression="uncompressed")
+    # replace instead of overwriting, a memory-mapped earlier version stays valid
+    os.replace(path + ".tmp", path)
+
+
+def read_handoff(path, memory_map=True):
+    """
+    Reads a Feather file written by `write_handoff`, keeping all dtypes.
+
+    Args:
+        path (str): The path of the Feather file.
+        memory_map (bool, optional): If True, the file is memory-mapped instead of read into memory. Defaults to True.
+
+    Returns:
+        pandas.DataFrame: The optimized DataFrame.
+    """
+    return feather.read_table(path, memory_map=memory_map).to_pandas()
+
+
+def export_review_csv(df, path):
+    """
+    Writes the columns of the optimized DataFrame that organizers may edit to a CSV file for review.
+
+    The first column holds the row number in the hand-off file, which `apply_review_csv` uses to match
+    the edited rows. Rows may be edited or deleted, but not added.
+
+    Args:
+        df (pandas.DataFrame): The optimized DataFrame, as written by `write_handoff`.
+        path (str): The path of the CSV file.
+    """
+    columns = [column for column in EDITABLE_COLUMNS if column in df.columns]
+    review = df[columns].reset_index(drop=True)
+    review.index.name = ROW_COLUMN
+    review.sort_values(by=["arrival_group", "departure_group"]).to_csv(path, date_format="%Y-%m-%d %H:%M:%S")
+
+
+def apply_review_csv(df, path):
+    """
+    Copies the reviewed CSV file back into the optimized DataFrame and validates the result.
+
+    Args:
+        df (pandas.DataFrame): The optimized DataFrame, as read by `read_handoff`.
+        path (str): The path of the CSV file written by `export_review_csv`.
+
+    Returns:
+        pandas.DataFrame: The rows of df that are still in the CSV file, with the edited columns replaced.
+
+    Raises:
+        ValueError: If the CSV file contains unknown or duplicate rows, or the result does not match the schema.
+    """
+    review = pd.read_csv(path)
+    if ROW_COLUMN not in review.columns:
+        raise ValueError(f"The column '{ROW_COLUMN}' is missing from {path}")
+    rows = pd.to_numeric(review[ROW_COLUMN], errors="coerce")
+    unknown = review[~rows.isin(np.arange(len(df)))]
+    if len(unknown) > 0 or rows.duplicated().any():
+        raise ValueError(f"{path} contains rows that are not in the optimized groups or appear twice, "
+                         +"rows can only be edited or deleted:\n" + unknown.to_string())
+    rows = rows.to_numpy(dtype=int)
+
+    result = df.iloc[rows].reset_index(drop=True)
+    for column in EDITABLE_COLUMNS:
+        if column in review.columns:
+            result[column] = review[column].to_numpy()
+    return validate_schema(result)
@@ -0,0 +1,185 @@
+import contextlib
+import cProfile
+import csv
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# the collectors that are currently recording, the innermost one last
+_active = []
+
+
+def stage(name):
+    """
+    Times a pipeline stage with the active `Metrics` collector, or does nothing if none is active.
+
+    Args:
+        name (str): The name of the stage, e.g. 'optimize.arrival.linkage'.
+
+    Returns:
+        A context manager.
+    """
+    if not _active:
+        return contextlib.nullcontext()
+    return _active[-1].stage(name)
+
+
+def count(name, value=1):
+    """
+    Adds to a counter of the active `Metrics` collector, or does nothing if none is active.
+
+    Args:
+        name (str): The name of the counter, e.g. 'messages.sent'.
+        value (int, optional): The amount to add. Defaults to 1.
+    """
+    if _active:
+        _active[-1].count(name, value)
+
+
+def print_hook(event, name, value):
+    """
+    A hook that prints every finished stage and every counter update.
+    """
+    if event == "stage":
+        print(f"[metrics] {name}: {value['seconds']:.3f} s")
+    else:
+        print(f"[metrics] {name} += {value}")
+
+
+def _max_rss_mb():
+    if resource is None:
+        return None
+    # kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Metrics():
+    """Collects stage timings, counters and peak memory of a pipeline run."""
+    def __init__(self, hooks=(), profile_dir=None, trace_memory=False):
+        """
+        Initializes the Metrics class. Use it as a context manager to make it the active collector
+        for the module-level `stage` and `count` functions.
+
+        Args:
+            hooks (sequence of callable, optional): Called as hook(event, name, value) with event 'stage'
+                and the stage record as value after every stage, and with event 'count' and the increment
+                after every counter update. Defaults to ().
+            profile_dir (str, optional): If given, every outermost stage is run under cProfile and the statistics are
+                dumped to '{profile_dir}/{stage}.prof'. Defaults to None.
+            trace_memory (bool, optional): If True, the peak Python memory of every outermost stage is measured with
+                tracemalloc, which slows the run down. Otherwise only the peak resident memory of the
+                process is recorded. Defaults to False.
+        """
+        self.hooks = list(hooks)
+        self.profile_dir = profile_dir
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.counters = {}
+        self._lock = threading.Lock()
+        self._depth = 0
+
+    def __enter__(self):
+        _active.append(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active.remove(self)
+
+    def add_hook(self, hook):
+        """
+        Adds a hook, see `__init__`.
+        """
+        self.hooks.append(hook)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """
+        Context manager that records the duration and memory of a stage.
+
+        Args:
+            name (str): The name of the stage.
+        """
+        # nested stages are timed, but only the outermost one is profiled and traced
+        outermost = self._depth == 0
+        self._depth += 1
+        profiler = None
+        if self.profile_dir is not None and outermost:
+            profiler = cProfile.Profile()
+        started_tracing = False
+        if self.trace_memory and outermost:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if profiler is not None:
+                profiler.disable()
+            record = {"stage": name, "seconds": time.perf_counter() - start,
+                      "peak_traced_mb": None, "max_rss_mb": _max_rss_mb()}
+            if self.trace_memory and outermost:
+                record["peak_traced_mb"] = tracemalloc.get_traced_memory()[1] / 1024**2
+                if started_tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                os.makedirs(self.profile_dir, exist_ok=True)
+                profiler.dump_stats(os.path.join(self.profile_dir, f"{name}.prof"))
+            with self._lock:
+                self.stages.append(record)
+            for hook in self.hooks:
+                hook("stage", name, record)
+
+    def count(self, name, value=1):
+        """
+        Adds to a counter. Safe to call from several threads.
+
+        Args:
+            name (str): The name of the counter.
+            value (int, optional): The amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        for hook in self.hooks:
+            hook("count", name, value)
+
+    def report(self):
+        """
+        Returns all recorded stages and counters.
+
+        Returns:
+            dict: With the keys 'stages' (list of dict) and 'counters' (dict).
+        """
+        return {"stages": list(self.stages), "counters": dict(self.counters)}
+
+    def write_report(self, path):
+        """
+        Writes the report to a JSON file, or to a CSV file with one row per stage and counter if
+        the path ends with '.csv'.
+
+        Args:
+            path (str): The path of the report.
+        """
+        if os.fspath(path).endswith(".csv"):
+            with open(path, "w", newline="") as fp:
+                writer = csv.writer(fp)
+                writer.writerow(["type", "name", "value", "peak_traced_mb", "max_rss_mb"])
+                for record in self.stages:
+                    writer.writerow(["stage", record["stage"], record["seconds"],
+                                     record["peak_traced_mb"], record["max_rss_mb"]])
+                for name, value in self.counters.items():
+                    writer.writerow(["counter", name, value, None, None])
+        else:
+            with open(path, "w") as fp:
+                json.dump(self.report(), fp, indent=2)
@@ -0,0 +1,270 @@
+import bisect
+import collections
+import math
+
+import numpy as np
+import pandas as pd
+from .reader import TIME_COLUMNS, to_epoch_hours
+from .optimize_rideshares import location_codes, _location_rows
+from . import metrics
+
+# columns with the gender of a participant and the gender of the people they want to share a room with
+GENDER_COLUMN = "Gender"
+PREFERENCE_COLUMN = "Gender_to_share_room_with"
+# answers to the preference question that accept anybody of the same gender, compared in lower case
+NO_PREFERENCE = ["", "no preference", "none", "any", "anyone", "doesn't matter", "does not matter", "don't care"]
+# only people at the same hotel share a room
+ROOM_LOCATION_COLUMNS = ["Hotel"]
+
+
+def compatibility_classes(df, gender_column = GENDER_COLUMN, preference_column = PREFERENCE_COLUMN):
+    """
+    Numbers the compatibility classes of the participants, such that two people may share a room if their classes
+    are partners, see the returned `partners`.
+
+    The class of a participant is the pair of their gender and the gender they want to share a room with, where
+    no preference counts as their own gender. Entries are compared ignoring case and surrounding whitespace.
+    A class of the same two genders, e.g. women who want to share with women, is its own partner. A class of two
+    different genders, e.g. women who want to share with men, is the partner of the reverse class.
+    Participants without a gender have no class.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame with the participants.
+        gender_column (str, optional): The column with the gender. Defaults to 'Gender'.
+        preference_column (str, optional): The column with the gender to share a room with.
+            Defaults to 'Gender_to_share_room_with'.
+
+    Returns:
+        tuple: The class of every row as a numpy.ndarray of integers starting at 0, with -1 for rows without
+            a class, and a numpy.ndarray with the partner class of every class.
+
+    Raises:
+        AssertionError: If a column is not found in the DataFrame.
+    """
+    for column in [gender_column, preference_column]:
+        if column not in df.columns:
+            raise AssertionError(f"Error: {column} column not found in dataframe!")
+
+    def normalize(values):
+        # sheets repeat the same few answers, so only the distinct entries are normalized
+        codes, uniques = pd.factorize(values)
+        normalized = pd.Series(uniques, dtype="string").str.strip().str.casefold()
+        return pd.Series(normalized.to_numpy()[codes], dtype="string").where(codes >= 0, pd.NA)
+
+    genders = normalize(df[gender_column]).replace(NO_PREFERENCE, pd.NA)
+    preferences = normalize(df[preference_column])
+    preferences = preferences.where(~preferences.fillna("").isin(NO_PREFERENCE), genders)
+
+    pairs = (genders + "|" + preferences).where(genders.notna())
+    codes, classes = pd.factorize(pairs, sort=True)
+    reverse = {pair: i for i, pair in enumerate(classes)}
+    partners = np.array([reverse.get("|".join(pair.split("|")[::-1]), -1) for pair in classes], dtype=int)
+    return codes, partners
+
+
+def sweep_rooms(check_in, check_out, sides = None, max_time_difference = 24, max_people_per_room = 2):
+    """
+    Groups stays into rooms by sorting them once by check-in and check-out and sweeping through them in order.
+
+    Every person joins the open room with the closest earliest check-out whose first guest checked in at most
+    `max_time_difference` hours before them, if the check-out times of the room stay within `max_time_difference`
+    hours of each other and their stay overlaps with the stays of everybody in the room. Otherwise they open a
+    room of their own. Rooms that are full, or whose first guest checked in too long ago, are closed.
+
+    The open rooms of every side are kept sorted by their earliest check-out, so a person only looks at the
+    rooms whose check-out fits theirs, found by binary search, instead of at every open room. This takes
+    O(n log n) time, also if one side is much larger than the other or nobody fits together.
+
+    Args:
+        check_in (array-like): The check-in times in hours.
+        check_out (array-like): The check-out times in hours.
+        sides (array-like, optional): For two classes that may only share with each other, the side of every
+            person. A room then holds one person of each side. If None, everybody may share with everybody.
+            Defaults to None.
+        max_time_difference (float, optional): The maximum difference in hours between the check-in times
+            and between the check-out times of the guests of a room. Defaults to 24.
+        max_people_per_room (int, optional): The maximum number of people in a room. Defaults to 2.
+
+    Returns:
+        numpy.ndarray: The room label of every stay, starting at 1.
+    """
+    check_in = np.asarray(check_in, dtype=float)
+    check_out = np.asarray(check_out, dtype=float)
+    if sides is not None:
+        sides = np.asarray(sides).tolist()
+        max_people_per_room = min(max_people_per_room, 2)
+    labels = np.empty(len(check_in), dtype=int)
+    order = np.lexsort((check_out, check_in)).tolist()
+    check_in, check_out = check_in.tolist(), check_out.tolist()
+    d = max_time_difference
+
+    # every room as [first check-in, earliest check-out, latest check-out, side, size]
+    rooms = {}
+    # side -> the open rooms of that side as sorted (earliest check-out, label) pairs
+    open_rooms = {}
+    # the open rooms in the order they were opened, which is the order of their first check-in
+    opened = collections.deque()
+
+    def close(label):
+        room = rooms[label]
+        keys = open_rooms[room[3]]
+        del keys[bisect.bisect_left(keys, (room[1], label))]
+        room[4] = -room[4]  # marks the room as closed
+
+    for i in order:
+        # rooms whose first guest checked in too early for i are too early for everybody after i as well
+        while opened and check_in[i] - rooms[opened[0]][0] > d:
+            label = opened.popleft()
+            if rooms[label][4] > 0:
+                close(label)
+        side = None if sides is None else sides[i]
+        found = None
+        for room_side, keys in open_rooms.items():
+            if sides is not None and room_side == side:
+                continue
+            # rooms that everybody leaves after i arrives, with an earliest check-out close to that of i
+            lo = max(bisect.bisect_left(keys, (check_out[i] - d, -1)), bisect.bisect_right(keys, (check_in[i], math.inf)))
+            hi = bisect.bisect_right(keys, (check_out[i] + d, math.inf))
+            position = min(max(bisect.bisect_left(keys, (check_out[i], -1)), lo), hi)
+            left, right = position - 1, position
+            # closest check-out first, only a room of several guests can fail on its latest check-out
+            while left >= lo or right < hi:
+                if right >= hi or (left >= lo and check_out[i] - keys[left][0] <= keys[right][0] - check_out[i]):
+                    label, left = keys[left][1], left - 1
+                else:
+                    label, right = keys[right][1], right + 1
+                room = rooms[label]
+                if max(room[2], check_out[i]) - min(room[1], check_out[i]) <= d:
+                    found = label
+                    break
+            if found is not None:
+                break
+        if found is None:
+            label = len(rooms) + 1
+            rooms[label] = [check_in[i], check_out[i], check_out[i], side, 1]
+            labels[i] = label
+            if max_people_per_room > 1:
+                bisect.insort(open_rooms.setdefault(side, []), (check_out[i], label))
+                opened.append(label)
+            continue
+        room = rooms[found]
+        labels[i] = found
+        keys = open_rooms[room[3]]
+        if check_out[i] < room[1]:
+            del keys[bisect.bisect_left(keys, (room[1], found))]
+            room[1] = check_out[i]
+            bisect.insort(keys, (room[1], found))
+        room[2] = max(room[2], check_out[i])
+        room[4] += 1
+        if room[4] >= max_people_per_room:
+            close(found)
+    return labels
+
+
+def optimize_rooms(df, max_time_difference = 24, max_people_per_room = 2, times = None, location_columns = None,
+                   gender_column = GENDER_COLUMN, preference_column = PREFERENCE_COLUMN):
+    """
+    Assigns hotel rooms to participants who may share them and whose stays at the hotel overlap.
+
+    A stay lasts from the arrival at the airport to the departure from the hotel. The participants are split
+    by hotel and by `compatibility_classes`, and the stays of every class, or of every two partner classes,
+    are grouped with `sweep_rooms`. Nobody is compared with people outside their class, so large events need
+    O(n log n) time.
+
+    Participants without a gender, without an arrival or departure time, or whose preference nobody can match,
+    e.g. 'I will not share', do not take part and get the room 0, for which no email is sent.
+
+    Args:
+        df (pandas.DataFrame): Input DataFrame which needs to be processed, gets a 'room_group' column.
+        max_time_difference (float, optional): The maximum difference in hours between the arrival times and
+            between the departure times of people sharing a room. Defaults to 24.
+        max_people_per_room (int, optional): The maximum number of people in a room. Rooms of people who want
+            to share with another gender hold two people. Defaults to 2.
+        times (dict, optional): The times of the participants in hours for 'arrival' and 'departure', in the
+            row order of df, e.g. from `reader.to_epoch_hours`. If None, they are computed from the time columns.
+            Defaults to None.
+        location_columns (list of str, optional): Columns that have to match for people to share a room, see
+            `optimize_rideshares.location_codes`. If None, the 'Hotel' column if it is in df. Defaults to None.
+        gender_column (str, optional): The column with the gender. Defaults to 'Gender'.
+        preference_column (str, optional): The column with the gender to share a room with.
+            Defaults to 'Gender_to_share_room_with'.
+
+    Returns:
+        pandas.DataFrame: DataFrame with a new column indicating the room groups, starting at 1, and 0 for
+            participants who do not take part.
+
+    Raises:
+        AssertionError: If the gender or preference column is not found in the DataFrame.
+    """
+    with metrics.stage("optimize.room.times"):
+        if times is None:
+            times = {kind: to_epoch_hours(df[column]) for kind, column in TIME_COLUMNS.items()}
+        check_in = np.asarray(times["arrival"], dtype=float)
+        check_out = np.asarray(times["departure"], dtype=float)
+
+    if location_columns is None:
+        location_columns = [column for column in ROOM_LOCATION_COLUMNS if column in df.columns]
+    classes, partners = compatibility_classes(df, gender_column, preference_column)
+    # partner classes are matched together, under the smaller of the two class numbers
+    buckets = np.where(classes >= 0, np.minimum(classes, partners[classes]), -1)
+    buckets[(classes >= 0) & (partners[classes] < 0)] = -1  # nobody can share with them
+    buckets[np.isnan(check_in) | np.isnan(check_out)] = -1
+
+    # every hotel and bucket is swept on its own, and its rooms are numbered after those of the previous ones,
+    # the participants in the bucket -1 keep the room 0
+    rooms = np.zeros(len(df), dtype=int)
+    offset = 0
+    with metrics.stage("optimize.room.sweep"):
+        for rows in _location_rows(location_codes(df, location_columns), len(df)):
+            bucket_codes, bucket_ids = pd.factorize(buckets[rows], sort=True)
+            for bucket in range(len(bucket_ids)):
+                if bucket_ids[bucket] < 0:
+                    continue
+                bucket_rows = rows[bucket_codes == bucket]
+                mixed = partners[bucket_ids[bucket]] != bucket_ids[bucket]
+                labels = sweep_rooms(check_in[bucket_rows], check_out[bucket_rows],
+                                     sides=classes[bucket_rows] if mixed else None,
+                                     max_time_difference=max_time_difference,
+                                     max_people_per_room=max_people_per_room)
+                rooms[bucket_rows] = labels + offset
+                offset += labels.max(initial=0)
+
+    counts = np.bincount(rooms)[1:]
+    metrics.count("groups.room", int(np.count_nonzero(counts)))
+    metrics.count("singletons.room", int(np.count_nonzero(counts == 1)))
+    metrics.count("skipped.room", int(np.count_nonzero(rooms == 0)))
+    df["room_group"] = rooms
+    return df
+
+
+def reoptimize_rooms(df, n_previous, **kwargs):
+    """
+    Assigns rooms to newly registered participants without touching the rooms of anybody else.
+
+    The new participants are only paired among themselves with `optimize_rooms` and get new room IDs,
+    since a room that has been booked already is not filled up by somebody else. If the previous
+    participants have no rooms yet, everybody is assigned a room. New participants who do not take part
+    get the room 0, see `optimize_rooms`.
+
+    Args:
+        df (pandas.DataFrame): The combined DataFrame with the previous rows first, e.g. from
+            `optimize_rideshares.reoptimize`.
+        n_previous (int): The number of previous rows.
+        **kwargs: The keyword arguments of `optimize_rooms`.
+
+    Returns:
+        tuple: df with the 'room_group' column, and a numpy.ndarray with the IDs of the new rooms, without 0.
+    """
+    previous_rooms = df["room_group"].iloc[:n_previous] if "room_group" in df.columns else None
+    if previous_rooms is None or previous_rooms.isna().any():
+        optimize_rooms(df, **kwargs)
+        rooms = df["room_group"].to_numpy()
+        return df, np.unique(rooms[rooms > 0])
+
+    new_rows = df.iloc[n_previous:].copy()
+    optimize_rooms(new_rows, **kwargs)
+    offset = int(previous_rooms.max()) if n_previous > 0 else 0
+    new_rooms = new_rows["room_group"].to_numpy()
+    new_rooms = np.where(new_rooms > 0, new_rooms + offset, 0)
+    df["room_group"] = np.concatenate([previous_rooms.to_numpy(dtype=int), new_rooms])
+    return df, np.unique(new_rooms[new_rooms > 0])
@@ -0,0 +1,160 @@
+import email
+import email.policy
+import hashlib
+import os
+import threading
+from email.header import Header
+from .render import Message
+
+KIND_HEADER = "X-SpaceShare-Kind"
+GROUP_HEADER = "X-SpaceShare-Group"
+
+
+def message_id(message):
+    """
+    Derives a stable ID from the content of a message, so that rendering the same groups again gives the same IDs.
+
+    Args:
+        message (render.Message): The message.
+
+    Returns:
+        str: '{kind}-{group}-{hash}', which is also the file name of the message in the outbox.
+    """
+    digest = hashlib.sha256("\0".join([", ".join(message.recipients), message.subject,
+                                        message.content]).encode("utf-8")).hexdigest()
+    return f"{message.kind}-{message.group}-{digest[:16]}"
+
+
+def _header(value):
+    value = " ".join(str(value).split())
+    if value.isascii():
+        return value
+    return Header(value, "utf-8").encode()
+
+
+def _to_eml(message):
+    """
+    Formats a message as a plain text email. Building an EmailMessage takes milliseconds per message,
+    which adds up to minutes for the dry run of a large event.
+    """
+    headers = [("To", ", ".join(message.recipients)), ("Subject", message.subject),
+               (KIND_HEADER, message.kind), (GROUP_HEADER, message.group), ("MIME-Version", "1.0"),
+               ("Content-Type", 'text/plain; charset="utf-8"'), ("Content-Transfer-Encoding", "8bit")]
+    content = message.content if message.content.endswith("\n") else message.content + "\n"
+    return ("".join(f"{name}: {_header(value)}\n" for name, value in headers) + "\n" + content).encode("utf-8")
+
+
+class Outbox():
+    """A directory of rendered messages and an append-only journal of the delivered ones."""
+    def __init__(self, directory="spaceshare_outbox"):
+        """
+        Initializes the Outbox class.
+
+        Every message is stored as '{directory}/messages/{message_id}.eml', which can be opened with any mail
+        client, and the IDs of delivered messages are appended to '{directory}/delivered.log'. A crash
+        between handing a message to the server and writing the journal means that one message is sent
+        again on the next run, but never that a message is skipped. The IDs of the messages written by
+        the latest `spool` are kept in '{directory}/latest.txt', so that messages of earlier renders, e.g.
+        before the groups were edited in the review, are never sent by `pending`.
+
+        Args:
+            directory (str, optional): The directory of the outbox, created if it does not exist.
+                Defaults to 'spaceshare_outbox'.
+        """
+        self.directory = os.fspath(directory)
+        self.journal = os.path.join(self.directory, "delivered.log")
+        self.manifest = os.path.join(self.directory, "latest.txt")
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(self.directory, "messages"), exist_ok=True)
+
+    def path(self, message_id):
+        """
+        Returns the path of the .eml file of a message.
+        """
+        return os.path.join(self.directory, "messages", message_id + ".eml")
+
+    def spool(self, messages):
+        """
+        Writes messages to the outbox and makes them the latest messages, which replace those of
+        earlier calls in `pending`. Messages that are already in it are not written again.
+
+        Args:
+            messages (list of render.Message): The messages.
+
+        Returns:
+            list of str: The message ID of every message, see `message_id`.
+        """
+        message_ids = []
+        for message in messages:
+            message_ids.append(message_id(message))
+            path = self.path(message_ids[-1])
+            if os.path.exists(path):
+                continue
+            # write to a temporary file first, so that a crash never leaves a truncated message behind
+            with open(path + ".tmp", "wb") as fp:
+                fp.write(_to_eml(message))
+            os.replace(path + ".tmp", path)
+        with open(self.manifest + ".tmp", "w") as fp:
+            fp.write("".join(spooled_id + "\n" for spooled_id in dict.fromkeys(message_ids)))
+        os.replace(self.manifest + ".tmp", self.manifest)
+        return message_ids
+
+    def load(self, message_id):
+        """
+        Reads a message from the outbox.
+
+        Args:
+            message_id (str): The ID returned by `spool`.
+
+        Returns:
+            render.Message: The message.
+
+        Raises:
+            FileNotFoundError: If the message is not in the outbox.
+        """
+        with open(self.path(message_id), "rb") as fp:
+            msg = email.message_from_binary_file(fp, policy=email.policy.default)
+        group = msg[GROUP_HEADER]
+        return Message(kind=msg[KIND_HEADER], group=int(group) if group.lstrip("-").isdigit() else group,
+                       recipients=[address.addr_spec for address in msg["To"].addresses],
+                       subject=str(msg["Subject"]), content=msg.get_content())
+
+    def delivered(self):
+        """
+        Returns the IDs of all delivered messages.
+
+        Returns:
+            set of str: The message IDs in the journal.
+        """
+        if not os.path.exists(self.journal):
+            return set()
+        with open(self.journal) as fp:
+            # a line cut off by a crash has no newline and is ignored
+            return {line[:-1] for line in fp if line.endswith("\n")}
+
+    def pending(self):
+        """
+        Returns the IDs of the messages of the latest `spool` that have not been delivered, in the order
+        they were spooled. Older messages stay in the outbox, but are not pending anymore.
+
+        Returns:
+            list of str: The message IDs.
+        """
+        if not os.path.exists(self.manifest):
+            return []
+        delivered = self.delivered()
+        with open(self.manifest) as fp:
+            return [line.strip() for line in fp if line.strip() and line.strip() not in delivered]
+
+    def mark_delivered(self, message_id):
+        """
+        Appends a message ID to the journal and flushes it to disk. Safe to call from several threads.
+
+        Args:
+            message_id (str): The ID of the delivered message.
+        """
+        with self._lock:
+            with open(self.journal, "a") as fp:
+                fp.write(message_id + "\n")
+                fp.flush()
+                os.fsync(fp.fileno())
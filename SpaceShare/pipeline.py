@@ -0,0 +1,183 @@
+import hashlib
+import os
+
+from . import __version__
+from . import metrics
+from .cache import content_hash
+from .optimize_rideshares import optimize
+from .optimize_rooms import optimize_rooms
+from .reader import TIME_COLUMNS, fetch_sheet, clean_dataframe, to_epoch_hours
+from .render import TEMPLATE_DIR, Message, render_messages
+from .write_email import send_messages
+
+# the stages of a run in order, all but fetch and send are cached by `cache.StageCache`
+STAGES = ["fetch", "clean", "times", "cluster", "render", "send"]
+
+
+def _template_hashes(template_dir=None):
+    """
+    Returns the name and content hash of every template that `render.get_template` can pick.
+    """
+    hashes = []
+    for directory in [TEMPLATE_DIR, template_dir]:
+        if directory is None or not os.path.isdir(directory):
+            continue
+        for name in sorted(os.listdir(directory)):
+            with open(os.path.join(directory, name), "rb") as fp:
+                hashes.append([directory == template_dir, name, hashlib.sha256(fp.read()).hexdigest()])
+    return hashes
+
+
+class Pipeline():
+    """The steps of a run as explicit stages: fetch, clean, times, cluster, render and send."""
+    def __init__(self, settings):
+        """
+        Initializes the Pipeline class.
+
+        Every stage from clean to render returns its result together with a key, the hash of its inputs and
+        parameters, which is passed on to the next stage. With a stage cache, a stage whose key has been seen
+        before loads its result from disk instead of computing it, so after changing e.g. `max_wait_time`
+        only the cluster stage and the stages after it run again.
+
+        The fetch stage is cached by the `cache.SheetCache` of the [CACHE] section, which asks the server
+        whether the sheet has changed. The send stage is never cached, but with an outbox in the [EMAIL]
+        section, emails that were already delivered are skipped when it runs again.
+
+        Args:
+            settings (dict): The settings returned by `config.read_config`. Its "stages" entry, a
+                `cache.StageCache` or None, caches the stages.
+        """
+        self.settings = settings
+        self.stages = settings.get("stages")
+
+    def _key(self, stage, *inputs):
+        # nothing is hashed without a cache, the package version invalidates results of older releases
+        if self.stages is None:
+            return None
+        return content_hash(__version__, stage, *inputs)
+
+    def _run(self, stage, key, compute):
+        if self.stages is None:
+            return compute()
+        return self.stages.get(stage, key, compute)
+
+    def fetch(self):
+        """
+        Downloads the sheet, see `reader.fetch_sheet`.
+
+        Returns:
+            tuple: The raw sheet as a pandas.DataFrame and its key.
+        """
+        sheet = self.settings["sheet"]
+        raw = fetch_sheet(sheet["sheet_id"], cache=sheet["cache"])
+        return raw, self._key("fetch", raw)
+
+    def clean(self, raw, key):
+        """
+        Parses the times of the sheet, see `reader.clean_dataframe`.
+
+        Args:
+            raw (pandas.DataFrame): The raw sheet.
+            key (str): The key of the raw sheet.
+
+        Returns:
+            tuple: The cleaned pandas.DataFrame and its key.
+        """
+        sheet = self.settings["sheet"]
+        key = self._key("clean", key, sheet["time_format"], sheet["tz"])
+
+        def compute():
+            with metrics.stage("clean"):
+                return clean_dataframe(raw, time_format=sheet["time_format"], tz=sheet["tz"])
+        return self._run("clean", key, compute), key
+
+    def encode_times(self, df, key):
+        """
+        Converts the arrival and departure times into hours, see `reader.to_epoch_hours`.
+
+        Args:
+            df (pandas.DataFrame): The cleaned sheet.
+            key (str): The key of the cleaned sheet.
+
+        Returns:
+            tuple: A dict with a numpy.ndarray of hours for 'arrival' and 'departure', and its key.
+        """
+        key = self._key("times", key)
+
+        def compute():
+            with metrics.stage("times"):
+                return {kind: to_epoch_hours(df[column]) for kind, column in TIME_COLUMNS.items()}
+        return self._run("times", key, compute), key
+
+    def cluster(self, df, times, key):
+        """
+        Assigns the arrival and departure groups with the [OPTIMIZATION] settings, see `optimize_rideshares.optimize`,
+        and the rooms with the [ROOMS] settings if they are enabled, see `optimize_rooms.optimize_rooms`.
+
+        Args:
+            df (pandas.DataFrame): The cleaned sheet, which gets the group columns.
+            times (dict): The hours returned by `encode_times`.
+            key (str): The key of the hours.
+
+        Returns:
+            tuple: df with the '{kind}_group' columns and the 'room_group' column if rooms are enabled, and its key.
+        """
+        optimization = self.settings["optimization"]
+        rooms = self.settings.get("rooms")
+        key = self._key("cluster", key, optimization, rooms)
+
+        def compute():
+            clustered = df.copy()
+            for kind in TIME_COLUMNS:
+                optimize(clustered, kind=kind, times=times[kind], **optimization)
+            if rooms is not None:
+                optimize_rooms(clustered, times=times, **rooms)
+            # only the new columns are stored, the rest is in the clean stage
+            return ({column: clustered[column].to_numpy() for column in clustered.columns if column not in df.columns},
+                    dict(clustered.attrs))
+        columns, attrs = self._run("cluster", key, compute)
+        for column, values in columns.items():
+            df[column] = values
+        df.attrs.update(attrs)
+        return df, key
+
+    def render(self, df, groups=None):
+        """
+        Renders the emails of the reviewed groups with the templates and the consolidate option of the [EMAIL]
+        section, see `render.render_messages`.
+
+        Args:
+            df (pandas.DataFrame): The reviewed groups. Its content is hashed, since it may have been edited.
+            groups (dict, optional): Maps a kind to the group IDs that should be rendered. If None, all groups
+                are rendered. Defaults to None. If df has a 'room_group' column, the rooms are rendered as well.
+
+        Returns:
+            list of render.Message: The rendered messages.
+        """
+        template_dir = self.settings["template_dir"]
+        consolidate = self.settings.get("consolidate", False)
+        key = self._key("render", df,
+                        None if groups is None else {kind: sorted(int(group) for group in ids) for kind, ids in groups.items()},
+                        _template_hashes(template_dir), consolidate)
+
+        def compute():
+            # plain tuples are stored, since pickling the Message dataclass is slow for large events
+            messages = render_messages(df, groups=groups, template_dir=template_dir, consolidate=consolidate)
+            if "room_group" in df.columns:
+                messages += render_messages(df, kinds=("room",), groups=groups, template_dir=template_dir)
+            return [(message.kind, message.group, message.recipients, message.subject, message.content)
+                    for message in messages]
+        return [Message(*fields) for fields in self._run("render", key, compute)]
+
+    def send(self, messages, dry_run=False):
+        """
+        Sends the messages with the [EMAIL] settings, see `write_email.send_messages`.
+
+        Args:
+            messages (list of render.Message): The messages.
+            dry_run (bool, optional): If True, prints the emails instead of sending them. Defaults to False.
+
+        Returns:
+            pandas.DataFrame: The per-email result report.
+        """
+        return send_messages(messages, dry_run=dry_run, **self.settings["email"])
@@ -1,7 +1,17 @@
+import io
+
+import numpy as np
 import pandas as pd
+from . import metrics
+
+# columns holding the times that are used to group participants
+TIME_COLUMNS = {"arrival": "date_time_of_airport_arrival", "departure": "date_time_of_hotel_departure"}
+# optional columns for events with several airports or hotels, only people with the same entries share a ride
+LOCATION_COLUMNS = ["Airport", "Hotel"]
+EPOCH = pd.Timestamp("1970-01-01")
 
 
-def read_google_sheet(sheet_id):
+def read_google_sheet(sheet_id, time_format=None, tz=None, cache=None):
     """
     Reads in a Google Sheet as a CSV file using pandas. 
     Ensure that the sharing setting for the sheet allows anyone with the link to access it.
@@ -9,6 +19,10 @@ def read_google_sheet(sheet_id):
     Args:
         sheet_id (str, optional): The ID of the Google Sheet, extracted from the webpage as '/d/{sheet_id}/gviz/tq?tqx=out:csv'. 
             If None, it uses a default ID. Defaults to None.
+        time_format (str, optional): The strftime format of the time columns, see `parse_times`. Defaults to None.
+        tz (str, optional): The timezone of the time columns, see `parse_times`. Defaults to None.
+        cache (cache.SheetCache, optional): If given, the sheet is only downloaded again when the cached 
+            copy has expired and the server reports that it has changed. Defaults to None.
 
     Returns:
         pandas.DataFrame: A DataFrame containing the information from the Google Sheet. The "Timestamp" 
@@ -22,18 +36,46 @@ def read_google_sheet(sheet_id):
     Note:
         The default sheet ID used when none is provided is '1riOck-CL8RjVkt_dgcgWhd0DWhUWMifpyb6VLngTrHs'.
     """
+    DF = fetch_sheet(sheet_id, cache=cache)
+    with metrics.stage("clean"):
+        return clean_dataframe(DF, time_format=time_format, tz=tz)
+
+def fetch_sheet(sheet_id, cache=None):
+    """
+    Downloads a Google Sheet as a CSV file without cleaning it, see `read_google_sheet`.
+
+    Args:
+        sheet_id (str): The ID of the Google Sheet.
+        cache (cache.SheetCache, optional): If given, the sheet is only downloaded again when the cached 
+            copy has expired and the server reports that it has changed. Defaults to None.
+
+    Returns:
+        pandas.DataFrame: The sheet as it is, with the times as strings.
+
+    Raises:
+        pandas.errors.ParserError: If parsing the CSV file fails.
+        urllib.error.HTTPError: If the sheet ID is invalid, or the sheet doesn't allow public access.
+    """
     prefix = "https://docs.google.com/spreadsheets/d/"
     
-    DF = pd.read_csv(prefix+ sheet_id+ "/gviz/tq?tqx=out:csv")
-    return clean_dataframe(DF)
+    url = prefix+ sheet_id+ "/gviz/tq?tqx=out:csv"
+    with metrics.stage("fetch"):
+        if cache is None:
+            DF = pd.read_csv(url)
+        else:
+            DF = cache.get(sheet_id, url, parse=lambda body: pd.read_csv(io.BytesIO(body)))
+    metrics.count("rows", len(DF))
+    return DF
 
-def clean_dataframe(DF):
+def clean_dataframe(DF, time_format=None, tz=None):
     """
     Cleans the input DataFrame by dropping the 'Timestamp' column and converting the 'date_time_of_airport_arrival'
     and 'date_time_of_hotel_departure' columns from strings to datetime objects.
 
     Args:
         DF (pandas.DataFrame): The DataFrame to clean.
+        time_format (str, optional): The strftime format of the time columns, see `parse_times`. Defaults to None.
+        tz (str, optional): The timezone of the time columns, see `parse_times`. Defaults to None.
 
     Returns:
         pandas.DataFrame: The cleaned DataFrame.
@@ -41,7 +83,57 @@ def clean_dataframe(DF):
     DF = DF.drop(columns= "Timestamp")
 
     #convert day-time string into date_time object
-    DF["date_time_of_airport_arrival"]  = [pd.to_datetime(tt) for tt in DF["date_time_of_airport_arrival"] ]
-    DF["date_time_of_hotel_departure"]  = [pd.to_datetime(tt) for tt in DF["date_time_of_hotel_departure"] ]
+    for column in TIME_COLUMNS.values():
+        DF[column] = parse_times(DF[column], time_format=time_format, tz=tz)
 
     return DF
+
+def parse_times(values, time_format=None, tz=None):
+    """
+    Converts a column of date-time strings into datetime objects in a single vectorized call.
+
+    Args:
+        values (pandas.Series or array-like): The date-time strings.
+        time_format (str, optional): The strftime format of the strings, e.g. '%m/%d/%Y %H:%M:%S'. 
+            If None, the format is inferred from the first entry. Defaults to None.
+        tz (str, optional): The timezone in which the times are given, e.g. 'America/Chicago'. 
+            If None, the times are kept timezone-naive. Defaults to None.
+
+    Returns:
+        pandas.Series: The times as datetime objects, with NaT for empty entries.
+
+    Raises:
+        ValueError: If an entry does not match the format.
+    """
+    values = pd.Series(values)
+    # sheets repeat the same time strings many times, so only the distinct ones are parsed
+    codes, uniques = pd.factorize(values)
+    parsed = pd.DatetimeIndex(pd.to_datetime(uniques, format=time_format))
+    times = pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index, name=values.name)
+    if tz is not None and times.dt.tz is None:
+        times = times.dt.tz_localize(tz)
+    return times
+
+def to_epoch_hours(times, time_format=None, tz=None):
+    """
+    Converts times into hours since 1970-01-01 00:00 UTC without any per-row Python calls.
+
+    Unlike `optimize_rideshares.get_time_of_year`, the result does not wrap around at New Year,
+    so times from different years can be compared directly.
+
+    Args:
+        times (pandas.Series or array-like): Datetime objects, or date-time strings that are parsed with `parse_times`.
+        time_format (str, optional): The strftime format of date-time strings, see `parse_times`. Defaults to None.
+        tz (str, optional): The timezone of timezone-naive times. If None, they are treated as UTC. Defaults to None.
+
+    Returns:
+        numpy.ndarray: The times in hours as float64, with NaN for missing times.
+    """
+    times = pd.Series(times)
+    if not pd.api.types.is_datetime64_any_dtype(times):
+        times = parse_times(times, time_format=time_format, tz=tz)
+    elif tz is not None and times.dt.tz is None:
+        times = times.dt.tz_localize(tz)
+    if times.dt.tz is not None:
+        times = times.dt.tz_convert("UTC").dt.tz_localize(None)
+    return ((times - EPOCH) / pd.Timedelta(hours=1)).to_numpy(dtype=np.float64, na_value=np.nan)
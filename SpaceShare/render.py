@@ -0,0 +1,240 @@
+import functools
+import os
+from dataclasses import dataclass
+from string import Template
+
+import numpy as np
+import pandas as pd
+from .reader import TIME_COLUMNS, parse_times
+from . import metrics
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+TIME_DISPLAY_FORMAT = "%b %d, %I:%M %p"
+
+
+@dataclass
+class Message:
+    """A rendered email to one group."""
+    kind: str
+    group: object
+    recipients: list
+    subject: str
+    content: str
+
+
+@functools.lru_cache(maxsize=None)
+def load_template(path):
+    """
+    Reads a template file once and compiles it into a string.Template.
+
+    Templates use $-placeholders, e.g. $first_names, $times and $kind.
+
+    Args:
+        path (str): The path to the template file.
+
+    Returns:
+        string.Template: The compiled template, cached for subsequent calls.
+
+    Raises:
+        FileNotFoundError: If the template file does not exist.
+    """
+    with open(path) as fp:
+        return Template(fp.read())
+
+
+def get_template(name, template_dir=None):
+    """
+    Looks up a template by name, preferring `template_dir` over the templates shipped with the package.
+
+    Args:
+        name (str): The file name of the template, e.g. 'group_arrival.txt'.
+        template_dir (str, optional): A directory with custom templates. Defaults to None.
+
+    Returns:
+        string.Template: The compiled template.
+    """
+    if template_dir is not None and os.path.exists(os.path.join(template_dir, name)):
+        return load_template(os.path.join(template_dir, name))
+    return load_template(os.path.join(TEMPLATE_DIR, name))
+
+
+def format_times(times, time_format=TIME_DISPLAY_FORMAT):
+    """
+    Formats datetimes as strings, formatting every distinct time only once.
+
+    Args:
+        times (pandas.Series): The datetimes.
+        time_format (str, optional): The strftime format. Defaults to TIME_DISPLAY_FORMAT.
+
+    Returns:
+        pandas.Series: The formatted times, with 'unknown' for missing times.
+    """
+    codes, uniques = pd.factorize(times)
+    formatted = np.append(pd.DatetimeIndex(uniques).strftime(time_format).to_numpy(dtype=object), "unknown")
+    # missing times have the code -1 and pick the last entry
+    return pd.Series(formatted[codes], index=times.index)
+
+
+def render_messages(df, kinds=("arrival", "departure"), groups=None, template_dir=None, consolidate=False):
+    """
+    Renders one message per ride share group in a single groupby pass per kind.
+
+    Groups with a single member get the 'single_{kind}.txt' template, all others the 'group_{kind}.txt'
+    template. Both get the placeholders $first_names, $times and $kind, the subject is rendered from 'subject.txt'.
+    The kind 'room' renders the 'room_group' column of `optimize_rooms.optimize_rooms`, with the subject from
+    'subject_room.txt' and the arrival and departure of every roommate in $times. The room 0 of the participants
+    who do not share a room gets no message.
+
+    With `consolidate`, every participant gets a single message about all their rides instead of one per
+    kind, see `_render_consolidated`.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame containing participant information, with the columns "Name", 
+            "Email", "{kind}_group" and the time column of every kind.
+        kinds (tuple, optional): The kinds of rides, or 'room', to render messages for. Defaults to ('arrival', 'departure').
+        groups (dict, optional): Maps a kind to the group IDs that should be rendered. If None, all groups are 
+            rendered. Defaults to None.
+        template_dir (str, optional): A directory with custom templates, see `get_template`. Defaults to None.
+        consolidate (bool, optional): If True, renders one message per participant covering all kinds of rides.
+            Defaults to False.
+
+    Returns:
+        list of Message: The rendered messages, ordered by kind and group.
+
+    Raises:
+        AssertionError: If a '{kind}_group' column is not found in the DataFrame, or `consolidate` is given
+            with a kind that is not a ride.
+    """
+    with metrics.stage("render"):
+        if consolidate:
+            messages = _render_consolidated(df, kinds, groups, template_dir)
+        else:
+            messages = _render_messages(df, kinds, groups, template_dir)
+    metrics.count("messages.rendered", len(messages))
+    return messages
+
+
+def _check_group_columns(df, kinds):
+    for kind in kinds:
+        if f"{kind}_group" not in df.columns:
+            raise AssertionError(f"Error: {kind}_group column not found in dataframe! \n"\
+                                 +"Please run the optimize routine first")
+
+
+def _split_by(codes):
+    """
+    Returns the positions of every code in a stable order of the codes, skipping negative codes.
+    """
+    order = np.argsort(codes, kind="stable")
+    order = order[codes[order] >= 0]
+    bounds = np.flatnonzero(np.diff(codes[order])) + 1
+    return np.split(order, bounds) if len(order) > 0 else []
+
+
+def _render_messages(df, kinds, groups, template_dir):
+    _check_group_columns(df, kinds)
+    messages = []
+    for kind in kinds:
+        subject = get_template("subject_room.txt" if kind == "room" else "subject.txt",
+                               template_dir).substitute(kind=kind).strip()
+        templates = {"single": get_template(f"single_{kind}.txt", template_dir),
+                     "group": get_template(f"group_{kind}.txt", template_dir)}
+
+        # rooms are shared for the whole stay, from the arrival to the departure
+        time_columns = list(TIME_COLUMNS.values()) if kind == "room" else [TIME_COLUMNS[kind]]
+        rows = df[["Name", "Email", *time_columns, f"{kind}_group"]]
+        if groups is not None:
+            rows = rows[rows[f"{kind}_group"].isin(groups.get(kind, []))]
+        if kind == "room":
+            rows = rows[rows["room_group"] > 0]
+        formatted = []
+        for column in time_columns:
+            times = rows[column]
+            if not pd.api.types.is_datetime64_any_dtype(times):
+                times = parse_times(times)
+            formatted.append(format_times(times))
+        names = rows["Name"].astype(str)
+        # vectorized over all rows, only joined per group below
+        first_names = names.str.split(" ").str[0].to_numpy()  # only address by first names
+        time_lines = ("\t" + names + ": " + functools.reduce(lambda a, b: a + " - " + b, formatted) + "\n").to_numpy()
+        emails = rows["Email"].to_numpy()
+
+        # one stable sort by group instead of a boolean mask per group
+        codes, group_ids = pd.factorize(rows[f"{kind}_group"], sort=True)
+        for positions in _split_by(codes):
+            group = group_ids[codes[positions[0]]]
+            template = templates["single"] if len(positions) < 2 else templates["group"]
+            content = template.substitute(first_names=", ".join(first_names[positions]),
+                                          times="".join(time_lines[positions]), kind=kind)
+            messages.append(Message(kind=kind, group=group, recipients=list(emails[positions]),
+                                    subject=subject, content=content))
+    return messages
+
+
+def _render_consolidated(df, kinds, groups, template_dir):
+    """
+    Renders one message per participant about all their rides, in one pass per kind and one over the participants.
+
+    Participants with the same groups for all kinds share a message, so the recipients of a message are
+    everybody with the same group combination, without duplicate addresses or names. The message covers every ride
+    in a section from 'combined_single_{kind}.txt' or 'combined_group_{kind}.txt', which get the placeholders
+    $times and $kind. Since the other members of a group may get a different message, $times lists the
+    email address of every member. The sections are joined into 'combined.txt' with the placeholders
+    $first_names and $sections.
+
+    A ride without a time, e.g. because somebody only needs a ride from the airport, gets no section and
+    does not show up in the sections of the rest of its group. Participants without any ride to report
+    get no message.
+
+    The messages have the kind 'combined' and the group '{group}-{group}' of the groups in the order of
+    `kinds`, with 'none' for a ride without a section.
+    """
+    _check_group_columns(df, kinds)
+    assert all(kind in TIME_COLUMNS for kind in kinds), "only rides can be consolidated"
+    wrapper = get_template("combined.txt", template_dir)
+    names = df["Name"].astype(str)
+    first_names = names.str.split(" ").str[0].to_numpy()  # only address by first names
+    emails = df["Email"].to_numpy()
+
+    sections = {}
+    labels = {}
+    combination = np.zeros(len(df), dtype=np.int64)
+    for kind in kinds:
+        templates = {"single": get_template(f"combined_single_{kind}.txt", template_dir),
+                     "group": get_template(f"combined_group_{kind}.txt", template_dir)}
+        times = df[TIME_COLUMNS[kind]]
+        if not pd.api.types.is_datetime64_any_dtype(times):
+            times = parse_times(times)
+        rides = times.notna().to_numpy()
+        if groups is not None:
+            rides = rides & df[f"{kind}_group"].isin(groups.get(kind, [])).to_numpy()
+        time_lines = ("\t" + names + " (" + df["Email"].astype(str) + "): " + format_times(times) + "\n").to_numpy()
+
+        codes, group_ids = pd.factorize(df[f"{kind}_group"], sort=True)
+        codes = np.where(rides, codes, -1)
+        # the section of every group, picked by each of its members, the last entry for those without a ride
+        group_sections = np.full(len(group_ids) + 1, None, dtype=object)
+        for positions in _split_by(codes):
+            # somebody who registered twice is listed once
+            lines = dict.fromkeys(time_lines[positions])
+            template = templates["single"] if len(lines) < 2 else templates["group"]
+            group_sections[codes[positions[0]]] = template.substitute(times="".join(lines), kind=kind)
+        sections[kind] = group_sections[codes]
+        labels[kind] = np.append(np.asarray(group_ids).astype(str), "none")[codes]
+        # numbers the group combinations in the order of the groups, with the rides without a section last
+        combination = combination * (len(group_ids) + 1) + np.where(codes >= 0, codes, len(group_ids))
+
+    has_ride = np.logical_or.reduce([pd.notna(sections[kind]) for kind in kinds])
+    codes, _ = pd.factorize(combination, sort=True)
+    codes = np.where(has_ride, codes, -1)
+
+    messages = []
+    for positions in _split_by(codes):
+        first = positions[0]
+        covered = [kind for kind in kinds if sections[kind][first] is not None]
+        subject = get_template("subject.txt", template_dir).substitute(kind=" and ".join(covered)).strip()
+        content = wrapper.substitute(first_names=", ".join(dict.fromkeys(first_names[positions])),
+                                     sections="\n".join(sections[kind][first] for kind in covered))
+        messages.append(Message(kind="combined", group="-".join(labels[kind][first] for kind in kinds),
+                                recipients=list(dict.fromkeys(emails[positions])), subject=subject, content=content))
+    return messages
@@ -1,14 +1,131 @@
+from .config import read_config
+from .optimize_rideshares import reoptimize, validate_groups
+from .optimize_rooms import reoptimize_rooms
+from .pipeline import Pipeline
+from .handoff import write_handoff, read_handoff, export_review_csv, apply_review_csv, local_times
+from .write_email import send_messages
+from . import metrics
+from .metrics import Metrics, print_hook
+from concurrent.futures import ProcessPoolExecutor
+import os
 
-from .reader import read_google_sheet
-from .optimize_rideshares import optimize
-from .write_email import send_emails
-import pandas as pd
-import configparser
 
-# Read the config file
-config = configparser.ConfigParser()
+def create_metrics(settings):
+    """
+    Creates the metrics collector configured in the [METRICS] section.
+
+    Parameters
+    ----------
+    settings : dict
+        The settings returned by `read_config`.
+
+    Returns
+    -------
+    metrics.Metrics or None
+        The collector, or None if metrics are disabled.
+    """
+    metrics_settings = settings["metrics"]
+    if metrics_settings is None:
+        return None
+    return Metrics(hooks=[print_hook] if metrics_settings["verbose"] else [],
+                   profile_dir=metrics_settings["profile_dir"], trace_memory=metrics_settings["trace_memory"])
+
+
+def optimize_event(settings, previous_file = None):
+    """
+    Reads the google sheet of one event and assigns the ride share groups.
+
+    Parameters
+    ----------
+    settings : dict
+        The settings returned by `read_config`.
+    previous_file : str, optional
+        The hand-off file (optimized_clustering.feather) of an earlier run. If given, only participants whose
+        email address is not in it are added to the existing groups. Default is None.
+
+    Returns
+    -------
+    tuple
+        The optimized pandas.DataFrame, sorted by groups, and a dict with the changed group IDs of
+        every kind if previous_file is given, otherwise None.
+    """
+    optimization = settings["optimization"]
+    pipeline = Pipeline(settings)
+    df, key = pipeline.clean(*pipeline.fetch())
+    changed_groups = None
+    if previous_file is None:
+        df, _ = pipeline.cluster(df, *pipeline.encode_times(df, key))
+        if optimization["objective"] is not None:
+            print(f"Objective ({optimization['objective']}): ", df.attrs["objective"])
+    else:
+        previous = read_handoff(previous_file, memory_map=False)
+        # the previous groups keep the local wall time, so the times of both only compare without the timezone
+        new_rows = local_times(df[~df["Email"].isin(previous["Email"])])
+        print(f"Adding {len(new_rows)} new participants to the groups in {previous_file}")
+        changed_groups = {}
+        for kind in ["arrival","departure"]:
+            df, changed_groups[kind] = reoptimize(previous, new_rows, kind=kind,
+                                                  max_time_difference=optimization["max_time_difference"],
+                                                  max_people_per_car=optimization["max_people_per_car"],
+                                                  location_columns=optimization["location_columns"])
+            # carry the groups of the first kind over to the second pass
+            new_rows = df.iloc[len(previous):]
+        if settings["rooms"] is not None:
+            df, changed_groups["room"] = reoptimize_rooms(df, len(previous), **settings["rooms"])
+    df.sort_values(by=["arrival_group","departure_group"],inplace=True)
+    check_groups(df, optimization)
+    return df, changed_groups
 
-def run_spaceshare(config_file = "default.cfg", dry_run = False):
+
+def check_groups(df, optimization, event = None):
+    """
+    Checks the groups against the limits of the [OPTIMIZATION] section with `optimize_rideshares.validate_groups`
+    and prints the violations.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The optimized DataFrame.
+    optimization : dict
+        The "optimization" settings returned by `read_config`.
+    event : str, optional
+        The name of the event, printed with the violations. Default is None.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The violations, empty if all groups keep the limits.
+    """
+    violations = validate_groups(df, max_time_difference=optimization["max_time_difference"],
+                                 max_people_per_car=optimization["max_people_per_car"])
+    for check, count in violations["check"].value_counts().items():
+        metrics.count(f"violations.{check}", int(count))
+    if len(violations) > 0:
+        print(f"Warning: {len(violations)} groups {'' if event is None else f'of {event} '}do not keep the limits:\n"
+              +violations.head(20).to_string(index=False, float_format="%.2f")
+              +(f"\n... and {len(violations) - 20} more" if len(violations) > 20 else ""))
+    return violations
+
+
+def wait_for_approval(files):
+    """
+    Blocks until the user has inspected the given files and agreed to send the emails.
+
+    Parameters
+    ----------
+    files : list of str
+        The files with the assigned groups.
+    """
+    user_input = "n"
+    while user_input.lower() not in ["y","yes"]:
+        user_input = input("The groups have been assigned. Please take a moment to inspect the results in \n\t"\
+                            +"\n\t".join(files)+"\n"\
+                            +"If you want, you can manually make changes to the documents. \n"\
+                            +"Do you want to send the emails? (y/n)")
+
+
+def run_spaceshare(config_file = "default.cfg", dry_run = False, previous_file = None,
+                   output_file = "optimized_clustering.csv", confirm = True):
     """
     Main function that uses the configuration file to read a google sheet, optimize ride share groups,
     and then send emails to the participants.
@@ -17,35 +134,178 @@ def run_spaceshare(config_file = "default.cfg", dry_run = False):
     ----------
     config_file : str, optional
         The path to the configuration file that contains the email credentials and settings. Default is "default.cfg".
+    dry_run : bool, optional
+        If True, prints the emails instead of sending them. Default is False.
+    previous_file : str, optional
+        The hand-off file (optimized_clustering.feather) of an earlier run. If given, only participants whose email 
+        address is not in it are added to the existing groups, and only the groups that changed are emailed. Default is None.
+    output_file : str, optional
+        The CSV file the assigned groups are written to for review. The typed hand-off file with all columns 
+        is written next to it, with the extension .feather, and updated with the reviewed groups. 
+        Default is "optimized_clustering.csv".
+    confirm : bool, optional
+        If True, waits for the user to approve the groups before sending the emails. Default is True.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The per-email result report returned by `write_email.send_messages`.
     """
+    settings = read_config(config_file)
+    collector = create_metrics(settings)
+    if collector is None:
+        return _run_pipeline(settings, dry_run, previous_file, output_file, confirm)
+    with collector:
+        report = _run_pipeline(settings, dry_run, previous_file, output_file, confirm)
+    collector.write_report(settings["metrics"]["report"])
+    print(f"Metrics written to {settings['metrics']['report']}")
+    return report
 
-    config.read(config_file)
-    email_username = config["EMAIL"]["username"].replace(" ","")
-    email_password = config.get("EMAIL","password",fallback=None)
-    if email_password is not None:
-        email_password = email_password.replace(" ","")
-    email_smtp_domain = config["EMAIL"]["smtp_domain"].replace(" ","")
-    email_smtp_port = int(config["EMAIL"]["smtp_port"])
 
-    google_sheet_id = config["GOOGLE.SHEET"]["sheet_id"].replace(" ","")
+def _run_pipeline(settings, dry_run, previous_file, output_file, confirm):
+    """
+    Runs the steps of `run_spaceshare` with the given settings.
+    """
+    df, changed_groups = optimize_event(settings, previous_file)
+    handoff_file = write_for_review(df, output_file)
+    if confirm:
+        # the time spent waiting for the user is recorded, so that it is not mistaken for a slow stage
+        with metrics.stage("review"):
+            wait_for_approval([output_file])
 
-    max_waittime = float(config["OPTIMIZATION"]["max_wait_time"])
-    max_people_per_car = int(config["OPTIMIZATION"]["max_people_per_car"])
-    
+    df = read_reviewed(handoff_file, output_file)
+    # the groups may have been edited during the review
+    check_groups(df, settings["optimization"])
+    pipeline = Pipeline(settings)
+    report = pipeline.send(pipeline.render(df, groups=changed_groups), dry_run=dry_run)
+    print(report["status"].value_counts().to_string())
+    return report
 
 
-    df = read_google_sheet(sheet_id=google_sheet_id)
-    for kind in ["arrival","departure"]:
-        df = optimize(df,kind=kind,max_time_difference=max_waittime,max_people_per_car=max_people_per_car)
-    df.sort_values(by=["arrival_group","departure_group"],inplace=True)
-    df.to_csv("optimized_clustering.csv")
-    user_input = "n"
-    while user_input.lower() not in ["y","yes"]:
-        user_input = input("The groups have been assigned. Please take a moment to inspect the results in optimized_clustering.csv \n"\
-                            +"If you want, you can manually make changes to the document. \n"\
-                            +"Do you want to send the emails? (y/n)")
+def handoff_path(output_file):
+    """
+    Returns the path of the hand-off file that belongs to a CSV file for review.
+
+    Parameters
+    ----------
+    output_file : str
+        The CSV file for review.
+
+    Returns
+    -------
+    str
+        output_file with the extension .feather.
+    """
+    return os.path.splitext(output_file)[0] + ".feather"
+
+
+def write_for_review(df, output_file):
+    """
+    Writes the typed hand-off file and the CSV file for review.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The optimized DataFrame.
+    output_file : str
+        The CSV file for review, the hand-off file gets the same name with the extension .feather.
+
+    Returns
+    -------
+    str
+        The path of the hand-off file.
+    """
+    handoff_file = handoff_path(output_file)
+    with metrics.stage("handoff.write"):
+        write_handoff(df, handoff_file)
+        export_review_csv(df, output_file)
+    return handoff_file
+
+
+def read_reviewed(handoff_file, output_file):
+    """
+    Reads the hand-off file, applies the reviewed CSV file to it and stores the result in the hand-off file.
+
+    Parameters
+    ----------
+    handoff_file : str
+        The hand-off file written by `write_for_review`.
+    output_file : str
+        The reviewed CSV file.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The reviewed, validated DataFrame.
+    """
+    with metrics.stage("handoff.read"):
+        df = apply_review_csv(read_handoff(handoff_file), output_file)
+        write_handoff(df, handoff_file)
+    return df
+
+
+def _optimize_to_file(config_file, output_file):
+    """
+    Runs `optimize_event` for one config file and writes the result, used by the worker processes of `run_batch`.
+    """
+    df, _ = optimize_event(read_config(config_file))
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    return write_for_review(df, output_file)
+
+
+def run_batch(config_files, output_dir = "spaceshare_events", dry_run = False, processes = None,
+              email_config = None, confirm = True):
+    """
+    Runs several events at once: the sheets are fetched and optimized in parallel, all results are
+    reviewed in one step, and all emails are sent through one shared, rate-limited sender.
+
+    Parameters
+    ----------
+    config_files : list of str
+        The configuration files of the events.
+    output_dir : str, optional
+        The directory that gets one subdirectory per event, named after its config file, with the
+        optimized_clustering.csv for review and the optimized_clustering.feather hand-off file of that event.
+        Default is "spaceshare_events".
+    dry_run : bool, optional
+        If True, prints the emails instead of sending them. Default is False.
+    processes : int, optional
+        The number of worker processes. If None, one per CPU. Default is None.
+    email_config : str, optional
+        The configuration file whose [EMAIL] section is used to send the emails of all events.
+        If None, the first config file is used. Default is None.
+    confirm : bool, optional
+        If True, waits for the user to approve the groups before sending the emails. Default is True.
+
+    Returns
+    -------
+    pandas.DataFrame
+        The per-email result report of all events, with an additional "event" column.
+    """
+    events = []
+    for config_file in config_files:
+        event = os.path.splitext(os.path.basename(config_file))[0]
+        if event in events:
+            event = f"{event}_{len(events)}"
+        events.append(event)
+    output_files = [os.path.join(output_dir, event, "optimized_clustering.csv") for event in events]
+
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        handoff_files = list(pool.map(_optimize_to_file, config_files, output_files))
+    if confirm:
+        wait_for_approval(output_files)
+
+    messages, message_events = [], []
+    for config_file, event, output_file, handoff_file in zip(config_files, events, output_files, handoff_files):
+        settings = read_config(config_file)
+        df = read_reviewed(handoff_file, output_file)
+        check_groups(df, settings["optimization"], event)
+        event_messages = Pipeline(settings).render(df)
+        messages.extend(event_messages)
+        message_events.extend([event] * len(event_messages))
 
-    df = pd.read_csv("optimized_clustering.csv")
-    send_emails(df, email_username=email_username,email_smtp_domain=email_smtp_domain,
-                email_password=email_password,email_smtp_port=email_smtp_port,
-                dry_run=dry_run)
\ No newline at end of file
+    email_settings = read_config(email_config if email_config is not None else config_files[0])["email"]
+    report = send_messages(messages, dry_run=dry_run, **email_settings)
+    report.insert(0, "event", message_events)
+    print(report.groupby(["event","status"]).size().to_string())
+    return report
@@ -0,0 +1,551 @@
+import asyncio
+import bisect
+import hmac
+import http
+import ipaddress
+import json
+from datetime import datetime
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+from . import metrics
+from .optimize_rideshares import _sweep_sorted, _time_reach
+from .reader import TIME_COLUMNS, LOCATION_COLUMNS, EPOCH, parse_times, to_epoch_hours
+from .run import write_for_review
+
+# the largest request body that is read, a registration takes a few hundred bytes
+MAX_BODY_BYTES = 64 * 1024
+# the header with the shared token of the service, see `handle_request`
+TOKEN_HEADER = "X-SpaceShare-Token"
+
+
+def _normalize_location(value):
+    """
+    Normalizes a location entry like `optimize_rideshares.location_codes`: case and surrounding whitespace are ignored,
+    and empty entries become None.
+    """
+    if value is None or pd.isna(value):
+        return None
+    value = str(value).strip().casefold()
+    return value if value else None
+
+
+def _location_order(location):
+    # the same order as `optimize_rideshares.location_codes`, with missing entries after all names
+    return tuple((value is None, value or "") for value in location)
+
+
+class TimeIndex():
+    """The times of one kind and location in sorted order, together with the participant of every time."""
+    def __init__(self, times=(), ids=()):
+        """
+        Initializes the TimeIndex class.
+
+        The position of a new time is found by binary search in O(log n). Inserting or removing it
+        is O(n), since the Python list moves the later entries, but with a single memmove, which
+        takes microseconds even for a hundred thousand participants.
+
+        Args:
+            times (sequence of float, optional): The initial times in hours, in any order. Defaults to ().
+            ids (sequence of str, optional): The participant of every time. Defaults to ().
+        """
+        assert len(times) == len(ids), "times and ids must have the same length"
+        order = np.argsort(np.asarray(times, dtype=float), kind="stable")
+        self.times = np.asarray(times, dtype=float)[order].tolist()
+        self.ids = [ids[i] for i in order]
+
+    def __len__(self):
+        return len(self.times)
+
+    def insert(self, time, participant):
+        """
+        Inserts a time after all equal times, so that ties keep the order of registration. The position
+        is found in O(log n), the insert itself is an O(n) memmove.
+
+        Args:
+            time (float): The time in hours.
+            participant (str): The participant.
+        """
+        i = bisect.bisect_right(self.times, time)
+        self.times.insert(i, time)
+        self.ids.insert(i, participant)
+
+    def remove(self, time, participant):
+        """
+        Removes the time of a participant. The position is found in O(log n), the removal itself is
+        an O(n) memmove.
+
+        Args:
+            time (float): The time in hours, as inserted.
+            participant (str): The participant.
+
+        Raises:
+            ValueError: If the participant does not have this time in the index.
+        """
+        i = self.ids.index(participant, bisect.bisect_left(self.times, time), bisect.bisect_right(self.times, time))
+        del self.times[i]
+        del self.ids[i]
+
+    def window(self, start, end):
+        """
+        Returns all entries with start <= time <= end in O(log n + k) for k results.
+
+        Args:
+            start (float): The earliest time in hours.
+            end (float): The latest time in hours.
+
+        Returns:
+            list of tuple: The (time, participant) pairs in the order of time.
+        """
+        lo = bisect.bisect_left(self.times, start)
+        hi = bisect.bisect_right(self.times, end)
+        return list(zip(self.times[lo:hi], self.ids[lo:hi]))
+
+    def groups(self, max_time_difference=0.5, max_people_per_car=3):
+        """
+        Groups the times with the sweep of `optimize_rideshares.sweep_clusters`, which needs no sorting
+        since the index is already sorted.
+
+        Args:
+            max_time_difference (float, optional): The maximum difference between any two times in a group. Defaults to 0.5.
+            max_people_per_car (int, optional): The maximum number of people in a group. Defaults to 3.
+
+        Returns:
+            numpy.ndarray: The group label of every entry in the order of the index, starting at 1.
+        """
+        return _sweep_sorted(_time_reach(np.array(self.times), max_time_difference), max_people_per_car)
+
+
+class MatchingService():
+    """Keeps the registered participants in sorted time indices and answers who can share a ride with whom."""
+    def __init__(self, max_time_difference=0.5, max_people_per_car=3, location_columns=None, time_format=None, tz=None):
+        """
+        Initializes the MatchingService class. Participants are identified by their email address,
+        registering the same address again replaces the earlier registration.
+
+        Args:
+            max_time_difference (float, optional): The maximum difference in hours between the times of
+                people who share a ride. Defaults to 0.5.
+            max_people_per_car (int, optional): The maximum number of people in a group of the snapshot. Defaults to 3.
+            location_columns (list of str, optional): The columns that have to match for people to share a ride,
+                see `optimize_rideshares.location_codes`. If None, `reader.LOCATION_COLUMNS`. Defaults to None.
+            time_format (str, optional): The strftime format of registered times, see `reader.parse_times`. Defaults to None.
+            tz (str, optional): The timezone of registered times, see `reader.parse_times`. Defaults to None.
+        """
+        self.max_time_difference = max_time_difference
+        self.max_people_per_car = max_people_per_car
+        self.location_columns = list(LOCATION_COLUMNS if location_columns is None else location_columns)
+        self.time_format = time_format
+        self.tz = tz
+        # email -> the registered row, with the times as the timezone-naive local wall time like the hand-off file
+        self.participants = {}
+        # email -> (location, {kind: hours})
+        self._entries = {}
+        # kind -> location -> TimeIndex
+        self.indices = {kind: {} for kind in TIME_COLUMNS}
+
+    def __len__(self):
+        return len(self.participants)
+
+    def _parse(self, values):
+        times = pd.Series(values)
+        if not pd.api.types.is_datetime64_any_dtype(times):
+            times = parse_times(times.astype(object), time_format=self.time_format, tz=self.tz)
+        # the hours count the real time between two times, also across a change to daylight saving time
+        hours = to_epoch_hours(times, tz=self.tz)
+        # keep the local wall time, which the review file and the emails show
+        if times.dt.tz is not None:
+            if self.tz is not None:
+                times = times.dt.tz_convert(self.tz)
+            times = times.dt.tz_localize(None)
+        return times, hours
+
+    def _parse_one(self, value):
+        # a single request is parsed without the vectorized `reader.parse_times`, which costs milliseconds per call
+        if value is None or pd.isna(value) or not str(value).strip():
+            return pd.NaT, np.nan
+        if self.time_format is not None:
+            time = pd.Timestamp(datetime.strptime(str(value).strip(), self.time_format))
+        else:
+            time = pd.Timestamp(str(value).strip())
+        if self.tz is not None and time.tz is None:
+            time = time.tz_localize(self.tz)
+        if time.tz is None:
+            return time, (time - EPOCH) / pd.Timedelta(hours=1)
+        hours = (time.tz_convert("UTC").tz_localize(None) - EPOCH) / pd.Timedelta(hours=1)
+        if self.tz is not None:
+            time = time.tz_convert(self.tz)
+        return time.tz_localize(None), hours
+
+    def _location(self, record):
+        return tuple(_normalize_location(record.get(column)) for column in self.location_columns)
+
+    def add(self, record):
+        """
+        Registers a participant with a binary search in O(log n) and an O(n) memmove per time, see `TimeIndex`.
+
+        Args:
+            record (dict): The row of the participant with at least 'Name', 'Email' and one of the time columns
+                in `reader.TIME_COLUMNS` as a date-time string. Location columns and any other columns are kept
+                for the snapshot.
+
+        Returns:
+            bool: True if the participant is new, False if an earlier registration was replaced.
+
+        Raises:
+            ValueError: If the name, the email address or both times are missing, or a time cannot be parsed.
+        """
+        record = dict(record)
+        for column in ["Name", "Email"]:
+            value = record.get(column)
+            if value is None or pd.isna(value) or not str(value).strip():
+                raise ValueError(f"'{column}' is missing")
+        record["Email"] = str(record["Email"]).strip()
+        hours = {}
+        for kind, column in TIME_COLUMNS.items():
+            record[column], hours[kind] = self._parse_one(record.get(column))
+        if all(np.isnan(value) for value in hours.values()):
+            raise ValueError("At least one of " + ", ".join(f"'{column}'" for column in TIME_COLUMNS.values()) + " is needed")
+        new = record["Email"] not in self.participants
+        if not new:
+            self.remove(record["Email"])
+        self.participants[record["Email"]] = record
+        self._entries[record["Email"]] = (self._location(record), hours)
+        for kind, value in hours.items():
+            if not np.isnan(value):
+                self.indices[kind].setdefault(self._location(record), TimeIndex()).insert(value, record["Email"])
+        return new
+
+    def add_dataframe(self, df):
+        """
+        Registers all participants of a DataFrame at once and rebuilds the indices in O(n log n),
+        e.g. to start from the google sheet or a hand-off file.
+
+        Args:
+            df (pandas.DataFrame): The participants, as returned by `reader.read_google_sheet` or `handoff.read_handoff`.
+                Rows without an email address are skipped, and later rows replace earlier ones with the same address.
+        """
+        df = df[df["Email"].notna()].copy()
+        df["Email"] = df["Email"].astype(str).str.strip()
+        hours = {}
+        for kind, column in TIME_COLUMNS.items():
+            df[column], hours[kind] = self._parse(df[column] if column in df.columns else pd.Series(pd.NaT, index=df.index))
+        for i, record in enumerate(df.to_dict("records")):
+            self.participants.pop(record["Email"], None)
+            self.participants[record["Email"]] = record
+            self._entries.pop(record["Email"], None)
+            self._entries[record["Email"]] = (self._location(record), {kind: float(hours[kind][i]) for kind in hours})
+        self._rebuild()
+
+    def _rebuild(self):
+        for kind in TIME_COLUMNS:
+            times, ids = {}, {}
+            for email, (location, hours) in self._entries.items():
+                if not np.isnan(hours[kind]):
+                    times.setdefault(location, []).append(hours[kind])
+                    ids.setdefault(location, []).append(email)
+            self.indices[kind] = {location: TimeIndex(times[location], ids[location]) for location in times}
+
+    def remove(self, email):
+        """
+        Removes a registration with a binary search in O(log n) and an O(n) memmove per time, see `TimeIndex`.
+
+        Args:
+            email (str): The email address of the participant.
+
+        Returns:
+            dict: The removed row.
+
+        Raises:
+            KeyError: If nobody is registered with this address.
+        """
+        location, hours = self._entries.pop(email)
+        for kind, value in hours.items():
+            if not np.isnan(value):
+                self.indices[kind][location].remove(value, email)
+        return self.participants.pop(email)
+
+    def _matches(self, kind, hours, location, exclude=None, limit=None):
+        index = self.indices[kind].get(location)
+        if index is None or np.isnan(hours):
+            return []
+        found = [(abs(time - hours), email) for time, email in
+                 index.window(hours - self.max_time_difference, hours + self.max_time_difference) if email != exclude]
+        found.sort(key=lambda match: match[0])
+        column = TIME_COLUMNS[kind]
+        return [{"Name": str(self.participants[email]["Name"]),
+                 "time": self.participants[email][column].isoformat(),
+                 "hours_apart": round(difference, 4)} for difference, email in found[:limit]]
+
+    def matches(self, email, limit=None):
+        """
+        Finds everybody a registered participant can share a ride with, i.e. all people at the same location whose
+        time differs by at most `max_time_difference`, in O(log n + k) for k results.
+
+        Args:
+            email (str): The email address of the participant.
+            limit (int, optional): The maximum number of matches per kind. If None, all matches. Defaults to None.
+
+        Returns:
+            dict: For 'arrival' and 'departure', a list of dicts with the 'Name', the 'time' and 'hours_apart'
+                of every match, closest first.
+
+        Raises:
+            KeyError: If nobody is registered with this address.
+        """
+        location, hours = self._entries[email]
+        return {kind: self._matches(kind, hours[kind], location, exclude=email, limit=limit) for kind in TIME_COLUMNS}
+
+    def search(self, record, limit=None):
+        """
+        Like `matches`, for somebody who has not registered yet.
+
+        Args:
+            record (dict): The time columns in `reader.TIME_COLUMNS` as date-time strings, and the location columns.
+                Missing times give no matches.
+            limit (int, optional): The maximum number of matches per kind. If None, all matches. Defaults to None.
+
+        Returns:
+            dict: The matches, see `matches`.
+
+        Raises:
+            ValueError: If a time cannot be parsed.
+        """
+        location = self._location(record)
+        return {kind: self._matches(kind, self._parse_one(record.get(column))[1], location, limit=limit)
+                for kind, column in TIME_COLUMNS.items()}
+
+    def snapshot(self):
+        """
+        Groups all registered participants in the format of `optimize_rideshares.optimize`, using the sweep of
+        `TimeIndex.groups` for every location. Since the indices are already sorted, this takes O(n).
+
+        The groups are the same as those of `optimize` with method='sweep' for the same participants. Somebody
+        without a time of one kind gets a group of their own in both, which is numbered after all others here.
+
+        Returns:
+            pandas.DataFrame: The registered rows with 'arrival_group' and 'departure_group' columns, sorted by groups.
+        """
+        with metrics.stage("service.snapshot"):
+            emails = list(self.participants)
+            position = {email: i for i, email in enumerate(emails)}
+            if emails:
+                df = pd.DataFrame([self.participants[email] for email in emails])
+            else:
+                df = pd.DataFrame(columns=["Name", "Email"] + list(TIME_COLUMNS.values()))
+            for kind in TIME_COLUMNS:
+                clusters = np.zeros(len(emails), dtype=np.int64)
+                offset = 0
+                for location in sorted(self.indices[kind], key=_location_order):
+                    index = self.indices[kind][location]
+                    if len(index) == 0:
+                        continue
+                    labels = index.groups(self.max_time_difference, self.max_people_per_car)
+                    clusters[[position[email] for email in index.ids]] = labels + offset
+                    offset += int(labels[-1])
+                missing = clusters == 0
+                clusters[missing] = offset + 1 + np.arange(np.count_nonzero(missing))
+                df[f"{kind}_group"] = clusters
+            return df.sort_values(by=["arrival_group", "departure_group"], ignore_index=True)
+
+
+def _response(status, payload):
+    if isinstance(payload, (bytes, str)):
+        content_type = "text/csv; charset=utf-8"
+        payload = payload.encode("utf-8") if isinstance(payload, str) else payload
+    else:
+        content_type = "application/json"
+        payload = json.dumps(payload).encode("utf-8")
+    return status, content_type, payload
+
+
+def handle_request(service, method, target, body=b"", output_file=None, token=None, headers=None):
+    """
+    Answers one HTTP request to the matching service.
+
+    The endpoints are:
+
+    - POST /participants with a JSON object as body registers a participant, see `MatchingService.add`,
+      and returns their matches.
+    - DELETE /participants?Email=... removes a registration.
+    - GET /matches?Email=... returns the matches of a registered participant, and
+      GET /matches?date_time_of_airport_arrival=...&Airport=... those of somebody who has not registered yet.
+      Both accept a 'limit' on the number of matches per kind.
+    - GET /snapshot returns the current groups as CSV, see `MatchingService.snapshot`.
+    - POST /snapshot writes them to output_file for review and to the hand-off file next to it, see
+      `run.write_for_review`, so that `spaceshare review` and `spaceshare send` can pick them up.
+    - GET /health returns the number of registered participants.
+
+    Since the participants are personal data, a service with a `token` answers all endpoints except
+    GET /health only if the request sends the token in the 'X-SpaceShare-Token' header.
+
+    Args:
+        service (MatchingService): The service.
+        method (str): The HTTP method.
+        target (str): The path and query of the request.
+        body (bytes, optional): The body of the request. Defaults to b"".
+        output_file (str, optional): The CSV file for POST /snapshot. Defaults to None.
+        token (str, optional): The shared token that requests have to send. If None, every request is answered.
+            Defaults to None.
+        headers (dict, optional): The headers of the request with lower case names. Defaults to None.
+
+    Returns:
+        tuple: The status code, the content type and the body of the response.
+    """
+    url = urlsplit(target)
+    query = dict(parse_qsl(url.query))
+    endpoint = (method, url.path.rstrip("/") or "/")
+    if token is not None and endpoint != ("GET", "/health"):
+        sent = (headers or {}).get(TOKEN_HEADER.lower(), "")
+        if not hmac.compare_digest(sent.encode("utf-8"), token.encode("utf-8")):
+            return _response(401, {"error": f"The {TOKEN_HEADER} header is missing or wrong"})
+    try:
+        limit = int(query.pop("limit")) if "limit" in query else None
+        if endpoint == ("POST", "/participants"):
+            record = json.loads(body or b"{}")
+            if not isinstance(record, dict):
+                raise ValueError("The body must be a JSON object")
+            new = service.add(record)
+            email = str(record["Email"]).strip()
+            return _response(201 if new else 200, {"Email": email, "matches": service.matches(email, limit)})
+        if endpoint == ("DELETE", "/participants"):
+            service.remove(query.get("Email"))
+            return _response(200, {"participants": len(service)})
+        if endpoint == ("GET", "/matches"):
+            if "Email" in query:
+                return _response(200, service.matches(query["Email"], limit))
+            return _response(200, service.search(query, limit))
+        if endpoint == ("GET", "/snapshot"):
+            return _response(200, service.snapshot().to_csv(index=False, date_format="%Y-%m-%d %H:%M:%S"))
+        if endpoint == ("POST", "/snapshot"):
+            if output_file is None:
+                return _response(409, {"error": "The service was started without an output file"})
+            df = service.snapshot()
+            handoff_file = write_for_review(df, output_file)
+            return _response(200, {"participants": len(df), "review": output_file, "handoff": handoff_file})
+        if endpoint == ("GET", "/health"):
+            return _response(200, {"participants": len(service)})
+        return _response(404, {"error": f"Unknown endpoint {method} {url.path}"})
+    except KeyError as err:
+        return _response(404, {"error": f"Nobody is registered with the email address {err}"})
+    except (ValueError, TypeError) as err:
+        return _response(400, {"error": str(err)})
+
+
+async def _serve_connection(service, reader, writer, output_file, token):
+    """
+    Answers the HTTP/1.1 requests of one connection until the client closes it or asks to close it.
+    Requests with a body larger than MAX_BODY_BYTES are refused without reading the body.
+    """
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line.strip():
+                break
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            keep_alive = headers.get("connection", "").lower() != "close"
+            try:
+                method, target, version = request_line.decode("latin-1").split()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    # the body is never read, so the connection cannot be used for another request
+                    status, content_type, payload = _response(413, {"error": f"The body is larger than {MAX_BODY_BYTES} bytes"})
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    keep_alive = keep_alive and version == "HTTP/1.1"
+                    status, content_type, payload = handle_request(service, method, target, body, output_file,
+                                                                   token, headers)
+            except ValueError:
+                status, content_type, payload = _response(400, {"error": "Malformed request"})
+                keep_alive = False
+            except Exception as err:
+                status, content_type, payload = _response(500, {"error": repr(err)})
+            metrics.count(f"service.status.{status}")
+            writer.write(f"HTTP/1.1 {status} {http.HTTPStatus(status).phrase}\r\n"
+                         f"Content-Type: {content_type}\r\nContent-Length: {len(payload)}\r\n"
+                         f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+def is_loopback(host):
+    """
+    Checks whether an address to listen on is only reachable from the same machine.
+
+    Args:
+        host (str): The address or host name.
+
+    Returns:
+        bool: True for 'localhost' and loopback addresses like '127.0.0.1' and '::1'.
+    """
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+async def start_server(service, host="127.0.0.1", port=8080, output_file=None, token=None):
+    """
+    Starts the HTTP server of the matching service on the running event loop, see `handle_request` for the endpoints.
+
+    All requests are answered on the event loop thread, so the service needs no locks.
+
+    Args:
+        service (MatchingService): The service.
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on, 0 picks a free one. Defaults to 8080.
+        output_file (str, optional): The CSV file for POST /snapshot. Defaults to None.
+        token (str, optional): The shared token that requests have to send, see `handle_request`. Defaults to None.
+
+    Returns:
+        asyncio.Server: The server.
+
+    Raises:
+        AssertionError: If the host is reachable from other machines and no token is given.
+    """
+    if token is None and not is_loopback(host):
+        raise AssertionError(f"Error: listening on {host} exposes the participants to other machines, "
+                             +"which needs a token!")
+    return await asyncio.start_server(
+        lambda reader, writer: _serve_connection(service, reader, writer, output_file, token), host, port)
+
+
+def serve(service, host="127.0.0.1", port=8080, output_file=None, token=None):
+    """
+    Runs the matching service until it is interrupted with Ctrl+C.
+
+    Args:
+        service (MatchingService): The service.
+        host (str, optional): The address to listen on. Defaults to '127.0.0.1'.
+        port (int, optional): The port to listen on. Defaults to 8080.
+        output_file (str, optional): The CSV file for POST /snapshot. Defaults to None.
+        token (str, optional): The shared token that requests have to send, see `handle_request`. Defaults to None.
+
+    Raises:
+        AssertionError: If the host is reachable from other machines and no token is given.
+    """
+    async def main():
+        server = await start_server(service, host, port, output_file, token)
+        print(f"Serving {len(service)} participants on http://{host}:{server.sockets[0].getsockname()[1]}")
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -2,22 +2,36 @@
 from getpass import getpass
 import smtplib
 from email.message import EmailMessage
-import numpy as np
+import functools
 import pandas as pd
+from dataclasses import asdict
+from .dispatch import RateLimiter, dispatch_emails
+from .render import render_messages
+from .outbox import Outbox
+from . import metrics
 
 # This class handles the process of sending emails
 class EmailHandler():
     """A class to handle email operations including sending emails and reading email content from a file."""
-    def __init__(self, email_username, email_domain="smtp.gmail.com", port=587, password=None, verbose=False):
+    def __init__(self, email_username, email_domain="smtp.gmail.com", port=587, password=None, verbose=False,
+                 max_messages_per_session=100, use_tls=True):
         """
-        Initializes the EmailHandler class.
+        Initializes the EmailHandler class and opens an authenticated SMTP session.
+
+        The session is kept open and shared by all subsequent calls to `write_email`. It is reopened
+        automatically after the server drops the connection, after a 421 (service not available) reply,
+        and after `max_messages_per_session` messages have been sent through it.
 
         Args:
             email_username (str): The username of the email.
             email_domain (str, optional): The email domain. Defaults to 'smtp.gmail.com'.
             port (int, optional): The port to use for SMTP. Defaults to 587.
-            password (str, optional): The password of the email. If None, prompts for input. Defaults to None.
+            password (str, optional): The password of the email. If None, prompts for input.
+                An empty string skips the login step. Defaults to None.
             verbose (bool, optional): If True, prints login attempts. Defaults to False.
+            max_messages_per_session (int, optional): The number of messages after which the session
+                is closed and reopened. Defaults to 100.
+            use_tls (bool, optional): If True, upgrades the connection with STARTTLS. Defaults to True.
 
         Raises:
             SMTPAuthenticationError: If email login fails.
@@ -31,15 +45,77 @@ class EmailHandler():
         self.domain = email_domain
         self.verbose = verbose
         self.port = port
+        self.max_messages_per_session = max_messages_per_session
+        self.use_tls = use_tls
+        self._server = None
+        self._session_messages = 0
         if self.verbose:
             print("Trying login...")
-        # Create an SMTP server instance and log in
-        with smtplib.SMTP(self.domain, self.port) as server:
-            server.starttls()  # Upgrade the connection to a secure one using TLS
-            server.login(self.username, self.password)
+        self.connect()
         if self.verbose:
             print("... success!")
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def connect(self):
+        """
+        Opens a new SMTP session, closing the current one first if there is any.
+
+        Raises:
+            SMTPAuthenticationError: If email login fails.
+        """
+        self.close()
+        server = smtplib.SMTP(self.domain, self.port)
+        try:
+            if self.use_tls:
+                server.starttls()  # Upgrade the connection to a secure one using TLS
+            if self.password:
+                server.login(self.username, self.password)
+        except BaseException:
+            server.close()
+            raise
+        self._server = server
+        self._session_messages = 0
+
+    def close(self):
+        """
+        Closes the current SMTP session, if there is one.
+        """
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except (smtplib.SMTPServerDisconnected, OSError):
+            self._server.close()
+        self._server = None
+
+    def send_message(self, msg):
+        """
+        Sends an already composed message through the shared SMTP session.
+
+        The message is sent again on a fresh session if the server has dropped the connection
+        or answered with 421.
+
+        Args:
+            msg (email.message.EmailMessage): The message to send.
+        """
+        if self._server is None or self._session_messages >= self.max_messages_per_session:
+            self.connect()
+        try:
+            self._server.send_message(msg)
+        except (smtplib.SMTPServerDisconnected, ConnectionError, smtplib.SMTPResponseException) as err:
+            if isinstance(err, smtplib.SMTPResponseException) and err.smtp_code != 421:
+                raise
+            if self.verbose:
+                print("Connection lost, reconnecting...")
+            self.connect()
+            self._server.send_message(msg)
+        self._session_messages += 1
+
     # Function to write and send an email
     def write_email(self, email_address, subject, content, from_address=None):
         """
@@ -70,10 +146,7 @@ class EmailHandler():
         msg['To'] = email_address
         msg['Subject'] = subject
         # Send the email
-        with smtplib.SMTP(self.domain, self.port) as server:
-            server.starttls()
-            server.login(self.username, self.password)
-            server.send_message(msg)
+        self.send_message(msg)
         return 0
     
 
@@ -93,14 +166,20 @@ class EmailHandler():
             FileNotFoundError: If the provided textfile path does not exist.
         """
 
-        with open(textfile) as fp:
-            # Read the file and replace placeholder names
-            content = fp.read().replace("YOURNAME", sender_name).replace("RECIPIENTNAME", recipient_name)
-        return content
+        # Read the file once and replace placeholder names
+        return _read_textfile(textfile).replace("YOURNAME", sender_name).replace("RECIPIENTNAME", recipient_name)
+
+
+@functools.lru_cache(maxsize=None)
+def _read_textfile(textfile):
+    with open(textfile) as fp:
+        return fp.read()
 
 
 def send_emails(df,email_username, email_smtp_domain, email_password=None, email_smtp_port=587,
-                dry_run=False):
+                dry_run=False, max_messages_per_session=100, workers=1, max_per_second=None,
+                max_per_minute=None, max_retries=3, groups=None, template_dir=None, email_use_tls=True,
+                outbox=None, consolidate=False, kinds=("arrival", "departure")):
     """
     Function that sends emails to the participants of a ride share program based on groups created.
 
@@ -118,91 +197,180 @@ def send_emails(df,email_username, email_smtp_domain, email_password=None, email
         The password of the email to be used to send emails. If None, user will be prompted for password. Default is None.
     email_smtp_port : int, optional
         The SMTP port to be used for the email server. Default is 587.
+    dry_run : bool, optional
+        If True, prints the emails instead of sending them, or only writes them to the outbox if one
+        is given. Default is False.
+    max_messages_per_session : int, optional
+        The number of emails sent through one SMTP session before it is reopened. Default is 100.
+    workers : int, optional
+        The number of emails sent concurrently, each worker using its own SMTP session. Default is 1.
+    max_per_second : float, optional
+        The maximum number of emails sent per second. None means no limit. Default is None.
+    max_per_minute : float, optional
+        The maximum number of emails sent per minute. None means no limit. Default is None.
+    max_retries : int, optional
+        The number of retries, with exponential backoff, after a transient SMTP error. Default is 3.
+    groups : dict, optional
+        Maps "arrival" and "departure" to the group IDs that should be emailed, e.g. the changed groups
+        returned by `optimize_rideshares.reoptimize`. If None, all groups are emailed. Default is None.
+    template_dir : str, optional
+        A directory with custom email templates, see `render.render_messages`. Default is None.
+    email_use_tls : bool, optional
+        If True, the SMTP connections are upgraded with STARTTLS. Default is True.
+    outbox : str or outbox.Outbox, optional
+        The directory of an outbox, see `outbox.Outbox`. If given, the emails are written to it before they
+        are sent, every sent email is recorded in it, and emails that were already sent by an earlier,
+        interrupted run are skipped. If None, nothing is stored. Default is None.
+    consolidate : bool, optional
+        If True, every participant gets one email about their arrival and departure instead of one per
+        ride, see `render.render_messages`. Participants with the same arrival and departure groups share
+        an email. Default is False.
+    kinds : tuple, optional
+        The groups to email, "arrival", "departure" and "room" for the "room_group" column of
+        `optimize_rooms.optimize_rooms`. Default is ("arrival", "departure").
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per email with the columns "kind", "group", "recipients", "subject", "status"
+        ("sent", "failed", "skipped" if it was already sent, or "dry_run"), "attempts" and "error".
 
     Raises
     ------
     AssertionError
         If 'arrival_group' and 'departure_group' columns are not found in the DataFrame.
     """
-    
-    eh = EmailHandler(email_username, email_domain = email_smtp_domain, 
-                      port = email_smtp_port, password = email_password, verbose=True)
-    # df = pd.read_csv("optimized_clustering.csv")
-    if not ("arrival_group" in df.columns and "departure_group" in df.columns):
-        raise AssertionError("Error: arrival_group and departure_group columns not found in dataframe! \n"\
-                             +"Please run the optimize routine first")
-
-    helperstr = {}
-    helperstr["arrival"] = """based on your planned arrival times, we suggest that you share a ride from the airport to your hotel.
-You have said that you want to leave the airport at the following times"""
-    helperstr["departure"] = """based on your planned departure times, we suggest that you share a ride from your hotel to the airport.
-You have said that you want to leave the hotel at the following times"""
-    colnames = {}
-    colnames["arrival"] = "date_time_of_airport_arrival"
-    colnames["departure"] = "date_time_of_hotel_departure"
-    for kind in ["arrival", "departure"]:
-        groups = np.unique(df[f"{kind}_group"])
-        for group in groups:
-            mask = (df[f"{kind}_group"] == group)
-            names = df["Name"][mask].values
-            first_names = []
-            for name in names:
-                first_names.append(name.split(" ")[0]) #only address by first names
-            arrival_times = df[colnames[kind]][mask].values
-            emails = list(df["Email"][mask].values)
-            phone_numbers = list(df["Phone_number"][mask].values)
-        
-            address = ""
-            for name in first_names:
-                address += name+", "
-            
-            deptimes = ""
-            for x in range(len(first_names)):
-                deptimes += "\t"+names[x]+": "+pd.to_datetime(arrival_times[x]).strftime("%b %d, %I:%M %p")
-                # if not phone_numbers[x]=="NaN":
-                #     deptimes +=", contact number: "+phone_numbers[x]
-                # TODO: to implement in later release
-                deptimes +="\n "
-            message = f"""
-Dear {address}
-
-{helperstr[kind]}:\n{deptimes}
-Please contact each other and organize a ride together. If you have any questions, please contact us.
-
-Best regards,
-    The code/astro Team
-            """
-            print("Writing to: ",emails)
-            # print(message)
-        
-    # Compose arrival message
-            if np.sum(mask) < 2:
-                if(kind == "arrival"):
-                    content=f"""Dear {first_names[0]},
-We are writing to you because you have indicated that you would like to share a ride from the airport to your hotel.
-Unfortunately, we have not been able to find any other participants who arrive at the same time.
-If you would like to share a ride, please contact us and we will try to find a solution.
-
-Best regards,
-    The code/astro Team"""
-                else:
-                    content=f"""Dear {first_names[0]},
-We are writing to you because you have indicated that you would like to share a ride from your hotel to the airport.
-Unfortunately, we have not been able to find any other participants who depart at the same time.
-If you would like to share a ride, please contact us and we will try to find a solution.
-
-Best regards,
-    The code/astro Team"""
-                if dry_run:
-                    print("Email subject: ",f"[code/astro] Rideshare for your {kind}")
-                    print("Email content: ",content)
-                else:
-                    eh.write_email(emails, subject=f"[code/astro] Rideshare for your {kind}", 
-                                content = content)
-            else: # more than 2 people in the group
-                if(dry_run):
-                    print("Email subject: ",f"[code/astro] Rideshare for your {kind}")
-                    print("Email content: ",message)
-                else:
-                    eh.write_email(emails, subject=f"[code/astro] Rideshare for your {kind}", 
-                                content=message)
+    messages = render_messages(df, kinds=kinds, groups=groups, template_dir=template_dir, consolidate=consolidate)
+    return send_messages(messages, email_username, email_smtp_domain, email_password=email_password,
+                         email_smtp_port=email_smtp_port, dry_run=dry_run,
+                         max_messages_per_session=max_messages_per_session, workers=workers,
+                         max_per_second=max_per_second, max_per_minute=max_per_minute,
+                         max_retries=max_retries, email_use_tls=email_use_tls, outbox=outbox)
+
+
+def send_messages(messages, email_username, email_smtp_domain, email_password=None, email_smtp_port=587,
+                  dry_run=False, max_messages_per_session=100, workers=1, max_per_second=None,
+                  max_per_minute=None, max_retries=3, email_use_tls=True, outbox=None):
+    """
+    Sends already rendered messages through one rate-limited pool of SMTP sessions.
+
+    Parameters
+    ----------
+    messages : list of render.Message
+        The messages to send, e.g. from `render.render_messages`.
+
+    The remaining parameters and the return value are the same as for `send_emails`.
+    """
+    if outbox is not None and not isinstance(outbox, Outbox):
+        outbox = Outbox(outbox)
+    with metrics.stage("send"):
+        skipped = [False] * len(messages)
+        message_ids = None
+        if outbox is not None:
+            with metrics.stage("send.spool"):
+                message_ids = outbox.spool(messages)
+            delivered = outbox.delivered()
+            skipped = [spooled_id in delivered for spooled_id in message_ids]
+        if not dry_run and any(skipped):
+            print(f"Skipping {sum(skipped)} emails that were already sent")
+        report = _deliver(messages, skipped, message_ids, outbox, dry_run, show=outbox is None,
+                          email_username=email_username, email_smtp_domain=email_smtp_domain,
+                          email_password=email_password, email_smtp_port=email_smtp_port,
+                          max_messages_per_session=max_messages_per_session, workers=workers,
+                          max_per_second=max_per_second, max_per_minute=max_per_minute,
+                          max_retries=max_retries, email_use_tls=email_use_tls)
+        if dry_run and outbox is not None:
+            print(f"Wrote {len(messages)} emails to {outbox.directory}")
+    return _report(report)
+
+
+def drain_outbox(outbox, email_username, email_smtp_domain, email_password=None, email_smtp_port=587,
+                 dry_run=False, max_messages_per_session=100, workers=1, max_per_second=None,
+                 max_per_minute=None, max_retries=3, email_use_tls=True):
+    """
+    Sends the messages of an outbox that have not been delivered yet, exactly as they were written to it.
+
+    Nothing is rendered again, so an interrupted run can be finished even if the sheet or the templates
+    have changed since.
+
+    Parameters
+    ----------
+    outbox : str or outbox.Outbox
+        The outbox, see `outbox.Outbox`.
+    dry_run : bool, optional
+        If True, prints the pending emails instead of sending them. Default is False.
+
+    The remaining parameters and the return value are the same as for `send_emails`.
+    """
+    if not isinstance(outbox, Outbox):
+        outbox = Outbox(outbox)
+    with metrics.stage("send"):
+        message_ids = outbox.pending()
+        messages = [outbox.load(pending_id) for pending_id in message_ids]
+        report = _deliver(messages, [False] * len(messages), message_ids, outbox, dry_run, show=True,
+                          email_username=email_username, email_smtp_domain=email_smtp_domain,
+                          email_password=email_password, email_smtp_port=email_smtp_port,
+                          max_messages_per_session=max_messages_per_session, workers=workers,
+                          max_per_second=max_per_second, max_per_minute=max_per_minute,
+                          max_retries=max_retries, email_use_tls=email_use_tls)
+    return _report(report)
+
+
+def _deliver(messages, skipped, message_ids, outbox, dry_run, show, email_username, email_smtp_domain,
+             email_password, email_smtp_port, max_messages_per_session, workers, max_per_second,
+             max_per_minute, max_retries, email_use_tls):
+    """
+    Sends the messages that are not skipped and records them in the outbox, if there is one.
+    Returns one report entry per message.
+    """
+    if dry_run:
+        # log in anyway, so that wrong credentials show up before the real run
+        EmailHandler(email_username, email_domain = email_smtp_domain,
+                     port = email_smtp_port, password = email_password, verbose=True,
+                     max_messages_per_session = max_messages_per_session, use_tls = email_use_tls).close()
+        if show:
+            for message in messages:
+                print("Email subject: ",message.subject)
+                print("Email content: ",message.content)
+        return [dict(asdict(message), status="dry_run", attempts=0, error=None) for message in messages]
+
+    pending = [message for message, skip in zip(messages, skipped) if not skip]
+    results = []
+    if pending:
+        eh = EmailHandler(email_username, email_domain = email_smtp_domain,
+                          port = email_smtp_port, password = email_password, verbose=True,
+                          max_messages_per_session = max_messages_per_session, use_tls = email_use_tls)
+        idle_handlers = [eh]
+
+        def handler_factory():
+            # the first worker takes over the session that verified the login
+            if idle_handlers:
+                return idle_handlers.pop()
+            return EmailHandler(email_username, email_domain = email_smtp_domain,
+                                port = email_smtp_port, password = eh.password,
+                                max_messages_per_session = max_messages_per_session, use_tls = email_use_tls)
+
+        on_sent = None
+        if outbox is not None:
+            # the IDs under which the messages are stored, by message object
+            ids = {id(message): message_id for message, message_id in zip(messages, message_ids)}
+
+            def on_sent(message):
+                outbox.mark_delivered(ids[id(message)])
+
+        results = dispatch_emails(pending, handler_factory, workers=workers,
+                                  rate_limiter=RateLimiter(max_per_second, max_per_minute),
+                                  max_retries=max_retries, on_sent=on_sent)
+        eh.close()
+    # fill in the skipped messages, keeping the order of the messages
+    results = iter(results)
+    return [dict(asdict(message), status="skipped", attempts=0, error=None) if skip else next(results)
+            for message, skip in zip(messages, skipped)]
+
+
+def _report(report):
+    report = pd.DataFrame(report, columns=["kind", "group", "recipients", "subject", "status", "attempts", "error"])
+    for status, number in report["status"].value_counts().items():
+        metrics.count(f"messages.{status}", int(number))
+    metrics.count("messages.retries", int((report["attempts"] - 1).clip(lower=0).sum()))
+    return report
@@ -0,0 +1,48 @@
+"""
+Benchmark of the clustering engines of `optimize`: Ward linkage versus the sort-and-sweep engine.
+
+Ward linkage needs the full pairwise distance matrix, so it is skipped above --max-ward participants.
+
+Usage:
+    python benchmarks/bench_clustering.py [--sizes 1000 100000 1000000] [--max-ward 20000]
+"""
+import argparse
+import time
+
+from synthetic import make_times
+from scipy.cluster.hierarchy import linkage, fcluster
+from SpaceShare.optimize_rideshares import sweep_clusters
+
+
+def time_ward(times, max_time_difference, max_people_per_car):
+    start = time.perf_counter()
+    Z = linkage(times.reshape(-1, 1), 'ward')
+    fcluster(Z, max_time_difference, criterion='distance')
+    return time.perf_counter() - start
+
+
+def time_sweep(times, max_time_difference, max_people_per_car):
+    start = time.perf_counter()
+    sweep_clusters(times, max_time_difference, max_people_per_car)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--max-ward", type=int, default=20000)
+    parser.add_argument("--max-wait-time", type=float, default=0.5)
+    parser.add_argument("--max-people-per-car", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'participants':>12} {'ward [s]':>10} {'sweep [s]':>10}")
+    for n in args.sizes:
+        times = make_times(n)
+        if n <= args.max_ward:
+            ward = f"{time_ward(times, args.max_wait_time, args.max_people_per_car):10.3f}"
+        else:
+            gigabytes = n * (n - 1) / 2 * 8 / 1e9
+            ward = f"{'skipped':>10}"
+            print(f"# ward skipped for n={n}: the distance matrix alone needs {gigabytes:.0f} GB")
+        sweep = time_sweep(times, args.max_wait_time, args.max_people_per_car)
+        print(f"{n:>12} {ward} {sweep:10.3f}")
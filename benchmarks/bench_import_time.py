@@ -0,0 +1,54 @@
+"""
+Benchmark of the start-up time of the `spaceshare` command: every command is run in a fresh interpreter
+and compared with a bare `python -c pass`. It also checks that the light commands do not load any of
+the heavy dependencies, and exits with status 1 if one of them does.
+
+Usage:
+    python benchmarks/bench_import_time.py [--repeat 10]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+TEST_CONFIG = os.path.join(os.path.dirname(__file__), os.pardir, "tests", "test.cfg")
+COMMANDS = {
+    "python -c pass": ["-c", "pass"],
+    "spaceshare --help": ["-m", "SpaceShare", "--help"],
+    "spaceshare validate": ["-m", "SpaceShare", "validate", TEST_CONFIG],
+    "import SpaceShare.run": ["-c", "import SpaceShare.run"],
+}
+HEAVY_MODULES = ["numpy", "pandas", "scipy", "pyarrow", "smtplib", "email.message", "urllib.request"]
+LIGHT_IMPORTS = ["SpaceShare", "SpaceShare.cli", "SpaceShare.config"]
+
+
+def time_command(args, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, check=True, stdout=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def heavy_modules_loaded(module):
+    code = f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True).stdout.split()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    for name, command in COMMANDS.items():
+        print(f"{name:>24}: {time_command(command, args.repeat) * 1000:7.1f} ms")
+
+    failed = False
+    for module in LIGHT_IMPORTS:
+        loaded = heavy_modules_loaded(module)
+        if loaded:
+            failed = True
+            print(f"import {module} loads {', '.join(loaded)}")
+    sys.exit(int(failed))
@@ -0,0 +1,36 @@
+"""
+Benchmark of EmailHandler against a local SMTP stand-in: one session per message (the old behaviour)
+versus one long-lived session that is reused for all messages.
+
+Usage:
+    python benchmarks/bench_smtp_session.py [--messages 500] [--connect-delay 0.05]
+"""
+import argparse
+import time
+
+from smtp_standin import StandInSMTPServer
+from SpaceShare.write_email import EmailHandler
+
+
+def run(n_messages, messages_per_session, connect_delay):
+    with StandInSMTPServer(connect_delay=connect_delay) as server:
+        start = time.perf_counter()
+        with EmailHandler("benchmark", email_domain="127.0.0.1", port=server.port, password="",
+                          use_tls=False, max_messages_per_session=messages_per_session) as eh:
+            for i in range(n_messages):
+                eh.write_email(["rider@example.org"], subject=f"Rideshare {i}", content="Hello",
+                               from_address="organizer@example.org")
+        elapsed = time.perf_counter() - start
+        return n_messages / elapsed, server.connections
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=500)
+    parser.add_argument("--connect-delay", type=float, default=0.05,
+                        help="simulated TLS handshake and login latency per connection in seconds")
+    args = parser.parse_args()
+
+    for label, per_session in [("one session per message", 1), ("shared session", 100)]:
+        rate, connections = run(args.messages, per_session, args.connect_delay)
+        print(f"{label:>25}: {rate:8.1f} messages/s ({connections} connections)")
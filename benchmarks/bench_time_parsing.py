@@ -0,0 +1,53 @@
+"""
+Benchmark of the time handling on a large synthetic sheet: the old per-cell `pd.to_datetime` list
+comprehension plus `Series.apply(get_time_of_year)` versus `clean_dataframe` with an explicit format
+followed by the vectorized `to_epoch_hours`.
+
+The old path is only timed on the first --old-rows rows and extrapolated linearly.
+
+Usage:
+    python benchmarks/bench_time_parsing.py [--rows 1000000] [--old-rows 20000]
+"""
+import argparse
+import time
+
+import pandas as pd
+from synthetic import make_sheet
+from SpaceShare.optimize_rideshares import get_time_of_year
+from SpaceShare.reader import TIME_COLUMNS, clean_dataframe, to_epoch_hours
+
+TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+
+def old_path(sheet):
+    df = sheet.drop(columns="Timestamp")
+    for column in TIME_COLUMNS.values():
+        df[column] = [pd.to_datetime(tt) for tt in df[column]]
+    return {kind: df[column].apply(get_time_of_year) for kind, column in TIME_COLUMNS.items()}
+
+
+def new_path(sheet):
+    df = clean_dataframe(sheet, time_format=TIME_FORMAT)
+    return {kind: to_epoch_hours(df[column]) for kind, column in TIME_COLUMNS.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--old-rows", type=int, default=20000)
+    args = parser.parse_args()
+
+    sheet = make_sheet(args.rows)
+
+    old_rows = min(args.old_rows, args.rows)
+    start = time.perf_counter()
+    old_path(sheet.iloc[:old_rows])
+    old = (time.perf_counter() - start) * args.rows / old_rows
+
+    start = time.perf_counter()
+    new_path(sheet)
+    new = time.perf_counter() - start
+
+    print(f"rows: {args.rows}")
+    print(f"per-row parsing (extrapolated from {old_rows} rows): {old:8.2f} s")
+    print(f"vectorized parsing and epoch hours:                {new:8.2f} s")
@@ -0,0 +1,146 @@
+"""
+Load test of the matching service: many concurrent clients register new participants and ask who they
+can share a ride with, over keep-alive HTTP connections, while the service holds a synthetic event.
+
+Unless --port is given, a service seeded with --participants synthetic participants is started in a
+background thread of this process. Otherwise the requests go to a service that is already running,
+e.g. `spaceshare serve --empty`. A service started with SPACESHARE_TOKEN needs the same --token, which
+defaults to SPACESHARE_TOKEN.
+
+Usage:
+    python benchmarks/load_test_service.py [--participants 20000] [--requests 20000] [--connections 50]
+                                           [--insert-fraction 0.3] [--port 8080] [--token TOKEN]
+"""
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from synthetic import make_sheet
+
+from SpaceShare.reader import clean_dataframe
+from SpaceShare.service import TOKEN_HEADER, MatchingService, start_server
+
+TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+
+def start_in_thread(n_participants, token=None):
+    """
+    Starts a seeded service on a free port in a daemon thread and returns the port.
+    """
+    service = MatchingService(time_format=TIME_FORMAT)
+    service.add_dataframe(clean_dataframe(make_sheet(n_participants, airports=3, hotels=5), time_format=TIME_FORMAT))
+    started = threading.Event()
+    ports = []
+
+    async def main():
+        server = await start_server(service, port=0, token=token)
+        ports.append(server.sockets[0].getsockname()[1])
+        started.set()
+        await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+    started.wait()
+    return ports[0]
+
+
+async def request(reader, writer, method, target, body=b"", token=None):
+    headers = "" if token is None else f"{TOKEN_HEADER}: {token}\r\n"
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\n{headers}Content-Length: {len(body)}\r\n\r\n".encode()
+                 + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def client(host, port, jobs, latencies, statuses, token):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while jobs:
+            endpoint, method, target, body = jobs.pop()
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, target, body, token)
+            latencies[endpoint].append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def make_jobs(n_requests, insert_fraction, seed=1):
+    """
+    Builds the requests: registrations of new synthetic participants, matches of participants registered
+    by the load test, and searches for times of people who have not registered.
+    """
+    rng = np.random.default_rng(seed)
+    sheet = make_sheet(n_requests, airports=3, hotels=5, seed=seed).drop(columns="Timestamp")
+    sheet["Email"] = "load-" + sheet["Email"]
+    records = sheet.to_dict("records")
+    jobs = []
+    registered = 0
+    for i in range(n_requests):
+        if registered == 0 or rng.random() < insert_fraction:
+            jobs.append(("register", "POST", "/participants?limit=10", json.dumps(records[registered]).encode()))
+            registered += 1
+        elif rng.random() < 0.5:
+            email = records[rng.integers(registered)]["Email"]
+            jobs.append(("matches", "GET", f"/matches?limit=10&Email={email}", b""))
+        else:
+            record = records[rng.integers(len(records))]
+            jobs.append(("search", "GET", "/matches?limit=10&date_time_of_airport_arrival="
+                         + record["date_time_of_airport_arrival"].replace(" ", "%20")
+                         + "&Airport=" + record["Airport"].replace(" ", "%20"), b""))
+    # the clients pop from the end, so registrations come before the matches that need them
+    return jobs[::-1]
+
+
+async def load_test(host, port, n_requests, n_connections, insert_fraction, token=None):
+    jobs = make_jobs(n_requests, insert_fraction)
+    latencies = {"register": [], "matches": [], "search": []}
+    statuses = {}
+    start = time.perf_counter()
+    await asyncio.gather(*[client(host, port, jobs, latencies, statuses, token) for _ in range(n_connections)])
+    elapsed = time.perf_counter() - start
+
+    reader, writer = await asyncio.open_connection(host, port)
+    snapshot_start = time.perf_counter()
+    status, body = await request(reader, writer, "GET", "/snapshot", token=token)
+    snapshot_seconds = time.perf_counter() - snapshot_start
+    writer.close()
+    return elapsed, latencies, statuses, snapshot_seconds, body.count(b"\n") - 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--participants", type=int, default=20000, help="participants of the seeded service")
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--connections", type=int, default=50, help="concurrent keep-alive connections")
+    parser.add_argument("--insert-fraction", type=float, default=0.3, help="fraction of requests that register somebody")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, help="the port of a running service, if not given one is started")
+    parser.add_argument("--token", default=os.environ.get("SPACESHARE_TOKEN") or None,
+                        help="the token of the service (default: SPACESHARE_TOKEN)")
+    args = parser.parse_args()
+
+    port = args.port
+    if port is None:
+        start = time.perf_counter()
+        port = start_in_thread(args.participants, args.token)
+        print(f"Seeded the service with {args.participants} participants in {time.perf_counter() - start:.2f} s")
+    elapsed, latencies, statuses, snapshot_seconds, snapshot_rows = asyncio.run(
+        load_test(args.host, port, args.requests, args.connections, args.insert_fraction, args.token))
+
+    print(f"{args.requests} requests over {args.connections} connections in {elapsed:.2f} s "
+          +f"({args.requests / elapsed:.0f} requests/s), status codes {statuses}")
+    for endpoint, values in latencies.items():
+        if values:
+            p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+            print(f"{endpoint:>10}: {len(values):6d} requests, latency p50 {p50:.2f} ms, p95 {p95:.2f} ms, p99 {p99:.2f} ms")
+    print(f"  snapshot: {snapshot_rows} participants grouped in {snapshot_seconds * 1000:.0f} ms")
@@ -0,0 +1,216 @@
+"""
+Benchmark suite for the SpaceShare pipeline on synthetic participant sheets.
+
+Every case is timed on several sizes (best of --repeat runs) and all results are written to a JSON
+file. Passing an earlier results file with --compare reports the change of every case and exits with
+status 1 if any case got slower than the tolerance, so regressions are caught before a release.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--quick] [--output benchmark_results.json]
+                                        [--compare old_results.json] [--tolerance 0.25]
+"""
+import argparse
+import atexit
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+from smtp_standin import StandInSMTPServer
+from synthetic import make_sheet
+
+import SpaceShare
+from SpaceShare.cache import Response, SheetCache, StageCache
+from SpaceShare.optimize_rideshares import optimize, split_large_clusters, sweep_parameters
+from SpaceShare.optimize_rooms import optimize_rooms
+from SpaceShare.pipeline import Pipeline
+from SpaceShare.reader import TIME_COLUMNS, clean_dataframe, to_epoch_hours
+from SpaceShare.render import render_messages
+from SpaceShare.write_email import send_emails
+
+TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+MAX_WAIT_TIME = 0.5
+MAX_PEOPLE_PER_CAR = 3
+
+
+def cleaned(n, **venues):
+    return clean_dataframe(make_sheet(n, **venues), time_format=TIME_FORMAT)
+
+
+def optimized(n):
+    df = cleaned(n)
+    for kind in TIME_COLUMNS:
+        optimize(df, kind, MAX_WAIT_TIME, MAX_PEOPLE_PER_CAR, method="sweep")
+    return df
+
+
+def bench_parse(n):
+    sheet = make_sheet(n)
+    return lambda: clean_dataframe(sheet, time_format=TIME_FORMAT)
+
+
+def bench_optimize(method, kind, **venues):
+    def setup(n):
+        df = cleaned(n, **venues)
+        return lambda: optimize(df, kind, MAX_WAIT_TIME, MAX_PEOPLE_PER_CAR, method=method)
+    return setup
+
+
+def bench_sweep_parameters(method):
+    # a 50 x 10 grid, compare with the optimize cases of the same method
+    def setup(n):
+        df = cleaned(n)
+        return lambda: sweep_parameters(df, "arrival", np.linspace(0.1, 2.0, 50), range(2, 12), method=method)
+    return setup
+
+
+def bench_rooms(n):
+    df = cleaned(n, hotels=8)
+    return lambda: optimize_rooms(df)
+
+
+def bench_split(n):
+    # one label per flight burst, so nearly every cluster is oversized and has to be split
+    times = to_epoch_hours(cleaned(n)[TIME_COLUMNS["arrival"]])
+    clusters = np.unique(np.floor(times / 2), return_inverse=True)[1] + 1
+    return lambda: split_large_clusters(clusters.copy(), times, MAX_PEOPLE_PER_CAR)
+
+
+def bench_render(n):
+    df = optimized(n)
+    return lambda: render_messages(df)
+
+
+def bench_send_dry_run(n):
+    df = optimized(n)
+
+    def run():
+        with StandInSMTPServer() as server, contextlib.redirect_stdout(io.StringIO()):
+            send_emails(df, "benchmark", "127.0.0.1", email_password="", email_smtp_port=server.port,
+                        dry_run=True, email_use_tls=False)
+    return run
+
+
+def bench_pipeline_rerun(n):
+    # a rerun without changes, every stage from clean to render is loaded from the stage cache
+    directory = tempfile.mkdtemp(prefix="spaceshare_benchmark_")
+    atexit.register(shutil.rmtree, directory, ignore_errors=True)
+    body = make_sheet(n).to_csv(index=False).encode()
+    sheet_cache = SheetCache(directory, ttl=np.inf, downloader=lambda url, headers: Response(200, body, {}))
+    settings = {"sheet": {"sheet_id": "benchmark", "time_format": TIME_FORMAT, "tz": None, "cache": sheet_cache},
+                "optimization": {"max_time_difference": MAX_WAIT_TIME, "max_people_per_car": MAX_PEOPLE_PER_CAR,
+                                 "method": "sweep"},
+                "template_dir": None, "stages": StageCache(os.path.join(directory, "stages"))}
+
+    def run():
+        pipeline = Pipeline(settings)
+        df, key = pipeline.clean(*pipeline.fetch())
+        df, _ = pipeline.cluster(df, *pipeline.encode_times(df, key))
+        return pipeline.render(df)
+    run()
+    return run
+
+
+def bench_cli_startup(n):
+    # n is unused, the command starts in a fresh interpreter
+    command = [sys.executable, "-m", "SpaceShare", "validate",
+               os.path.join(os.path.dirname(__file__), os.pardir, "tests", "test.cfg")]
+    return lambda: subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+
+
+# name -> (setup function, sizes, quick sizes)
+CASES = {
+    "reader.clean_dataframe": (bench_parse, [1000, 100000, 1000000], [1000, 10000]),
+    "optimize.ward.arrival": (bench_optimize("ward", "arrival"), [1000, 5000], [1000]),
+    "optimize.ward.departure": (bench_optimize("ward", "departure"), [1000, 5000], [1000]),
+    "optimize.sweep.arrival": (bench_optimize("sweep", "arrival"), [1000, 100000, 1000000], [1000, 10000]),
+    "optimize.sweep.departure": (bench_optimize("sweep", "departure"), [1000, 100000, 1000000], [1000, 10000]),
+    "optimize.ward.locations": (bench_optimize("ward", "arrival", airports=3, hotels=8), [1000, 50000], [1000]),
+    "optimize.sweep.locations": (bench_optimize("sweep", "arrival", airports=3, hotels=8), [1000, 50000, 1000000],
+                                 [1000, 10000]),
+    "optimize.sweep_parameters.ward": (bench_sweep_parameters("ward"), [1000, 5000], [1000]),
+    "optimize.sweep_parameters.sweep": (bench_sweep_parameters("sweep"), [1000, 100000], [1000]),
+    "optimize_rooms": (bench_rooms, [1000, 10000, 1000000], [1000, 10000]),
+    "optimize.split_large_clusters": (bench_split, [1000, 10000, 100000], [1000]),
+    "render.render_messages": (bench_render, [1000, 10000, 100000], [1000]),
+    "write_email.send_emails.dry_run": (bench_send_dry_run, [1000, 10000], [1000]),
+    "pipeline.rerun.cached": (bench_pipeline_rerun, [1000, 100000], [1000]),
+    "cli.startup": (bench_cli_startup, [1], [1]),
+}
+
+
+def time_case(run, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {"date": datetime.now(timezone.utc).isoformat(), "commit": commit,
+            "spaceshare": SpaceShare.__version__, "python": platform.python_version(),
+            "numpy": np.__version__, "pandas": pd.__version__, "machine": platform.machine()}
+
+
+def compare(results, baseline, tolerance):
+    """
+    Prints the change of every case relative to the baseline and returns the number of regressions.
+    """
+    old = {(r["name"], r["size"]): r["seconds"] for r in baseline["results"]}
+    regressions = 0
+    for result in results:
+        key = (result["name"], result["size"])
+        if key not in old:
+            continue
+        ratio = result["seconds"] / old[key]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions += 1
+            flag = "  <-- REGRESSION"
+        print(f"{result['name']:>34} {result['size']:>8} {old[key]:9.4f} -> {result['seconds']:9.4f} s ({ratio:5.2f}x){flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="only run the small sizes")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), help="the cases to run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="an earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="relative slowdown above which a case counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    for name in args.cases:
+        setup, sizes, quick_sizes = CASES[name]
+        for n in quick_sizes if args.quick else sizes:
+            seconds = time_case(setup(n), args.repeat)
+            results.append({"name": name, "size": n, "seconds": seconds})
+            print(f"{name:>34} {n:>8} {seconds:9.4f} s", flush=True)
+
+    with open(args.output, "w") as fp:
+        json.dump({"metadata": metadata(), "results": results}, fp, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as fp:
+            baseline = json.load(fp)
+        if compare(results, baseline, args.tolerance) > 0:
+            sys.exit(1)
@@ -0,0 +1,80 @@
+"""
+A minimal local SMTP server used as a stand-in for a real mail provider in the benchmarks.
+
+It understands just enough of RFC 5321 for smtplib (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT),
+discards all messages and can add artificial latency to new connections and to each message to mimic
+the TLS handshake, login round-trips and per-message processing of a remote provider.
+"""
+import socketserver
+import threading
+import time
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+
+    def _reply(self, line):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+        self.wfile.flush()
+
+    def handle(self):
+        server = self.server
+        time.sleep(server.connect_delay)
+        with server.lock:
+            server.connections += 1
+        self._reply("220 localhost SpaceShare stand-in")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("ascii", "replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n")
+                self._reply("250 8BITMIME")
+            elif command.startswith("HELO"):
+                self._reply("250 localhost")
+            elif command.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                time.sleep(server.message_delay)
+                with server.lock:
+                    server.messages += 1
+                self._reply("250 OK")
+            elif command.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._reply("250 OK")
+
+
+class StandInSMTPServer(socketserver.ThreadingTCPServer):
+    """
+    Threaded SMTP stand-in listening on localhost.
+
+    Args:
+        connect_delay (float, optional): Seconds to sleep before greeting a new connection. Defaults to 0.
+        message_delay (float, optional): Seconds to sleep before accepting each message. Defaults to 0.
+        port (int, optional): The port to listen on, 0 picks a free one. Defaults to 0.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, connect_delay=0.0, message_delay=0.0, port=0):
+        super().__init__(("127.0.0.1", port), _SMTPHandler)
+        self.connect_delay = connect_delay
+        self.message_delay = message_delay
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.messages = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        self.server_close()
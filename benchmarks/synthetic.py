@@ -0,0 +1,77 @@
+"""
+Synthetic participant sheets for the benchmarks.
+
+Arrivals and departures are not uniform: participants come in on a limited number of flights, mostly the
+day before the event, and leave on flights after the last day. Every participant reaches the hotel exit or
+the airport exit some minutes after or before their flight, which produces the bursts of nearby times that
+make clustering and group splitting expensive.
+"""
+import numpy as np
+import pandas as pd
+
+
+def make_times(n, days=5, seed=0):
+    """
+    Draws `n` times in hours, spread uniformly over `days` days.
+    """
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, days * 24, n)
+
+
+def make_flight_times(n, rng, first_day, n_days, n_flights, day_weights):
+    """
+    Draws `n` times in hours around `n_flights` flights, spread over `n_days` days starting at `first_day`.
+    """
+    flight_days = rng.choice(n_days, n_flights, p=day_weights)
+    # flights between 6am and 11pm
+    flights = first_day * 24 + flight_days * 24 + rng.uniform(6, 23, n_flights)
+    popularity = rng.dirichlet(np.ones(n_flights))
+    return flights[rng.choice(n_flights, n, p=popularity)]
+
+
+def make_sheet(n, start="2023-07-10", event_days=5, flights_per_day=40, seed=0, airports=1, hotels=1):
+    """
+    Builds a raw sheet with `n` participants in the format returned by the Google Sheet,
+    i.e. with a "Timestamp" column and the times as strings.
+
+    Args:
+        n (int): The number of participants.
+        start (str, optional): The first day of the event. Defaults to '2023-07-10'.
+        event_days (int, optional): The length of the event in days. Defaults to 5.
+        flights_per_day (int, optional): The number of distinct flights per travel day. Defaults to 40.
+        seed (int, optional): The random seed. Defaults to 0.
+        airports (int, optional): If larger than 1, an "Airport" column with this many airports is added. Defaults to 1.
+        hotels (int, optional): If larger than 1, a "Hotel" column with this many hotels is added. Defaults to 1.
+
+    Returns:
+        pandas.DataFrame: The synthetic sheet.
+    """
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp(start)
+    # most people arrive the day before, some two days before or on the first day
+    arrival_flights = make_flight_times(n, rng, -2, 3, 3 * flights_per_day, [0.15, 0.65, 0.2])
+    arrival = arrival_flights + rng.exponential(0.5, n)  # baggage and immigration
+    # most people leave on the last day or the day after
+    departure_flights = make_flight_times(n, rng, event_days - 1, 2, 2 * flights_per_day, [0.6, 0.4])
+    departure = departure_flights - rng.uniform(2, 3.5, n)  # leave the hotel well before the flight
+
+    def to_strings(hours):
+        times = start + pd.to_timedelta(np.round(hours * 60), unit="min")
+        return times.strftime("%m/%d/%Y %H:%M:%S")
+
+    sheet = pd.DataFrame({
+        "Timestamp": "7/1/2023 12:00:00",
+        "Name": [f"Participant{i} Synthetic" for i in range(n)],
+        "Email": [f"participant{i}@example.org" for i in range(n)],
+        "date_time_of_hotel_departure": to_strings(departure),
+        "date_time_of_airport_arrival": to_strings(arrival),
+        "Gender": rng.choice(["Female", "Male", "Non-binary"], n),
+        "Gender_to_share_room_with": rng.choice(["Female", "Male", "No preference"], n),
+        "Phone_number": "",
+    })
+    # a few large venues and many small ones
+    if airports > 1:
+        sheet["Airport"] = rng.choice([f"Airport {i}" for i in range(airports)], n, p=rng.dirichlet(np.ones(airports)))
+    if hotels > 1:
+        sheet["Hotel"] = rng.choice([f"Hotel {i}" for i in range(hotels)], n, p=rng.dirichlet(np.ones(hotels)))
+    return sheet
@@ -19,8 +19,10 @@ setup(
     name = "SpaceShare",
     version=get_property("__version__", "SpaceShare"),
     packages = find_packages(),
+    package_data = {"SpaceShare": ["templates/*.txt"]},
     description="Package to schedule ride and hotel sharing",
     long_description=open("README.md").read(),
     url="https://github.com/sheydenreich/SpaceShare",
     install_requires=get_requires(),
+    entry_points={"console_scripts": ["spaceshare = SpaceShare.cli:main"]},
 )
\ No newline at end of file
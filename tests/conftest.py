@@ -0,0 +1,104 @@
+import io
+import smtplib
+import pandas as pd
+import pytest
+from SpaceShare import write_email
+from SpaceShare.cache import Response, SheetCache
+
+# the sheet of a small event as downloaded from google sheets, Ada and Grace arrive together
+SHEET = b"""Timestamp,Name,Email,date_time_of_hotel_departure,date_time_of_airport_arrival,Gender,Gender_to_share_room_with,Phone_number
+7/1/2023 12:00:00,Ada Lovelace,ada@example.org,7/14/2023 08:00:00,7/10/2023 10:00:00,Female,Female,
+7/1/2023 12:00:00,Grace Hopper,grace@example.org,7/14/2023 08:20:00,7/10/2023 10:15:00,Female,Female,
+7/1/2023 12:00:00,Vera Rubin,vera@example.org,7/14/2023 18:00:00,7/10/2023 15:00:00,Female,Female,
+"""
+
+CONFIG = """[EMAIL]
+username=organizer
+password=secret
+smtp_domain=localhost
+smtp_port=25
+
+[GOOGLE.SHEET]
+sheet_id={sheet_id}
+
+[CACHE]
+directory={cache}
+offline=true
+stages={stages}
+
+[OPTIMIZATION]
+max_wait_time={max_wait_time}
+max_people_per_car=3
+method={method}
+"""
+
+
+class FakeSMTP:
+    """
+    Records connections and messages instead of talking to a mail server. Raises the errors in `fail_next`
+    one by one, and refuses messages to the addresses in `refuse`.
+    """
+    instances = []
+    sent = []
+    fail_next = []
+    refuse = set()
+
+    def __init__(self, host, port):
+        self.messages = []
+        FakeSMTP.instances.append(self)
+
+    def starttls(self):
+        pass
+
+    def login(self, username, password):
+        pass
+
+    def send_message(self, msg):
+        if FakeSMTP.fail_next:
+            raise FakeSMTP.fail_next.pop(0)
+        if msg["To"] in FakeSMTP.refuse:
+            raise smtplib.SMTPRecipientsRefused({msg["To"]: (550, b"mailbox unavailable")})
+        self.messages.append(msg)
+        FakeSMTP.sent.append(msg)
+
+    def quit(self):
+        pass
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def fake_smtp(monkeypatch):
+    FakeSMTP.instances, FakeSMTP.sent, FakeSMTP.fail_next, FakeSMTP.refuse = [], [], [], set()
+    monkeypatch.setattr(write_email.smtplib, "SMTP", FakeSMTP)
+    return FakeSMTP
+
+
+@pytest.fixture
+def sheet():
+    return SHEET
+
+
+@pytest.fixture
+def offline_sheet(tmp_path):
+    """
+    Returns a function that stores a sheet in the cache of the `event_config` files, which never download.
+    """
+    def store(sheet_id="workshop_sheet", body=SHEET):
+        cache = SheetCache(tmp_path / "cache", downloader=lambda url, headers: Response(200, body, {}))
+        cache.get(sheet_id, "unused", parse=lambda body: pd.read_csv(io.BytesIO(body)))
+    return store
+
+
+@pytest.fixture
+def event_config(tmp_path):
+    """
+    Returns a function that writes the config file of an event, reading its sheet from the offline cache.
+    """
+    def write(name="workshop", sheet_id=None, method="sweep", max_wait_time=0.5, stages="true", extra=""):
+        path = tmp_path / f"{name}.cfg"
+        path.write_text(CONFIG.format(sheet_id=sheet_id or f"{name}_sheet", cache=tmp_path / "cache",
+                                      method=method, max_wait_time=max_wait_time, stages=stages) + extra)
+        return path
+    return write
@@ -0,0 +1,131 @@
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+from SpaceShare.cache import SheetCache, StageCache, content_hash, urllib_downloader
+from SpaceShare.reader import read_google_sheet
+
+CSV = b"Timestamp,Name,date_time_of_airport_arrival,date_time_of_hotel_departure\n" \
+      b"7/1/2023 12:00:00,Ada Lovelace,7/10/2023 10:00:00,7/14/2023 08:00:00\n"
+
+
+class SheetHandler(BaseHTTPRequestHandler):
+    """Serves CSV with an ETag and counts full downloads."""
+    def do_GET(self):
+        self.server.requests += 1
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.server.downloads += 1
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(CSV)))
+        self.end_headers()
+        self.wfile.write(CSV)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = HTTPServer(("127.0.0.1", 0), SheetHandler)
+    server.requests = server.downloads = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def local_downloader(server):
+    # redirect the Google URL to the local stand-in
+    def download(url, headers):
+        return urllib_downloader(f"http://127.0.0.1:{server.server_address[1]}/sheet.csv", headers)
+    return download
+
+
+def test_cache_revalidation(server, tmp_path):
+    cache = SheetCache(tmp_path, ttl=3600, downloader=local_downloader(server))
+    df = read_google_sheet("sheet", cache=cache)
+    assert df["Name"].iloc[0] == "Ada Lovelace"
+    read_google_sheet("sheet", cache=cache)
+    assert server.requests == 1, "the second read within the TTL should not contact the server"
+
+    cache.ttl = 0
+    df = read_google_sheet("sheet", cache=cache)
+    assert (server.requests, server.downloads) == (2, 1), "an expired entry should be revalidated with its ETag"
+    assert df["date_time_of_airport_arrival"].iloc[0].hour == 10
+
+
+def test_cache_offline_and_eviction(server, tmp_path):
+    cache = SheetCache(tmp_path, downloader=local_downloader(server))
+    with pytest.raises(FileNotFoundError):
+        SheetCache(tmp_path, offline=True).get("sheet", "unused", parse=None)
+    read_google_sheet("a", cache=cache)
+    assert len(read_google_sheet("a", cache=SheetCache(tmp_path, offline=True))) == 1
+
+    cache.max_bytes = 0
+    read_google_sheet("b", cache=cache)
+    assert len(list(tmp_path.glob("*.pkl"))) == 0
+
+
+def test_content_hash():
+    df = pd.DataFrame({"Name": ["Ada", "Grace"], "group": [1, 2]})
+    # the same content gives the same hash however the frame is laid out
+    reordered = pd.DataFrame({"group": [1, 2]})
+    reordered.insert(0, "Name", ["Ada", "Grace"])
+    assert content_hash(df, 0.5) == content_hash(reordered, 0.5)
+    assert content_hash(df, 0.5) != content_hash(df, 0.75)
+    assert content_hash(df.assign(group=[1, 3]), 0.5) != content_hash(df, 0.5)
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+    assert content_hash(np.arange(3)) != content_hash(np.arange(3.0))
+
+
+def test_stage_cache(tmp_path):
+    stages = StageCache(tmp_path / "stages", max_bytes=10**6)
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return np.zeros(1000)
+
+    assert len(stages.get("cluster", "a" * 64, compute)) == 1000
+    assert len(stages.get("cluster", "a" * 64, compute)) == 1000
+    assert len(calls) == 1
+    stages.get("render", "b" * 64, compute)
+    assert sorted(entry[0] for entry in stages.entries()) == ["cluster", "render"]
+
+    stages.invalidate("cluster")
+    assert [entry[0] for entry in stages.entries()] == ["render"]
+    stages.get("cluster", "a" * 64, compute)
+    assert len(calls) == 3
+
+    # the least recently used entries are removed first
+    stages.max_bytes = 20000
+    stages.get("render", "b" * 64, compute)
+    stages.get("times", "c" * 64, compute)
+    assert sorted(entry[0] for entry in stages.entries()) == ["render", "times"]
+
+    stages.invalidate()
+    assert stages.entries() == []
+
+
+def test_stage_cache_removes_broken_entries(tmp_path):
+    stages = StageCache(tmp_path / "stages")
+    stages.get("cluster", "a" * 64, lambda: np.zeros(1000))
+    path = stages.entries()[0][3]
+
+    def compute():
+        # the broken entry is gone before the stage runs again
+        assert not os.path.exists(path)
+        return np.ones(3)
+
+    for broken in [b"", open(path, "rb").read()[:100], b"not a pickle"]:
+        with open(path, "wb") as fp:
+            fp.write(broken)
+        assert stages.get("cluster", "a" * 64, compute).tolist() == [1, 1, 1]
+    assert len(stages.entries()) == 1
@@ -0,0 +1,60 @@
+import subprocess
+import sys
+import pandas as pd
+from SpaceShare.cli import main
+
+
+def test_cli_does_not_import_pandas():
+    for module in ["SpaceShare", "SpaceShare.cli", "SpaceShare.config"]:
+        code = f"import sys, {module}; print([m for m in ['pandas', 'numpy', 'scipy', 'smtplib'] if m in sys.modules])"
+        result = subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, text=True)
+        assert result.stdout.strip() == "[]", module
+
+
+def test_validate(tmp_path, event_config, capsys):
+    valid = event_config("valid")
+    invalid = event_config("invalid", method="kmeans")
+    assert main(["validate", str(valid)]) == 0
+    assert main(["validate", str(valid), str(invalid), str(tmp_path / "missing.cfg")]) == 1
+    output = capsys.readouterr().out
+    assert "method must be one of" in output
+    assert "not found" in output
+    # validating does not create the cache directories
+    assert not (tmp_path / "cache").exists()
+
+
+def test_optimize_review_send(tmp_path, fake_smtp, offline_sheet, event_config, capsys):
+    offline_sheet()
+    config_file = event_config()
+    output = str(tmp_path / "groups.csv")
+
+    assert main(["fetch", "-c", str(config_file), "-o", str(tmp_path / "participants.csv")]) == 0
+    assert len(pd.read_csv(tmp_path / "participants.csv")) == 3
+    assert main(["tune", "-c", str(config_file), "--max-wait-times", "0.5", "1", "--max-people-per-car", "2", "3",
+                 "-o", str(tmp_path / "tune.csv")]) == 0
+    assert len(pd.read_csv(tmp_path / "tune.csv")) == 8
+    assert main(["optimize", "-c", str(config_file), "-o", output]) == 0
+    assert (tmp_path / "groups.feather").exists()
+
+    # move Vera into the group of Ada and Grace
+    review = pd.read_csv(output)
+    review.loc[review["Name"] == "Vera Rubin", "arrival_group"] = review["arrival_group"].iloc[0]
+    review.to_csv(output, index=False)
+    assert main(["review", "-o", output]) == 0
+    assert "3 participants in 1 arrival and 2 departure groups" in capsys.readouterr().out
+
+    assert main(["send", "-c", str(config_file), "-o", output, "--dry-run"]) == 0
+    assert "dry_run    3" in capsys.readouterr().out
+
+    assert main(["cache", "-c", str(config_file)]) == 0
+    output = capsys.readouterr().out
+    assert "cluster: 1 entries" in output and "render: 1 entries" in output
+    assert main(["cache", "-c", str(config_file), "--clear", "cluster", "render"]) == 0
+    output = capsys.readouterr().out
+    assert "clean: 1 entries" in output and "cluster" not in output and "render" not in output
+
+
+def test_serve_needs_token_on_other_hosts(event_config, monkeypatch, capsys):
+    monkeypatch.delenv("SPACESHARE_TOKEN", raising=False)
+    assert main(["serve", "-c", str(event_config()), "--host", "0.0.0.0", "--empty"]) == 1
+    assert "SPACESHARE_TOKEN" in capsys.readouterr().out
@@ -0,0 +1,52 @@
+import smtplib
+from SpaceShare.dispatch import TokenBucket, dispatch_emails
+from SpaceShare.render import Message
+
+
+def test_token_bucket_rate():
+    now = [0.0]
+    def sleep(seconds):
+        now[0] += seconds
+    bucket = TokenBucket(5, period=1.0, clock=lambda: now[0], sleep=sleep)
+    for i in range(25):
+        bucket.acquire()
+    # the first 5 come from the full bucket, the remaining 20 need 4 seconds
+    assert abs(now[0] - 4.0) < 1e-9
+
+
+class FlakyHandler:
+    def __init__(self, failures):
+        self.failures = failures
+        self.sent = []
+
+    def write_email(self, recipients, subject, content):
+        if self.failures.get(subject):
+            raise self.failures[subject].pop(0)
+        self.sent.append(subject)
+
+    def close(self):
+        pass
+
+
+def test_dispatch_retries_transient_errors():
+    handler = FlakyHandler({"0": [smtplib.SMTPServerDisconnected(), smtplib.SMTPDataError(451, b"try later")],
+                            "1": [smtplib.SMTPDataError(550, b"no such user")]})
+    messages = [Message("arrival", i, ["a@b.c"], str(i), "") for i in range(3)]
+    report = dispatch_emails(messages, lambda: handler, workers=1, max_retries=3, backoff=0)
+    assert [r["subject"] for r in report] == ["0", "1", "2"]
+    assert report[0]["status"] == "sent" and report[0]["attempts"] == 3
+    # permanent 5xx errors are not retried
+    assert report[1]["status"] == "failed" and report[1]["attempts"] == 1
+    assert report[2]["status"] == "sent" and report[2]["attempts"] == 1
+
+
+def test_dispatch_workers():
+    handlers = []
+    def factory():
+        handlers.append(FlakyHandler({}))
+        return handlers[-1]
+    messages = [Message("arrival", i, ["a@b.c"], str(i), "") for i in range(50)]
+    report = dispatch_emails(messages, factory, workers=4)
+    assert all(r["status"] == "sent" for r in report)
+    assert 1 <= len(handlers) <= 4
+    assert sum(len(h.sent) for h in handlers) == 50
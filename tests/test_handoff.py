@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+from SpaceShare.handoff import write_handoff, read_handoff, export_review_csv, apply_review_csv
+
+
+def make_df():
+    return pd.DataFrame({
+        "Name": ["Ada Lovelace", "Grace Hopper", "Vera Rubin"],
+        "Email": ["ada@example.org", "grace@example.org", "vera@example.org"],
+        "date_time_of_airport_arrival": pd.to_datetime(["2023-07-10 10:00", "2023-07-10 10:20", "2023-07-10 13:00"]),
+        "date_time_of_hotel_departure": pd.to_datetime(["2023-07-14 08:00", "2023-07-14 18:00", "2023-07-14 08:10"]),
+        "Gender": ["Female", "Female", "Female"],
+        "arrival_group": [1, 1, 2],
+        "departure_group": [1, 2, 1],
+    }, index=[5, 3, 9])
+
+
+def test_handoff_roundtrip(tmp_path):
+    write_handoff(make_df(), tmp_path / "groups.feather")
+    df = read_handoff(tmp_path / "groups.feather")
+    assert list(df.index) == [0, 1, 2]
+    assert isinstance(df["Email"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df["date_time_of_airport_arrival"])
+    assert df["date_time_of_hotel_departure"].iloc[1] == pd.Timestamp("2023-07-14 18:00")
+
+
+
+def test_handoff_keeps_local_times(tmp_path):
+    df = make_df()
+    for column in ["date_time_of_airport_arrival", "date_time_of_hotel_departure"]:
+        df[column] = df[column].dt.tz_localize("America/Chicago")
+    write_handoff(df, tmp_path / "groups.feather")
+    result = read_handoff(tmp_path / "groups.feather")
+    assert result["date_time_of_airport_arrival"].iloc[0] == pd.Timestamp("2023-07-10 10:00")
+
+    export_review_csv(result, tmp_path / "review.csv")
+    assert "2023-07-10 10:00:00" in (tmp_path / "review.csv").read_text()
+
+
+def test_review_csv(tmp_path):
+    df = read_handoff_of(make_df(), tmp_path)
+    export_review_csv(df, tmp_path / "review.csv")
+    review = pd.read_csv(tmp_path / "review.csv")
+    # move Vera into the arrival group of Ada and Grace, remove Grace
+    review.loc[review["Name"] == "Vera Rubin", "arrival_group"] = 1
+    review = review[review["Name"] != "Grace Hopper"]
+    review.to_csv(tmp_path / "review.csv", index=False)
+
+    result = apply_review_csv(df, tmp_path / "review.csv")
+    assert sorted(result["Name"]) == ["Ada Lovelace", "Vera Rubin"]
+    assert list(result["arrival_group"]) == [1, 1]
+    assert result["Gender"].iloc[0] == "Female"
+    assert result["date_time_of_airport_arrival"].dtype == df["date_time_of_airport_arrival"].dtype
+
+    review["departure_group"] = review["departure_group"].astype(str)
+    review.loc[review["Name"] == "Vera Rubin", "departure_group"] = "two"
+    review.to_csv(tmp_path / "review.csv", index=False)
+    with pytest.raises(ValueError, match="departure_group"):
+        apply_review_csv(df, tmp_path / "review.csv")
+
+
+def read_handoff_of(df, tmp_path):
+    write_handoff(df, tmp_path / "groups.feather")
+    return read_handoff(tmp_path / "groups.feather")
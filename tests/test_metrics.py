@@ -0,0 +1,54 @@
+import csv
+import json
+from SpaceShare import metrics
+from SpaceShare.metrics import Metrics
+
+
+def test_stage_and_count_without_collector():
+    # nothing is recorded and nothing fails if no collector is active
+    with metrics.stage("fetch"):
+        metrics.count("rows", 5)
+
+
+def test_stages_counters_and_hooks():
+    events = []
+    with Metrics(hooks=[lambda event, name, value: events.append((event, name))]) as collector:
+        with metrics.stage("optimize"):
+            with metrics.stage("optimize.arrival.linkage"):
+                metrics.count("groups.arrival", 2)
+            metrics.count("groups.arrival")
+    metrics.count("rows", 5)
+
+    assert [record["stage"] for record in collector.stages] == ["optimize.arrival.linkage", "optimize"]
+    assert collector.stages[1]["seconds"] >= collector.stages[0]["seconds"]
+    assert collector.counters == {"groups.arrival": 3}
+    assert events == [("count", "groups.arrival"), ("stage", "optimize.arrival.linkage"),
+                      ("count", "groups.arrival"), ("stage", "optimize")]
+
+
+def test_profile_and_trace_memory(tmp_path):
+    with Metrics(profile_dir=tmp_path / "profiles", trace_memory=True) as collector:
+        with metrics.stage("render"):
+            with metrics.stage("render.inner"):
+                data = [0] * 100000
+            del data
+    assert (tmp_path / "profiles" / "render.prof").exists()
+    # only the outermost stage is profiled and traced
+    assert not (tmp_path / "profiles" / "render.inner.prof").exists()
+    assert collector.stages[0]["peak_traced_mb"] is None
+    assert collector.stages[1]["peak_traced_mb"] > 0.5
+
+
+def test_write_report(tmp_path):
+    with Metrics() as collector:
+        with metrics.stage("send"):
+            metrics.count("messages.sent", 4)
+    collector.write_report(tmp_path / "metrics.json")
+    collector.write_report(tmp_path / "metrics.csv")
+
+    report = json.loads((tmp_path / "metrics.json").read_text())
+    assert report["counters"] == {"messages.sent": 4}
+    assert report["stages"][0]["stage"] == "send"
+    with open(tmp_path / "metrics.csv", newline="") as fp:
+        rows = list(csv.DictReader(fp))
+    assert [(row["type"], row["name"]) for row in rows] == [("stage", "send"), ("counter", "messages.sent")]
@@ -0,0 +1,121 @@
+import itertools
+import numpy as np
+import pandas as pd
+from SpaceShare.optimize_rooms import compatibility_classes, sweep_rooms, optimize_rooms, reoptimize_rooms
+from SpaceShare.render import render_messages
+
+
+def make_df(n, seed=1):
+    rng = np.random.default_rng(seed)
+    start = pd.Timestamp("2023-07-10")
+    arrival = start + pd.to_timedelta(rng.integers(0, 72, n), unit="h")
+    return pd.DataFrame({
+        "Name": [f"Person {i}" for i in range(n)],
+        "Email": [f"person{i}@example.org" for i in range(n)],
+        "date_time_of_airport_arrival": arrival,
+        "date_time_of_hotel_departure": arrival + pd.to_timedelta(rng.integers(24, 120, n), unit="h"),
+        "Gender": rng.choice(["Female", " female", "Male", "Non-binary", None], n),
+        "Gender_to_share_room_with": rng.choice(["Female", "Male", "No preference", None], n),
+        "Hotel": rng.choice(["Hilton", "Motel"], n),
+    })
+
+
+def compatible(a, b):
+    def normalize(value):
+        value = value.strip().casefold() if isinstance(value, str) else ""
+        return None if value in ["", "no preference"] else value
+    genders = normalize(a["Gender"]), normalize(b["Gender"])
+    wishes = [normalize(row["Gender_to_share_room_with"]) or gender for row, gender in [(a, genders[0]), (b, genders[1])]]
+    return None not in genders and wishes[0] == genders[1] and wishes[1] == genders[0]
+
+
+def test_compatibility_classes():
+    df = pd.DataFrame({"Gender": ["Female", "female ", "Male", "Male", "Female", None],
+                       "Gender_to_share_room_with": ["Female", "No preference", "Female", "male", "Male", "Female"]})
+    classes, partners = compatibility_classes(df)
+    assert classes[0] == classes[1]  # no preference counts as the own gender
+    assert classes[2] != classes[3]
+    assert partners[classes[2]] == classes[4] and partners[classes[4]] == classes[2]
+    assert partners[classes[3]] == classes[3]
+    assert classes[5] == -1
+
+
+def test_sweep_rooms():
+    check_in = [0, 1, 2, 30, 0]
+    check_out = [48, 100, 50, 60, 20]
+    assert list(sweep_rooms(check_in, check_out, max_time_difference=24, max_people_per_room=2)) == [2, 3, 2, 4, 1]
+    # a room of two partner classes holds one person of each
+    assert list(sweep_rooms([0, 1, 2], [48, 48, 48], sides=[0, 0, 1], max_people_per_room=3)) == [1, 2, 1]
+    # the room with the closest check-out is taken, not the one opened first
+    assert list(sweep_rooms([0, 0, 0, 1], [40, 50, 60, 52], sides=[0, 0, 0, 1])) == [1, 2, 3, 2]
+    # a large side and nobody who fits together do not scan every open room
+    n = 20000
+    assert sweep_rooms(np.zeros(n), np.arange(n) * 100.0 + 1).max() == n
+    sides = np.zeros(n, dtype=int)
+    sides[::50] = 1
+    labels = sweep_rooms(np.arange(n) / 1000, np.arange(n) / 1000 + 48, sides=sides)
+    assert np.bincount(labels).max() == 2 and len(np.unique(labels)) == n - n // 50
+
+
+def test_optimize_rooms_keeps_the_limits():
+    df = optimize_rooms(make_df(400), max_time_difference=24, max_people_per_room=3)
+    hours = {column: (df[column] - pd.Timestamp("2023-07-10")) / pd.Timedelta(hours=1)
+             for column in ["date_time_of_airport_arrival", "date_time_of_hotel_departure"]}
+    records = df.to_dict("records")
+    shared = 0
+    for _, room in df[df["room_group"] > 0].groupby("room_group"):
+        rows = room.index.to_list()
+        assert len(rows) <= 3
+        assert room["Hotel"].nunique() == 1
+        for column in hours:
+            assert np.ptp(hours[column][rows]) <= 24
+        assert hours["date_time_of_airport_arrival"][rows].max() < hours["date_time_of_hotel_departure"][rows].min()
+        for a, b in itertools.combinations(rows, 2):
+            assert compatible(records[a], records[b])
+        shared += len(rows) > 1
+    assert shared > 50
+
+
+def test_reoptimize_rooms():
+    df = optimize_rooms(make_df(100))
+    previous = df["room_group"].copy()
+    combined = pd.concat([df, make_df(20, seed=2)], ignore_index=True)
+    combined, changed = reoptimize_rooms(combined, len(df))
+    assert (combined["room_group"].iloc[:len(df)] == previous).all()
+    new_rooms = combined["room_group"].iloc[len(df):]
+    assert new_rooms[new_rooms > 0].min() > previous.max()
+    assert set(changed) == set(new_rooms) - {0}
+
+
+def test_render_rooms():
+    df = make_df(4)
+    df["room_group"] = [1, 1, 2, 3]
+    messages = render_messages(df, kinds=("room",))
+    assert [(m.kind, m.group) for m in messages] == [("room", 1), ("room", 2), ("room", 3)]
+    assert messages[0].subject == "[code/astro] Room sharing at your hotel"
+    assert messages[0].recipients == ["person0@example.org", "person1@example.org"]
+    arrival, departure = df.loc[0, ["date_time_of_airport_arrival", "date_time_of_hotel_departure"]]
+    assert (f"\tPerson 0: {arrival:%b %d, %I:%M %p} - {departure:%b %d, %I:%M %p}\n") in messages[0].content
+    assert "not been able to find another participant" in messages[1].content
+
+
+def test_people_who_do_not_share_get_no_room():
+    df = make_df(7)
+    df["Hotel"] = "Hilton"
+    df["Gender"] = ["Female", "Female", None, "Female", "Female", "Male", "Female"]
+    df["Gender_to_share_room_with"] = ["Female", "No preference", "Female", "I will not share", "Female", "Female",
+                                       None]
+    df["date_time_of_airport_arrival"] = pd.Timestamp("2023-07-10 10:00")
+    df["date_time_of_hotel_departure"] = pd.Timestamp("2023-07-14 08:00")
+    df.loc[4, "date_time_of_hotel_departure"] = pd.NaT
+    # without a gender, with an answer that is not a gender, without a time, or without any possible roommate
+    df = optimize_rooms(df, max_people_per_room=3)
+    assert df["room_group"].tolist() == [1, 1, 0, 0, 0, 0, 1]
+
+    messages = render_messages(df, kinds=("room",))
+    assert [(m.group, len(m.recipients)) for m in messages] == [(1, 3)]
+    assert "Person 3" not in messages[0].content
+
+    combined, changed = reoptimize_rooms(pd.concat([df, df.iloc[[2, 3]]], ignore_index=True), len(df))
+    assert combined["room_group"].tolist()[len(df):] == [0, 0]
+    assert len(changed) == 0
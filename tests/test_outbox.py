@@ -0,0 +1,92 @@
+import smtplib
+from SpaceShare import write_email
+from SpaceShare.outbox import Outbox, message_id
+from SpaceShare.render import Message
+
+
+def make_messages():
+    return [Message(kind="arrival", group=group, recipients=[f"person{group}@example.org"],
+                    subject=f"Ride share {group}", content=f"Hello group {group}!\n") for group in range(1, 6)]
+
+
+def test_spool_and_load(tmp_path):
+    outbox = Outbox(tmp_path / "outbox")
+    messages = make_messages()
+    message_ids = outbox.spool(messages)
+    assert message_ids == [message_id(message) for message in messages]
+    assert outbox.load(message_ids[2]) == messages[2]
+    assert (tmp_path / "outbox" / "messages" / f"{message_ids[0]}.eml").exists()
+    # rendering the same message again gives the same ID, a changed message a new one
+    messages[0].content = "Hello again!\n"
+    assert message_id(messages[0]) != message_ids[0]
+    assert message_id(messages[1]) == message_ids[1]
+
+
+def test_journal(tmp_path):
+    outbox = Outbox(tmp_path / "outbox")
+    message_ids = outbox.spool(make_messages())
+    outbox.mark_delivered(message_ids[1])
+    # a line cut off by a crash does not count
+    with open(outbox.journal, "a") as fp:
+        fp.write(message_ids[3][:-2])
+    assert Outbox(tmp_path / "outbox").delivered() == {message_ids[1]}
+    assert outbox.pending() == message_ids[:1] + message_ids[2:]
+
+
+def test_send_messages_resumes(tmp_path, fake_smtp, monkeypatch, capsys):
+    fake_smtp.refuse = {"person2@example.org", "person4@example.org"}
+    settings = dict(email_username="organizer", email_smtp_domain="localhost", email_password="secret",
+                    outbox=tmp_path / "outbox")
+
+    report = write_email.send_messages(make_messages(), **settings)
+    assert report["status"].tolist() == ["sent", "failed", "sent", "failed", "sent"]
+
+    # the second run only sends what failed before
+    fake_smtp.refuse = set()
+    report = write_email.send_messages(make_messages(), **settings)
+    assert report["status"].tolist() == ["skipped", "sent", "skipped", "sent", "skipped"]
+    assert sorted(msg["To"] for msg in fake_smtp.sent) == [f"person{group}@example.org" for group in range(1, 6)]
+
+    # nothing left, so no connection is opened at all
+    monkeypatch.setattr(write_email.smtplib, "SMTP", None)
+    report = write_email.send_messages(make_messages(), **settings)
+    assert (report["status"] == "skipped").all()
+
+
+def test_dry_run_writes_outbox(tmp_path, fake_smtp, capsys):
+    report = write_email.send_messages(make_messages(), "organizer", "localhost", email_password="secret",
+                                       dry_run=True, outbox=tmp_path / "outbox")
+    assert (report["status"] == "dry_run").all()
+    assert "Hello group" not in capsys.readouterr().out
+    assert len(Outbox(tmp_path / "outbox").pending()) == 5
+
+
+def test_drain_outbox(tmp_path, fake_smtp, capsys):
+    fake_smtp.refuse = {"person2@example.org"}
+    settings = dict(email_username="organizer", email_smtp_domain="localhost", email_password="secret")
+    report = write_email.send_messages(make_messages(), outbox=tmp_path / "outbox", **settings)
+    assert (report["status"] == "failed").sum() == 1
+
+    # the pending message is sent from its .eml file, not rendered again
+    fake_smtp.refuse, fake_smtp.sent = set(), []
+    report = write_email.drain_outbox(tmp_path / "outbox", **settings)
+    assert report[["group", "status"]].values.tolist() == [[2, "sent"]]
+    assert [msg["To"] for msg in fake_smtp.sent] == ["person2@example.org"]
+    assert fake_smtp.sent[0].get_content() == "Hello group 2!\n"
+    assert Outbox(tmp_path / "outbox").pending() == []
+    assert len(write_email.drain_outbox(tmp_path / "outbox", **settings)) == 0
+
+
+def test_drain_outbox_skips_replaced_messages(tmp_path, fake_smtp, capsys):
+    settings = dict(email_username="organizer", email_smtp_domain="localhost", email_password="secret")
+    # the dry run before the review writes the first version of every message
+    write_email.send_messages(make_messages(), dry_run=True, outbox=tmp_path / "outbox", **settings)
+    # group 2 is edited in the review, and its new message is refused when it is sent
+    messages = make_messages()
+    messages[1].content = "Hello edited group 2!\n"
+    fake_smtp.refuse = {"person2@example.org"}
+    write_email.send_messages(messages, outbox=tmp_path / "outbox", **settings)
+
+    fake_smtp.refuse, fake_smtp.sent = set(), []
+    write_email.drain_outbox(tmp_path / "outbox", **settings)
+    assert [msg.get_content() for msg in fake_smtp.sent] == ["Hello edited group 2!\n"]
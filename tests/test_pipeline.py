@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+from SpaceShare.config import read_config
+from SpaceShare.metrics import Metrics
+from SpaceShare.pipeline import Pipeline
+
+
+@pytest.fixture
+def run(offline_sheet, event_config, sheet):
+    """
+    Returns a function that runs the pipeline up to the rendered messages, with Vera arriving at 10:45.
+    """
+    offline_sheet(body=sheet.replace(b"7/10/2023 15:00:00", b"7/10/2023 10:45:00"))
+
+    def run(max_wait_time, stages="true", rooms=""):
+        settings = read_config(event_config(max_wait_time=max_wait_time, stages=stages, extra=rooms))
+        with Metrics() as collector:
+            pipeline = Pipeline(settings)
+            df, key = pipeline.clean(*pipeline.fetch())
+            df, _ = pipeline.cluster(df, *pipeline.encode_times(df, key))
+            messages = pipeline.render(df)
+        return df, messages, collector.counters
+    return run
+
+
+def test_pipeline_reruns_changed_stages(run):
+    df, messages, counters = run(0.5)
+    assert df["arrival_group"].tolist() == [1, 1, 2]
+    assert all(counters[f"cache.{stage}.misses"] == 1 for stage in ["clean", "times", "cluster", "render"])
+
+    cached_df, cached_messages, counters = run(0.5)
+    pd.testing.assert_frame_equal(cached_df, df)
+    assert cached_messages == messages
+    assert all(counters[f"cache.{stage}.hits"] == 1 for stage in ["clean", "times", "cluster", "render"])
+    assert not any(name.endswith(".misses") for name in counters)
+
+    # only the stages after the changed parameter run again
+    df, messages, counters = run(1.0)
+    assert df["arrival_group"].tolist() == [1, 1, 1]
+    assert counters["cache.clean.hits"] == counters["cache.times.hits"] == 1
+    assert counters["cache.cluster.misses"] == counters["cache.render.misses"] == 1
+
+    # without the stage cache, everything is computed
+    uncached_df, uncached_messages, counters = run(1.0, stages="false")
+    pd.testing.assert_frame_equal(uncached_df, df)
+    assert uncached_messages == messages
+    assert not any(name.startswith("cache.") for name in counters)
+
+
+def test_pipeline_assigns_rooms(run):
+    df, messages, _ = run(0.5, rooms="\n[ROOMS]\nmax_wait_time=24\nmax_people_per_room=2\n")
+    assert df["room_group"].tolist() == [1, 1, 2]
+    rooms = [message for message in messages if message.kind == "room"]
+    assert [message.recipients for message in rooms] == [["ada@example.org", "grace@example.org"], ["vera@example.org"]]
@@ -0,0 +1,79 @@
+import pandas as pd
+from SpaceShare.render import render_messages
+
+
+def make_df():
+    return pd.DataFrame({
+        "Name": ["Ada Lovelace", "Grace Hopper", "Vera Rubin"],
+        "Email": ["ada@example.org", "grace@example.org", "vera@example.org"],
+        "date_time_of_airport_arrival": pd.to_datetime(["2023-07-10 10:00", "2023-07-10 10:20", "2023-07-10 13:00"]),
+        "date_time_of_hotel_departure": pd.to_datetime(["2023-07-14 08:00", "2023-07-14 18:00", "2023-07-14 08:10"]),
+        "arrival_group": [1, 1, 2],
+        "departure_group": [1, 2, 1],
+    })
+
+
+def test_render_messages():
+    messages = render_messages(make_df())
+    assert [(m.kind, m.group) for m in messages] == [("arrival", 1), ("arrival", 2), ("departure", 1), ("departure", 2)]
+    assert messages[0].recipients == ["ada@example.org", "grace@example.org"]
+    assert messages[0].subject == "[code/astro] Rideshare for your arrival"
+    assert messages[0].content.startswith("Dear Ada, Grace,")
+    assert "\tGrace Hopper: Jul 10, 10:20 AM\n" in messages[0].content
+    # a group of one gets the message that no ride share was found
+    assert "not been able to find any other participants who arrive" in messages[1].content
+    assert messages[2].recipients == ["ada@example.org", "vera@example.org"]
+
+
+def test_render_selected_groups_and_custom_templates(tmp_path):
+    (tmp_path / "group_departure.txt").write_text("Hi $first_names, $kind at\n$times")
+    messages = render_messages(make_df(), kinds=("departure",), groups={"departure": [1]}, template_dir=tmp_path)
+    assert len(messages) == 1
+    assert messages[0].content == "Hi Ada, Vera, departure at\n\tAda Lovelace: Jul 14, 08:00 AM\n\tVera Rubin: Jul 14, 08:10 AM\n"
+
+
+def test_render_consolidated():
+    df = make_df()
+    # Ada registered twice
+    df = pd.concat([df, df.iloc[[0]]], ignore_index=True)
+    messages = render_messages(df, consolidate=True)
+    assert [(m.kind, m.group) for m in messages] == [("combined", "1-1"), ("combined", "1-2"), ("combined", "2-1")]
+    assert messages[0].recipients == ["ada@example.org"]
+    assert messages[0].subject == "[code/astro] Rideshare for your arrival and departure"
+    assert messages[0].content.startswith("Dear Ada,")
+    # the other members of both groups are listed with their addresses, Ada only once
+    assert messages[0].content.count("\tAda Lovelace (ada@example.org): Jul 10, 10:00 AM\n") == 1
+    assert "\tGrace Hopper (grace@example.org): Jul 10, 10:20 AM\n" in messages[0].content
+    assert "\tVera Rubin (vera@example.org): Jul 14, 08:10 AM\n" in messages[0].content
+    assert "not been able to find any other participants who depart" in messages[1].content
+
+
+def test_render_consolidated_message_count():
+    # full cars of three, where nobody departs with the people they arrived with
+    df = pd.DataFrame({
+        "Name": [f"Person {i}" for i in range(9)],
+        "Email": [f"person{i}@example.org" for i in range(9)],
+        "date_time_of_airport_arrival": pd.Timestamp("2023-07-10 10:00") + pd.to_timedelta([0, 0, 0, 1, 1, 1, 2, 2, 2], unit="h"),
+        "date_time_of_hotel_departure": pd.Timestamp("2023-07-14 08:00") + pd.to_timedelta([0, 1, 2] * 3, unit="h"),
+        "arrival_group": [1, 1, 1, 2, 2, 2, 3, 3, 3],
+        "departure_group": [1, 2, 3] * 3,
+    })
+    separate = render_messages(df)
+    combined = render_messages(df, consolidate=True)
+    # one message per group against one per participant, but every participant receives one instead of two
+    assert (len(separate), len(combined)) == (6, 9)
+    assert sum(len(m.recipients) for m in separate) == 18
+    assert sum(len(m.recipients) for m in combined) == 9
+
+
+def test_render_consolidated_single_ride():
+    df = make_df()
+    df.loc[1, "date_time_of_hotel_departure"] = pd.NaT
+    messages = render_messages(df, consolidate=True)
+    assert [m.group for m in messages] == ["1-1", "1-none", "2-1"]
+    assert messages[1].subject == "[code/astro] Rideshare for your arrival"
+    assert "hotel to the airport" not in messages[1].content
+
+    # only the selected groups are reported
+    messages = render_messages(df, groups={"arrival": [2], "departure": [1]}, consolidate=True)
+    assert [(m.group, m.recipients) for m in messages] == [("2-1", ["vera@example.org"]), ("none-1", ["ada@example.org"])]
@@ -1,3 +1,70 @@
-from SpaceShare import run_spaceshare
+import json
+import pandas as pd
+from SpaceShare import run_spaceshare, run_batch
+from SpaceShare.config import read_config
+from SpaceShare.run import check_groups, optimize_event, write_for_review
 
-# run_spaceshare(config_file="test.cfg",dry_run=True)
\ No newline at end of file
+# run_spaceshare(config_file="test.cfg",dry_run=True)
+
+
+def test_run_batch(tmp_path, fake_smtp, offline_sheet, event_config, capsys):
+    config_files = []
+    for event in ["workshop", "conference"]:
+        offline_sheet(f"{event}_sheet")
+        config_files.append(event_config(event))
+
+    report = run_batch([str(f) for f in config_files], output_dir=tmp_path / "out", dry_run=True,
+                       processes=2, confirm=False)
+    assert (tmp_path / "out" / "workshop" / "optimized_clustering.csv").exists()
+    assert (tmp_path / "out" / "conference" / "optimized_clustering.csv").exists()
+    # two arrival and two departure groups per event
+    assert report.groupby("event").size().to_dict() == {"conference": 4, "workshop": 4}
+    assert (report["status"] == "dry_run").all()
+
+
+def test_run_spaceshare_metrics(tmp_path, fake_smtp, offline_sheet, event_config, capsys):
+    offline_sheet()
+    config_file = event_config(extra=f"\n[METRICS]\nreport={tmp_path / 'metrics.json'}\n")
+
+    report = run_spaceshare(str(config_file), dry_run=True, output_file=str(tmp_path / "groups.csv"),
+                            confirm=False)
+    assert len(report) == 4
+    metrics = json.loads((tmp_path / "metrics.json").read_text())
+    stages = [record["stage"] for record in metrics["stages"]]
+    for stage in ["fetch", "clean", "optimize.arrival.sweep", "handoff.write", "render", "send"]:
+        assert stage in stages
+    assert metrics["counters"]["rows"] == 3
+    assert metrics["counters"]["messages.dry_run"] == 4
+
+
+def test_check_groups(capsys):
+    df = pd.DataFrame({"date_time_of_airport_arrival": pd.to_datetime(["2023-07-10 10:00", "2023-07-10 11:00"]),
+                       "date_time_of_hotel_departure": pd.to_datetime(["2023-07-14 08:00", "2023-07-14 08:00"]),
+                       "arrival_group": [1, 1], "departure_group": [1, 1]})
+    optimization = {"max_time_difference": 0.5, "max_people_per_car": 3}
+    violations = check_groups(df, optimization, event="workshop")
+    assert violations[["kind", "group", "check"]].values.tolist() == [["arrival", 1, "time_spread"]]
+    assert "1 groups of workshop do not keep the limits" in capsys.readouterr().out
+    df["arrival_group"] = [1, 2]
+    assert len(check_groups(df, optimization)) == 0
+    assert capsys.readouterr().out == ""
+
+
+def test_optimize_event_adds_to_previous_groups_in_a_timezone(tmp_path, offline_sheet, event_config, sheet, capsys):
+    # Vera registers later, arriving five minutes after Ada
+    offline_sheet("first_sheet", body=sheet.rsplit(b"7/1/2023 12:00:00,Vera", 1)[0])
+    offline_sheet("second_sheet", body=sheet.replace(b"7/10/2023 15:00:00", b"7/10/2023 10:05:00"))
+    settings = {}
+    for name in ["first", "second"]:
+        config_file = event_config(name, stages="false")
+        config_file.write_text(config_file.read_text().replace("[GOOGLE.SHEET]\n", "[GOOGLE.SHEET]\ntimezone=America/Chicago\n"))
+        settings[name] = read_config(config_file)
+
+    df, _ = optimize_event(settings["first"])
+    handoff_file = write_for_review(df, str(tmp_path / "first.csv"))
+    df, changed = optimize_event(settings["second"], previous_file=handoff_file)
+    assert df.set_index("Email")["arrival_group"].to_dict() == {"ada@example.org": 1, "grace@example.org": 1,
+                                                              "vera@example.org": 1}
+    assert changed["arrival"].tolist() == [1]
+    assert (df["date_time_of_airport_arrival"].dt.strftime("%H:%M") == ["10:00", "10:15", "10:05"]).all()
+    write_for_review(df, str(tmp_path / "second.csv"))
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import numpy as np
+import pandas as pd
+import pytest
+from SpaceShare.optimize_rideshares import optimize
+from SpaceShare.run import read_reviewed
+from SpaceShare.service import MAX_BODY_BYTES, MatchingService, TimeIndex, handle_request, start_server
+
+TIME_FORMAT = "%m/%d/%Y %H:%M:%S"
+
+
+def registration(i, arrival, departure="", airport="JFK"):
+    return {"Name": f"Person {i}", "Email": f"person{i}@example.org", "date_time_of_airport_arrival": arrival,
+            "date_time_of_hotel_departure": departure, "Airport": airport}
+
+
+def test_time_index():
+    index = TimeIndex([3.0, 1.0, 2.0], ["c", "a", "b"])
+    index.insert(2.0, "d")
+    index.insert(0.5, "e")
+    assert index.ids == ["e", "a", "b", "d", "c"]
+    assert index.window(1.0, 2.0) == [(1.0, "a"), (2.0, "b"), (2.0, "d")]
+    index.remove(2.0, "b")
+    assert index.ids == ["e", "a", "d", "c"]
+    assert list(index.groups(max_time_difference=1.0, max_people_per_car=2)) == [1, 1, 2, 2]
+
+
+def test_snapshot_matches_optimize():
+    rng = np.random.default_rng(1)
+    n = 300
+    start = pd.Timestamp("2023-07-10")
+    df = pd.DataFrame({
+        "Name": [f"Person {i}" for i in range(n)],
+        "Email": [f"person{i}@example.org" for i in range(n)],
+        "date_time_of_airport_arrival": start + pd.to_timedelta(rng.integers(0, 48 * 4, n) * 15, unit="min"),
+        "date_time_of_hotel_departure": start + pd.to_timedelta(rng.integers(0, 48 * 4, n) * 15, unit="min"),
+        "Airport": rng.choice(["JFK", " jfk", "EWR", None], n),
+    })
+    service = MatchingService(max_time_difference=0.5, max_people_per_car=3)
+    # half of the participants are loaded at once, the others register one by one
+    service.add_dataframe(df.iloc[:n // 2])
+    for record in df.iloc[n // 2:].to_dict("records"):
+        record["date_time_of_airport_arrival"] = record["date_time_of_airport_arrival"].strftime(TIME_FORMAT)
+        record["date_time_of_hotel_departure"] = record["date_time_of_hotel_departure"].strftime(TIME_FORMAT)
+        service.add(record)
+    snapshot = service.snapshot().set_index("Email")
+
+    expected = df.copy()
+    for kind in ["arrival", "departure"]:
+        optimize(expected, kind, max_time_difference=0.5, max_people_per_car=3, method="sweep")
+    expected = expected.set_index("Email").loc[snapshot.index]
+    assert (snapshot["arrival_group"] == expected["arrival_group"]).all()
+    assert (snapshot["departure_group"] == expected["departure_group"]).all()
+
+
+def test_matches():
+    service = MatchingService(max_time_difference=0.5, time_format=TIME_FORMAT)
+    assert service.add(registration(0, "07/10/2023 10:00:00", "07/14/2023 08:00:00"))
+    service.add(registration(1, "07/10/2023 10:20:00", "07/14/2023 09:00:00"))
+    service.add(registration(2, "07/10/2023 10:10:00", airport=" jfk"))
+    service.add(registration(3, "07/10/2023 10:00:00", airport="EWR"))
+    service.add(registration(4, "07/10/2023 11:00:00"))
+
+    matches = service.matches("person0@example.org")
+    assert [match["Name"] for match in matches["arrival"]] == ["Person 2", "Person 1"]
+    assert matches["arrival"][0]["hours_apart"] == round(10 / 60, 4)
+    assert matches["departure"] == []
+    assert len(service.matches("person0@example.org", limit=1)["arrival"]) == 1
+
+    # registering again replaces the earlier times
+    assert not service.add(registration(4, "07/10/2023 10:05:00"))
+    assert len(service) == 5
+    assert "Person 4" in [match["Name"] for match in service.matches("person0@example.org")["arrival"]]
+
+    found = service.search({"date_time_of_airport_arrival": "07/10/2023 09:50:00", "Airport": "EWR"})
+    assert [match["Name"] for match in found["arrival"]] == ["Person 3"]
+    assert found["departure"] == []
+
+    service.remove("person3@example.org")
+    assert service.search({"date_time_of_airport_arrival": "07/10/2023 09:50:00", "Airport": "EWR"})["arrival"] == []
+
+
+def test_people_without_a_time_ride_alone():
+    service = MatchingService(time_format=TIME_FORMAT)
+    service.add(registration(0, "07/10/2023 10:00:00"))
+    service.add(registration(1, "07/10/2023 10:00:00"))
+    snapshot = service.snapshot()
+    assert snapshot["arrival_group"].tolist() == [1, 1]
+    assert sorted(snapshot["departure_group"]) == [1, 2]
+
+
+def test_handle_request(tmp_path):
+    service = MatchingService(time_format=TIME_FORMAT)
+    status, content_type, body = handle_request(service, "POST", "/participants",
+                                                json.dumps(registration(0, "07/10/2023 10:00:00")).encode())
+    assert status == 201 and content_type == "application/json"
+    body = json.loads(handle_request(service, "POST", "/participants",
+                                     json.dumps(registration(1, "07/10/2023 10:15:00")).encode())[2])
+    assert body["matches"]["arrival"][0]["Name"] == "Person 0"
+
+    status, _, body = handle_request(service, "GET", "/matches?Email=person0%40example.org&limit=5")
+    assert status == 200 and json.loads(body)["arrival"][0]["Name"] == "Person 1"
+    status, _, body = handle_request(service, "GET", "/matches?date_time_of_airport_arrival=07/10/2023%2009:40:00&Airport=JFK")
+    assert [match["Name"] for match in json.loads(body)["arrival"]] == ["Person 0"]
+
+    assert handle_request(service, "GET", "/matches?Email=nobody%40example.org")[0] == 404
+    assert handle_request(service, "POST", "/participants", b'{"Name": "No Email"}')[0] == 400
+    assert handle_request(service, "POST", "/participants", b"not json")[0] == 400
+    assert handle_request(service, "GET", "/matches?date_time_of_airport_arrival=soon")[0] == 400
+    assert handle_request(service, "GET", "/unknown")[0] == 404
+
+    status, content_type, body = handle_request(service, "GET", "/snapshot")
+    assert status == 200 and content_type.startswith("text/csv")
+    assert "arrival_group" in body.decode()
+    assert handle_request(service, "POST", "/snapshot")[0] == 409
+
+    output_file = str(tmp_path / "optimized_clustering.csv")
+    status, _, body = handle_request(service, "POST", "/snapshot", output_file=output_file)
+    assert status == 200
+    df = read_reviewed(json.loads(body)["handoff"], output_file)
+    assert df["arrival_group"].tolist() == [1, 1]
+
+    assert handle_request(service, "DELETE", "/participants?Email=person0%40example.org")[0] == 200
+    assert json.loads(handle_request(service, "GET", "/health")[2]) == {"participants": 1}
+
+
+def test_local_times(tmp_path):
+    service = MatchingService(time_format=TIME_FORMAT, tz="America/New_York")
+    service.add(registration(0, "07/10/2023 10:00:00"))
+    service.add_dataframe(pd.DataFrame([registration(1, pd.Timestamp("2023-07-10 16:15", tz="Europe/Berlin"))]))
+    match = service.matches("person0@example.org")["arrival"][0]
+    assert match == {"Name": "Person 1", "time": "2023-07-10T10:15:00", "hours_apart": 0.25}
+
+    # the snapshot and the files for review keep the wall time in New York, like the emails show it
+    output_file = str(tmp_path / "optimized_clustering.csv")
+    status, _, body = handle_request(service, "POST", "/snapshot", output_file=output_file)
+    df = read_reviewed(json.loads(body)["handoff"], output_file)
+    assert sorted(df["date_time_of_airport_arrival"].dt.strftime("%H:%M")) == ["10:00", "10:15"]
+
+
+def test_token():
+    service = MatchingService(time_format=TIME_FORMAT)
+    service.add(registration(0, "07/10/2023 10:00:00"))
+    target = "/matches?Email=person0%40example.org"
+    assert handle_request(service, "GET", target, token="secret")[0] == 401
+    assert handle_request(service, "GET", target, token="secret", headers={"x-spaceshare-token": "wrong"})[0] == 401
+    assert handle_request(service, "DELETE", "/participants?Email=person0%40example.org", token="secret")[0] == 401
+    assert handle_request(service, "GET", target, token="secret", headers={"x-spaceshare-token": "secret"})[0] == 200
+    assert handle_request(service, "GET", "/health", token="secret")[0] == 200
+
+    with pytest.raises(AssertionError):
+        asyncio.run(start_server(service, host="0.0.0.0", port=0))
+
+
+def test_server():
+    async def request(reader, writer, method, target, body=b"", length=None):
+        length = len(body) if length is None else length
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {length}\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) != b"\r\n":
+            name, _, value = line.decode().partition(":")
+            headers[name.lower()] = value.strip()
+        return status, json.loads(await reader.readexactly(int(headers["content-length"])))
+
+    async def main():
+        service = MatchingService(time_format=TIME_FORMAT)
+        server = await start_server(service, port=0)
+        async with server:
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.sockets[0].getsockname()[1])
+            # both requests use the same connection
+            first = await request(reader, writer, "POST", "/participants",
+                                  json.dumps(registration(0, "07/10/2023 10:00:00")).encode())
+            second = await request(reader, writer, "GET", "/health")
+            # a large body is refused before it is read
+            third = await request(reader, writer, "POST", "/participants", length=MAX_BODY_BYTES + 1)
+            closed = await reader.read()
+            writer.close()
+            await writer.wait_closed()
+        return first, second, third, closed
+
+    first, second, third, closed = asyncio.run(main())
+    assert first[0] == 201
+    assert second == (200, {"participants": 1})
+    assert third[0] == 413 and closed == b""
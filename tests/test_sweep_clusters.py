@@ -0,0 +1,201 @@
+import numpy as np
+import pytest
+import pandas as pd
+from SpaceShare import optimize_rideshares as opt
+
+
+def test_sweep_limits():
+    times = np.random.default_rng(1).uniform(0, 48, 2000)
+    clusters = opt.sweep_clusters(times, max_time_difference=0.5, max_people_per_car=3)
+    groups = pd.Series(times).groupby(clusters)
+    assert groups.size().max() <= 3, "Group size exceeded 3"
+    assert (groups.max() - groups.min()).max() <= 0.5, "Time difference exceeded 0.5 hours"
+
+
+def test_sweep_groups():
+    times = np.array([10.0, 0.0, 0.2, 0.4, 0.3, 5.0, 0.6])
+    clusters = opt.sweep_clusters(times, max_time_difference=0.5, max_people_per_car=3)
+    # sorted: 0.0 0.2 0.3 | 0.4 0.6 | 5.0 | 10.0
+    np.testing.assert_array_equal(clusters, [4, 1, 1, 2, 1, 3, 2])
+
+
+def test_sweep_without_times():
+    # people without a time ride alone instead of sharing a car with each other
+    clusters = opt.sweep_clusters([1.0, np.nan, np.nan, np.nan, 1.2])
+    np.testing.assert_array_equal(clusters, [1, 2, 3, 4, 1])
+
+
+def test_optimize_sweep():
+    df = pd.DataFrame({"date_time_of_airport_arrival": pd.to_datetime(
+        ["2023-07-10 10:00", "2023-07-10 10:20", "2023-07-10 13:00"])})
+    df = opt.optimize(df, "arrival", max_time_difference=0.5, method="sweep")
+    assert list(df["arrival_group"]) == [1, 1, 2]
+
+
+def test_reoptimize_keeps_groups():
+    times = pd.to_datetime(["2023-07-10 10:00", "2023-07-10 10:20", "2023-07-10 13:00", "2023-07-10 18:00"])
+    df = opt.optimize(pd.DataFrame({"date_time_of_airport_arrival": times}), "arrival", method="sweep")
+    new_rows = pd.DataFrame({"date_time_of_airport_arrival": pd.to_datetime(
+        ["2023-07-10 13:10", "2023-07-10 10:10", "2023-07-10 10:15", "2023-07-11 09:00"])})
+    combined, changed = opt.reoptimize(df, new_rows, "arrival", max_time_difference=0.5, max_people_per_car=3)
+    groups = combined["arrival_group"].tolist()
+    # existing participants keep their groups
+    assert groups[:4] == [1, 1, 2, 3]
+    # 10:10 fills the car of 10:00/10:20, 13:10 joins 13:00, 10:15 and 09:00 next day need new cars
+    assert groups[4:6] == [2, 1]
+    assert groups[6] != groups[7] and min(groups[6:]) > 3
+    assert list(changed) == [1, 2] + sorted(groups[6:])
+
+
+def test_split_large_clusters_uses_capacity():
+    times = np.arange(9, dtype=float)
+    clusters = opt.split_large_clusters(np.ones(9, dtype=int), times, max_people_per_car=4)
+    # 9 people need 3 cars of at most 4, consecutive in time
+    assert sorted(np.bincount(clusters)[1:]) == [3, 3, 3]
+    assert (np.diff(clusters[np.argsort(times)]) >= 0).all()
+
+
+def test_partition_rides():
+    times = np.array([0.0, 0.1, 0.2, 0.3, 0.4, 2.0])
+    clusters, vehicles, cars = opt.partition_rides(times, 0.5, vehicle_capacities=[2, 4], objective="min_cars")
+    assert cars == 3
+    assert list(clusters) == [1, 1, 1, 1, 2, 3]
+    assert list(vehicles) == [4, 4, 4, 4, 2, 2]
+
+    # compare with a brute force search over all splits of the sorted times
+    times = np.random.default_rng(3).uniform(0, 3, 9)
+    clusters, vehicles, wait = opt.partition_rides(times, 0.7, vehicle_capacities=[3], objective="min_wait")
+    sorted_times = np.sort(times)
+    best = None
+    for mask in range(2**8):
+        bounds = [0] + [i + 1 for i in range(8) if mask >> i & 1] + [9]
+        parts = [sorted_times[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        if all(len(p) <= 3 and p[-1] - p[0] <= 0.7 for p in parts):
+            candidate = (len(parts), sum((p[-1] - p).sum() for p in parts))
+            best = candidate if best is None or candidate < best else best
+    assert clusters.max() == best[0]
+    assert wait == pytest.approx(best[1])
+    assert np.bincount(clusters).max() <= 3
+
+    # people without a time get cars of their own and do not make the waiting time NaN
+    clusters, vehicles, wait = opt.partition_rides([0.0, np.nan, 0.2, 2.0], 0.5, objective="min_wait")
+    assert list(clusters) == [1, 3, 1, 2]
+    assert wait == pytest.approx(0.2)
+
+
+def test_location_codes():
+    df = pd.DataFrame({"Airport": ["JFK", " jfk", "EWR", None, "JFK"],
+                       "Hotel": ["Hilton", "hilton ", "Hilton", "Hilton", "Marriott"]})
+    codes = opt.location_codes(df)
+    assert codes[0] == codes[1]
+    assert len(set(codes)) == 4
+    assert opt.location_codes(df, location_columns=["Hotel"]).tolist() == [0, 0, 0, 0, 1]
+    assert opt.location_codes(df, location_columns=[]) is None
+    assert opt.location_codes(df.drop(columns=["Airport", "Hotel"])) is None
+
+
+@pytest.mark.parametrize("method", ["ward", "sweep"])
+def test_optimize_locations(method):
+    rng = np.random.default_rng(2)
+    n = 600
+    df = pd.DataFrame({"date_time_of_airport_arrival": pd.Timestamp("2023-07-10")
+                       + pd.to_timedelta(rng.uniform(0, 24, n), unit="h"),
+                       "Airport": rng.choice(["JFK", "EWR", "LGA"], n),
+                       "Hotel": rng.choice(["Hilton", "Marriott"], n)})
+    # one person alone at their location
+    df.loc[0, "Hotel"] = "Hostel"
+    df = opt.optimize(df, "arrival", max_time_difference=0.5, max_people_per_car=3, method=method)
+    groups = df.groupby("arrival_group")
+    assert (groups["Airport"].nunique() == 1).all()
+    assert (groups["Hotel"].nunique() == 1).all()
+    assert groups.size().max() <= 3
+    # every location on its own gives the same groups
+    for _, location in df.groupby(["Airport", "Hotel"]):
+        alone = opt.optimize(location.drop(columns="arrival_group"), "arrival", max_time_difference=0.5,
+                             max_people_per_car=3, method=method, location_columns=[])
+        assert pd.crosstab(location["arrival_group"], alone["arrival_group"]).astype(bool).sum(axis=1).eq(1).all()
+
+
+def test_optimize_locations_objective():
+    df = pd.DataFrame({"date_time_of_airport_arrival": pd.to_datetime(
+        ["2023-07-10 10:00", "2023-07-10 10:10", "2023-07-10 10:20", "2023-07-10 10:25"]),
+        "Airport": ["JFK", "EWR", "JFK", "EWR"]})
+    df = opt.optimize(df, "arrival", objective="min_cars")
+    assert df["arrival_group"].tolist() == [2, 1, 2, 1]
+    assert df.attrs["objective"]["arrival"] == 2
+
+
+def test_reoptimize_locations():
+    times = pd.to_datetime(["2023-07-10 10:00", "2023-07-10 10:10"])
+    df = opt.optimize(pd.DataFrame({"date_time_of_airport_arrival": times, "Airport": ["JFK", "EWR"]}),
+                      "arrival", method="sweep")
+    new_rows = pd.DataFrame({"date_time_of_airport_arrival": pd.to_datetime(
+        ["2023-07-10 10:05", "2023-07-10 10:05", "2023-07-10 10:06"]), "Airport": ["EWR", "LGA", "LGA"]})
+    combined, changed = opt.reoptimize(df, new_rows, "arrival")
+    groups = combined["arrival_group"].tolist()
+    # the EWR newcomer joins the EWR group, the LGA newcomers share a new car
+    assert groups[2] == groups[1]
+    assert groups[3] == groups[4] and groups[3] not in groups[:3]
+    assert changed.tolist() == sorted({groups[1], groups[3]})
+
+
+def test_ride_metrics():
+    clusters = np.array([1, 1, 2, 1, 3, 3])
+    times = np.array([0.0, 0.5, 2.0, 0.25, 4.0, 4.5])
+    metrics = opt.ride_metrics(clusters, times, max_people_per_car=3)
+    assert metrics["cars"] == 3
+    assert metrics["singletons"] == 1
+    assert metrics["mean_wait"] == pytest.approx((0.5 + 0 + 0 + 0.25 + 0.5 + 0) / 6)
+    assert metrics["max_wait"] == 0.5
+    assert metrics["utilization"] == pytest.approx(6 / 9)
+
+
+@pytest.mark.parametrize("method", ["ward", "sweep"])
+def test_sweep_parameters(method):
+    rng = np.random.default_rng(3)
+    n = 400
+    df = pd.DataFrame({"date_time_of_airport_arrival": pd.Timestamp("2023-07-10")
+                       + pd.to_timedelta(rng.uniform(0, 24, n), unit="h"),
+                       "Airport": rng.choice(["JFK", "EWR"], n)})
+    before = df.copy()
+    table = opt.sweep_parameters(df, "arrival", max_time_differences=[0.25, 1.0], max_people_per_car=[2, 4],
+                                 method=method)
+    pd.testing.assert_frame_equal(df, before)
+    assert table[["max_wait_time", "max_people_per_car"]].values.tolist() == [[0.25, 2], [0.25, 4], [1.0, 2], [1.0, 4]]
+    times = opt.to_epoch_hours(df["date_time_of_airport_arrival"])
+    # every setting gives the same groups as optimize
+    for row in table.to_dict("records"):
+        clusters = opt.optimize(df.copy(), "arrival", max_time_difference=row["max_wait_time"],
+                                max_people_per_car=row["max_people_per_car"], method=method)["arrival_group"]
+        expected = opt.ride_metrics(clusters.to_numpy(), times, row["max_people_per_car"])
+        assert {key: row[key] for key in expected} == pytest.approx(expected)
+
+
+def test_validate_groups():
+    start = pd.Timestamp("2023-07-10")
+    df = pd.DataFrame({
+        "date_time_of_airport_arrival": start + pd.to_timedelta([0, 10, 20, 30, 0, 60, 0], unit="min"),
+        "date_time_of_hotel_departure": start + pd.to_timedelta([0, 30, 0, 0, 0, 0, 0], unit="min"),
+        "arrival_group": [1, 1, 1, 1, 2, 2, 3],
+        "departure_group": [5, 5, 6, 6, 7, 7, 8],
+    })
+    df.loc[4, "date_time_of_hotel_departure"] = pd.NaT
+    violations = opt.validate_groups(df, max_time_difference=0.5, max_people_per_car=3)
+    assert violations[["kind", "group", "check"]].values.tolist() == [
+        ["arrival", 1, "capacity"], ["arrival", 2, "time_spread"], ["departure", 7, "missing_time"]]
+    assert violations["value"].tolist() == [4, 1.0, 1]
+    assert violations["limit"].tolist() == [3, 0.5, 0]
+    assert violations["size"].tolist() == [4, 2, 2]
+
+    # a group of exactly max_time_difference keeps the limit, the capacity of every group can be given in a column
+    df["arrival_vehicle_capacity"] = [4, 4, 4, 4, 2, 2, 2]
+    violations = opt.validate_groups(df, max_time_difference=1.0, kinds=["arrival"])
+    assert len(violations) == 0
+
+    df = pd.DataFrame({"date_time_of_airport_arrival": start + pd.to_timedelta(np.arange(100) * 7, unit="min")})
+    for method in ["ward", "sweep"]:
+        opt.optimize(df, "arrival", max_time_difference=0.5, max_people_per_car=3, method=method)
+        violations = opt.validate_groups(df, max_time_difference=0.5, max_people_per_car=3, kinds=["arrival"])
+        if method == "sweep":
+            assert len(violations) == 0
+        assert set(violations["check"]) <= {"time_spread"}
@@ -1,4 +1,6 @@
 from SpaceShare.optimize_rideshares import get_time_of_year
+from SpaceShare.reader import to_epoch_hours
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -26,3 +28,20 @@ def test_get_time_of_year():
 
     assert check_time == pytest.approx(func_time, abs = 1.0/3600)
 
+
+def test_to_epoch_hours():
+    """
+    This function tests the vectorized conversion into hours since the epoch, including the turn of the year and timezones.
+    """
+    times = to_epoch_hours(["12/31/2013 23:30:00", "01/01/2014 00:15:00", ""], time_format="%m/%d/%Y %H:%M:%S")
+
+    # no wrap-around at New Year
+    assert times[1] - times[0] == pytest.approx(0.75)
+    assert times[0] == pytest.approx((pd.Timestamp("2013-12-31 23:30") - pd.Timestamp("1970-01-01")).total_seconds()/3600)
+    # empty cells become NaN
+    assert np.isnan(times[2])
+
+    # the same wall time in Chicago is 5 hours later in UTC during summer time
+    utc = to_epoch_hours(pd.to_datetime(["2023-07-13 15:28:00"]))
+    chicago = to_epoch_hours(pd.to_datetime(["2023-07-13 15:28:00"]), tz="America/Chicago")
+    assert chicago[0] - utc[0] == pytest.approx(5.0)
@@ -0,0 +1,25 @@
+import smtplib
+from SpaceShare import write_email
+
+
+def make_handler(**kwargs):
+    return write_email.EmailHandler("user", email_domain="localhost", password="secret", **kwargs)
+
+
+def test_session_is_reused(fake_smtp):
+    eh = make_handler(max_messages_per_session=3)
+    for i in range(7):
+        eh.write_email("a@b.c", subject="test", content=str(i))
+    # one session for the first three, then reopened twice
+    assert len(fake_smtp.instances) == 3
+    assert [len(server.messages) for server in fake_smtp.instances] == [3, 3, 1]
+
+
+def test_reconnect_after_421_and_disconnect(fake_smtp):
+    eh = make_handler()
+    fake_smtp.fail_next = [smtplib.SMTPSenderRefused(421, b"try again", "user")]
+    eh.write_email("a@b.c", subject="test", content="first")
+    fake_smtp.fail_next = [smtplib.SMTPServerDisconnected()]
+    eh.write_email("a@b.c", subject="test", content="second")
+    assert len(fake_smtp.instances) == 3
+    assert sum(len(server.messages) for server in fake_smtp.instances) == 2